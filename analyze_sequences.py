@@ -1,29 +1,226 @@
 # Feature_count_seq.py
+import argparse
 import pandas as pd
+import numpy as np
 from pathlib import Path
 import sys
 from tabulate import tabulate
-from collections import Counter
+from event_stream import DEFAULT_CHUNKSIZE, REQUIRED_COLUMNS
+from event_store import EventStore, is_event_store
+from parallel import map_shards
+from profiling import enable_from_env, staged
+import result_cache
+from seq_read_csv import build_sequences, factorize_keys
+from sequence_table import SequenceTable
+from time_index import WINDOW_COLUMNS, WindowedEvents, in_window, rolling_windows, window_keys
+
+IDS_FORMATS = ('list', 'array', 'count')
+
+def _num_input_rows(result, analyzer, *args, **kwargs):
+    """Rows of the per-id sequence table or frame, for stage profiling."""
+    if analyzer.table is not None:
+        return len(analyzer.table)
+    return None if analyzer.df is None else len(analyzer.df)
+
+def _num_unique_sequences(result, analyzer, *args, **kwargs):
+    """Rows of the unique sequence summary, for stage profiling."""
+    return len(analyzer.unique_sequences)
+
+def factorize_sequences(df, group_by=()):
+    """
+    Number the (group_by..., sequence) combinations of df in order of first appearance.
+    
+    Returns (codes, keys), where keys holds the group_by columns and the
+    sequence of every code.
+    """
+    if not group_by:
+        codes, sequences = pd.factorize(df['sequence'], use_na_sentinel=False)
+        return codes, pd.DataFrame({'sequence': sequences})
+    return factorize_keys(df, list(group_by) + ['sequence'])
+
+def summarize_sequences(df, with_ids=True, group_by=()):
+    """
+    Count the sequences in a frame of id,sequence rows.
+    
+    Returns an unsorted partial summary with one row per sequence: its
+    count, sorted id array (when with_ids), length, and first_row, the
+    index label of the first row that uses it. With group_by, sequences
+    are counted per combination of those columns in the same scan, and
+    the summary is in long format, with the group_by columns first.
+    Summaries of disjoint frames combine with merge_sequence_summaries.
+    """
+    # Index every row by its (segment, sequence), in order of first appearance
+    codes, keys = factorize_sequences(df, group_by)
+    counts = np.bincount(codes, minlength=len(keys))
+    _, first_positions = np.unique(codes, return_index=True)
+    
+    summary = keys.assign(
+        count=counts,
+        length=keys['sequence'].str.count('→') + 1,
+        first_row=df.index.to_numpy()[first_positions],
+    )
+    
+    if with_ids:
+        summary.insert(len(group_by) + 2, 'ids', group_ids(df['id'].to_numpy(), codes, counts))
+    
+    return summary
+
+def summarize_table(table, with_ids=True, group_by=()):
+    """
+    Count the sequences of a SequenceTable without decoding every row.
+    
+    Returns the same partial summary as summarize_sequences, with
+    first_row the id of the first row that uses each sequence. Sequences
+    are counted by their integer codes, and only the distinct ones are
+    decoded to strings.
+    """
+    row_codes, first_rows = table.sequence_codes()
+    if group_by:
+        keys_frame = pd.DataFrame({col: table.columns[col] for col in group_by}).assign(sequence=row_codes)
+        codes, keys = factorize_keys(keys_frame, list(group_by) + ['sequence'])
+        sequence_codes = keys['sequence'].to_numpy()
+    else:
+        codes, keys = row_codes, pd.DataFrame(index=range(len(first_rows)))
+        sequence_codes = np.arange(len(first_rows))
+    counts = np.bincount(codes, minlength=len(keys))
+    _, first_positions = np.unique(codes, return_index=True)
+    
+    summary = keys.assign(
+        sequence=table.decode(first_rows)[sequence_codes],
+        count=counts,
+        length=table.lengths[first_rows][sequence_codes],
+        first_row=table.ids[first_positions],
+    )
+    
+    if with_ids:
+        summary.insert(len(group_by) + 2, 'ids', group_ids(table.ids, codes, counts))
+    
+    return summary
+
+def summarize_event_sequences(events, with_ids=True, group_by=(), window=None):
+    """
+    Build the sequences of an id,event,date frame and summarize them.
+    
+    Rows are labelled by id, so first_row follows the id order of
+    results_id_seq.csv. With window, a (start, end) pair, only ids whose
+    first event falls in it are kept.
+    """
+    if window is not None:
+        first_dates = events.groupby('id')['date'].transform('min').to_numpy()
+        events = events[in_window(first_dates, *window)]
+    return summarize_table(build_sequences(events, group_by), with_ids, group_by)
+
+def group_ids(ids, codes, counts):
+    """Split ids into one sorted array per code, with one sort over all rows."""
+    if len(counts) == 0:
+        return []
+    sorted_ids = ids[np.lexsort((ids, codes))]
+    return np.split(sorted_ids, np.cumsum(counts)[:-1])
+
+def merge_sequence_summaries(summaries, group_by=()):
+    """Combine partial summaries of disjoint frames into one summary."""
+    combined = pd.concat(summaries, ignore_index=True)
+    if len(summaries) == 1:
+        return combined
+    
+    codes, keys = factorize_sequences(combined, group_by)
+    counts = np.bincount(codes, weights=combined['count'], minlength=len(keys)).astype(np.int64)
+    _, first_positions = np.unique(codes, return_index=True)
+    
+    merged = keys.assign(
+        count=counts,
+        length=combined['length'].to_numpy()[first_positions],
+        first_row=combined['first_row'].groupby(codes).min().to_numpy(),
+    )
+    
+    if 'ids' in combined.columns:
+        # Flatten the partial id arrays and regroup them by merged sequence
+        id_arrays = combined['ids'].tolist()
+        flat_ids = np.concatenate(id_arrays) if id_arrays else np.array([], dtype=np.int64)
+        owners = np.repeat(codes, [len(ids) for ids in id_arrays])
+        merged.insert(len(group_by) + 2, 'ids', group_ids(flat_ids, owners, counts))
+    
+    return merged
+
+def rank_sequences(summary, ids_format='list', group_by=()):
+    """
+    Order a summary by frequency and format its ids.
+    
+    Sequences with equal counts keep the order of their first appearance.
+    With group_by, rows are ordered by segment first, and a share column
+    gives each sequence's fraction of its segment's ids.
+    """
+    ranked = summary.sort_values('first_row', kind='stable').reset_index(drop=True)
+    ranked = ranked.sort_values('count', ascending=False, kind='stable').drop(columns='first_row')
+    if group_by:
+        ranked = ranked.sort_values(list(group_by), kind='stable')
+        totals = ranked.groupby(list(group_by), dropna=False, observed=True)['count'].transform('sum')
+        ranked['share'] = (ranked['count'] / totals).round(4)
+    if ids_format == 'list' and 'ids' in ranked.columns:
+        ranked['ids'] = [ids.tolist() for ids in ranked['ids']]
+    return ranked
+
+def started_in_window(df, window):
+    """Keep the rows of a per-id sequence frame whose start_date falls in window, a (start, end) pair."""
+    return df[in_window(pd.to_datetime(df['start_date']).to_numpy(), *window)]
 
 class SequenceAnalyzer:
-    def __init__(self, file_path='results_id_seq.csv'):
+    def __init__(self, file_path='results_id_seq.csv', group_by=(), window=None):
         self.file_path = Path(file_path)
+        self.group_by = list(group_by)
+        self.window = window
         self.df = None
+        self.table = None
         self.unique_sequences = None
         
+    @staged('sequences.read', rows=_num_input_rows)
     def read_sequences(self):
-        """Read and validate the sequence CSV file."""
+        """
+        Read and validate the sequence CSV file.
+        
+        Event stores and SequenceTable .npz files are loaded as a
+        SequenceTable instead, without building any sequence strings.
+        With a (start, end) window set on the analyzer, only ids that
+        started in the window are kept; event stores then read just those
+        ids' events through their time index. Sequences built from an
+        event store and parsed CSV files go through the result cache when
+        one is enabled.
+        """
         try:
             if not self.file_path.exists():
                 print(f"Error: {self.file_path} not found.")
                 sys.exit(1)
                 
-            self.df = pd.read_csv(self.file_path)
+            if is_event_store(self.file_path) or self.file_path.suffix == '.npz':
+                if is_event_store(self.file_path):
+                    self.table = result_cache.cached(
+                        'sequences.table', [self.file_path], {'group_by': self.group_by, 'window': self.window},
+                        self.build_store_sequences)
+                else:
+                    self.table = SequenceTable.load(self.file_path)
+                    if self.window is not None:
+                        self.table = self.table.take(self.table.starting(*self.window))
+                missing = [col for col in self.group_by if col not in self.table.columns]
+                if missing:
+                    print(f"Error: {self.file_path} has no grouping column(s): {', '.join(missing)}")
+                    sys.exit(1)
+                return True
+            
+            self.df = result_cache.cached('sequences.read', [self.file_path], {}, lambda: pd.read_csv(self.file_path))
             
             # Verify required columns exist
             if 'sequence' not in self.df.columns:
                 print("Error: CSV must contain 'sequence' column")
                 sys.exit(1)
+            missing = [col for col in self.group_by if col not in self.df.columns]
+            if missing:
+                print(f"Error: CSV has no grouping column(s): {', '.join(missing)}")
+                sys.exit(1)
+            if self.window is not None:
+                if 'start_date' not in self.df.columns:
+                    print("Error: CSV must contain 'start_date' column to select a date window")
+                    sys.exit(1)
+                self.df = started_in_window(self.df, self.window)
                 
             return True
             
@@ -31,47 +228,160 @@ class SequenceAnalyzer:
             print(f"Error reading CSV file: {e}")
             sys.exit(1)
     
-    def analyze_sequences(self):
-        """Analyze sequences and count unique patterns."""
-        # Count unique sequences
-        sequence_counts = Counter(self.df['sequence'])
+    def build_store_sequences(self):
+        """Build the sequences of an event store, of the ids in the window if one is set."""
+        if self.window is not None:
+            events = WindowedEvents(self.file_path, REQUIRED_COLUMNS + self.group_by).starting(*self.window)
+            return build_sequences(events, self.group_by)
+        # Build the sequences straight from the stored events
+        return build_sequences(EventStore(self.file_path).to_frame(), self.group_by)
+    
+    @staged('sequences.aggregate', rows=_num_input_rows)
+    def analyze_sequences(self, ids_format='list', workers=1):
+        """
+        Analyze sequences and count unique patterns.
         
-        # Create analysis results
-        analysis_results = []
-        for sequence, count in sequence_counts.items():
-            # Get IDs that share this sequence
-            ids_with_sequence = self.df[self.df['sequence'] == sequence]['id'].tolist()
-            
-            analysis_results.append({
-                'sequence': sequence,
-                'count': count,
-                'ids': sorted(ids_with_sequence),
-                'length': len(sequence.split('→')),
-            })
-            
-        # Convert to DataFrame for easy handling
-        self.unique_sequences = pd.DataFrame(analysis_results)
-        self.unique_sequences = self.unique_sequences.sort_values('count', ascending=False)
+        ids_format controls the 'ids' column: 'list' for sorted Python lists,
+        'array' for sorted int arrays, or 'count' to leave the ids out.
+        With workers > 1 the rows are hash-partitioned by id across a
+        process pool and the partial summaries are merged. With group_by
+        set on the analyzer, the result is in long format with one row per
+        (segment, sequence). A SequenceTable in self.table is summarized
+        directly, with workers > 1 split by id across the pool the same way.
+        An event store that read_sequences has not loaded is mapped by each
+        worker instead, which builds the sequences of its own ids.
+        """
+        if ids_format not in IDS_FORMATS:
+            raise ValueError("ids_format must be 'list', 'array' or 'count'")
         
-    def display_results(self):
-        """Display analysis results."""
+        with_ids = ids_format != 'count'
+        if self.table is not None and workers > 1:
+            summaries = map_shards(summarize_table, self.table, workers, with_ids, self.group_by)
+        elif self.table is not None:
+            summaries = [summarize_table(self.table, with_ids, self.group_by)]
+        elif workers > 1 and is_event_store(self.file_path):
+            # Each worker maps the store and builds the sequences of its own ids
+            missing = [col for col in self.group_by if col not in EventStore(self.file_path).columns]
+            if missing:
+                print(f"Error: {self.file_path} has no grouping column(s): {', '.join(missing)}")
+                sys.exit(1)
+            summaries = map_shards(summarize_event_sequences, self.file_path, workers, with_ids, self.group_by,
+                                   self.window)
+        elif workers > 1:
+            summaries = map_shards(summarize_sequences, self.df, workers, with_ids, self.group_by)
+        else:
+            summaries = [summarize_sequences(self.df, with_ids, self.group_by)]
+        self.unique_sequences = rank_sequences(merge_sequence_summaries(summaries, self.group_by), ids_format,
+                                               self.group_by)
+    
+    def analyze_sequences_chunked(self, chunksize=DEFAULT_CHUNKSIZE, ids_format='count'):
+        """Analyze the sequence CSV file in chunks instead of reading it whole (see analyze_sequence_chunks)."""
+        if ids_format not in IDS_FORMATS:
+            raise ValueError("ids_format must be 'list', 'array' or 'count'")
+        if not self.file_path.exists():
+            print(f"Error: {self.file_path} not found.")
+            sys.exit(1)
+        
+        columns = ['id', 'sequence'] + self.group_by + (['start_date'] if self.window is not None else [])
+        try:
+            with pd.read_csv(self.file_path, usecols=columns, chunksize=chunksize) as reader:
+                self.analyze_sequence_chunks(reader, ids_format)
+        except ValueError as e:
+            print(f"Error reading CSV file: {e}")
+            sys.exit(1)
+    
+    @staged('sequences.aggregate', rows=lambda result, analyzer, *args, **kwargs:
+            int(analyzer.unique_sequences['count'].sum()))
+    def analyze_sequence_chunks(self, chunks, ids_format='count'):
+        """
+        Analyze per-id sequence frames one chunk at a time.
+        
+        chunks is any iterable of frames in the results_id_seq.csv layout,
+        such as a chunked reader of that file or iter_sequence_results over
+        an events file. Partial counts are folded after every chunk, so with
+        ids_format='count' memory follows the number of unique sequences
+        rather than the number of rows.
+        """
+        if ids_format not in IDS_FORMATS:
+            raise ValueError("ids_format must be 'list', 'array' or 'count'")
+        summary = None
+        for chunk in chunks:
+            if self.window is not None:
+                chunk = started_in_window(chunk, self.window)
+            partial = summarize_sequences(chunk, ids_format != 'count', self.group_by)
+            summary = partial if summary is None else merge_sequence_summaries([summary, partial], self.group_by)
+        
+        if summary is None:
+            summary = summarize_sequences(pd.DataFrame(columns=['id', 'sequence'] + self.group_by),
+                                          ids_format != 'count', self.group_by)
+        self.unique_sequences = rank_sequences(summary, ids_format, self.group_by)
+        
+    @staged('sequences.aggregate', rows=_num_input_rows)
+    def analyze_windows(self, size, step=None, start=None, end=None, ids_format='count'):
+        """
+        Count the sequences that started in each of a series of rolling windows.
+        
+        Windows of length size begin every step (default size) from start
+        until end, which default to the first and last start date of the
+        loaded sequences. The result is in long format, as with group_by,
+        with window_start and window_end as the leading keys, and share is
+        relative to each window. Every window slices its ids out of the
+        table by start date, without rescanning the other rows.
+        """
+        if ids_format not in IDS_FORMATS:
+            raise ValueError("ids_format must be 'list', 'array' or 'count'")
+        if self.table is None:
+            if 'start_date' not in self.df.columns:
+                raise ValueError("Rolling windows need a 'start_date' column")
+            # Code the sequence strings once, so every window is a slice
+            self.table = SequenceTable.from_results(self.df, self.group_by)
+        
+        table = self.table
+        known = table.start_dates[~np.isnat(table.start_dates)]
+        if (start is None or end is None) and not len(known):
+            raise ValueError("No start dates to place windows on")
+        start = known.min() if start is None else start
+        end = known.max() + np.timedelta64(1, 'D') if end is None else end
+        
+        summaries = []
+        for window_start, window_end in rolling_windows(start, end, size, step):
+            summary = summarize_table(table.take(table.starting(window_start, window_end)),
+                                      ids_format != 'count', self.group_by)
+            summary.insert(0, 'window_start', window_start)
+            summary.insert(1, 'window_end', window_end)
+            summaries.append(summary)
+        self.unique_sequences = rank_sequences(pd.concat(summaries, ignore_index=True), ids_format,
+                                               WINDOW_COLUMNS + self.group_by)
+    
+    @staged('sequences.display', rows=_num_unique_sequences)
+    def display_results(self, summary_only=False):
+        """Display analysis results, without the full sequence table if summary_only."""
         print("\nSequence Analysis Summary:")
         print("-" * 50)
-        print(f"Total number of sequences: {len(self.df)}")
-        print(f"Number of unique sequences: {len(self.unique_sequences)}")
+        print(f"Total number of sequences: {self.unique_sequences['count'].sum()}")
+        keys = window_keys(self.unique_sequences) + self.group_by
+        if keys:
+            segments = self.unique_sequences.groupby(keys, dropna=False, observed=True).ngroups
+            print(f"Number of segments ({', '.join(keys)}): {segments}")
+            print(f"Number of unique (segment, sequence) pairs: {len(self.unique_sequences)}")
+        else:
+            print(f"Number of unique sequences: {len(self.unique_sequences)}")
         
-        print("\nUnique Sequences (sorted by frequency):")
-        print(tabulate(
-            self.unique_sequences,
-            headers={
+        if not summary_only:
+            print("\nUnique Sequences (sorted by frequency):")
+            headers = {
                 'sequence': 'Sequence',
                 'count': 'Frequency',
                 'ids': 'IDs',
-                'length': 'Length'
-            },
-            tablefmt='grid',
-            showindex=False
-        ))
+                'length': 'Length',
+                'share': 'Share'
+            }
+            print(tabulate(
+                self.unique_sequences,
+                headers=[headers.get(col, col) for col in self.unique_sequences.columns],
+                tablefmt='grid',
+                showindex=False
+            ))
         
         # Display sequence length distribution
         length_dist = self.unique_sequences.groupby('length')['count'].sum()
@@ -82,20 +392,30 @@ class SequenceAnalyzer:
             tablefmt='grid'
         ))
     
+    @staged('sequences.save', rows=_num_unique_sequences)
     def save_analysis(self, output_file='sequence_analysis.csv'):
         """Save analysis results to CSV."""
         # Convert IDs list to string for CSV storage
-        self.unique_sequences['ids'] = self.unique_sequences['ids'].apply(lambda x: ', '.join(map(str, x)))
+        if 'ids' in self.unique_sequences.columns:
+            self.unique_sequences['ids'] = self.unique_sequences['ids'].apply(lambda x: ', '.join(map(str, x)))
         self.unique_sequences.to_csv(output_file, index=False)
         print(f"\nAnalysis results saved to '{output_file}'")
 
 def main():
+    parser = argparse.ArgumentParser(description='Count unique sequences and the ids that follow them.')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes to shard the analysis across')
+    parser.add_argument('--group-by', nargs='+', default=[], help='Count sequences per value of these columns')
+    args = parser.parse_args()
+    enable_from_env()
+    result_cache.enable_from_env()
+    
     # Initialize analyzer
-    analyzer = SequenceAnalyzer()
+    analyzer = SequenceAnalyzer(group_by=args.group_by)
     
     # Read and analyze sequences
-    analyzer.read_sequences()
-    analyzer.analyze_sequences()
+    if not (args.workers > 1 and is_event_store(analyzer.file_path)):
+        analyzer.read_sequences()
+    analyzer.analyze_sequences(workers=args.workers)
     
     # Display results
     analyzer.display_results()
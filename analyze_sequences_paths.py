@@ -1,97 +1,252 @@
 # analyze_path_timing.py
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from tabulate import tabulate
 from datetime import datetime
+from event_stream import DEFAULT_CHUNKSIZE, REQUIRED_COLUMNS, iter_event_batches, read_events
+from event_store import is_event_store
+from hop_stats import DEFAULT_PERCENTILES, HOP_KEYS, HopStats, segment_frame, segment_order
+from parallel import map_shards
+from profiling import enable_from_env, stage, staged
+import result_cache
+from time_index import WINDOW_COLUMNS, WindowedEvents, in_window, rolling_windows, window_keys
+
+# Column names of sequence_analysis_paths.csv, mapped back to the stats layout
+SAVED_STATS_COLUMNS = {
+    'Path_Segment': 'path_segment',
+    'Source_Event': 'source',
+    'Target_Event': 'target',
+    'Frequency': 'frequency',
+    'Average_Hours': 'avg_hours',
+    'Minimum_Hours': 'min_hours',
+    'Maximum_Hours': 'max_hours',
+    'Std_Dev_Hours': 'std_hours',
+    'Unique_IDs': 'unique_ids',
+}
+
+def extract_hops(df, group_by=()):
+    """
+    Pair every event with the next event of the same id.
+    
+    Events are sorted once by (id, date) and shifted by one row, so the
+    whole frame is processed in a single vectorized pass. Ids keep the
+    order in which they first appear in df, and events with the same date
+    keep their file order. source and target hold the two events, which
+    path_segment joins with '-' for display. Each column in group_by is
+    carried over from the event that starts the hop.
+    """
+    # Integer codes for ids in order of first appearance
+    id_codes, _ = pd.factorize(df['id'])
+    dates = df['date'].to_numpy()
+    with stage('sort', rows=len(df)):
+        order = np.lexsort((dates, id_codes))
+    
+    ids = df['id'].to_numpy()[order]
+    events = df['event'].to_numpy()[order]
+    dates = dates[order]
+    codes = id_codes[order]
+    
+    # A row starts a hop when the following row belongs to the same id
+    is_hop = codes[:-1] == codes[1:]
+    start = np.flatnonzero(is_hop)
+    end = start + 1
+    
+    start_dates = pd.Series(dates[start])
+    end_dates = pd.Series(dates[end])
+    time_hours = (end_dates - start_dates).dt.total_seconds() / 3600
+    
+    path_segment = pd.Series(events[start] + '-' + events[end])
+    
+    hops = pd.DataFrame({
+        'path_segment': path_segment,
+        'source': events[start],
+        'target': events[end],
+        'time_hours': time_hours,
+        'id': ids[start],
+        'start_date': start_dates,
+        'end_date': end_dates
+    })
+    for col in group_by:
+        hops[col] = df[col].to_numpy()[order][start]
+    return hops
+
+def window_hops(hops, window=None):
+    """Keep the hops that start in window, a (start, end) pair; None keeps them all."""
+    if window is None:
+        return hops
+    return hops[in_window(hops['start_date'].to_numpy(), *window)]
+
+def _num_hops(stats, *args, **kwargs):
+    """Transitions summarized into a stats frame, for stage profiling."""
+    return int(stats['frequency'].sum())
+
+def shard_hop_stats(df, group_by=(), window=None):
+    """Extract the hops of one id shard, within window if given, into a HopStats."""
+    return HopStats(group_by=group_by).update(window_hops(extract_hops(df, group_by), window))
 
 class PathTimingAnalyzer:
-    def __init__(self, file_path='patterned_events.csv'):
+    def __init__(self, file_path='patterned_events.csv', group_by=(), window=None):
         self.file_path = Path(file_path)
+        self.group_by = list(group_by)
+        self.window = window
         self.df = None
+        self.source_file = None
         self.path_timings = None
         
     def read_data(self):
-        """Read and prepare the event data."""
+        """
+        Read and prepare the event data.
+        
+        With a (start, end) window set on the analyzer, only the events of
+        hops that start in the window are kept, and event stores read just
+        those through their time index.
+        """
         try:
             if not self.file_path.exists():
                 print(f"Error: {self.file_path} not found.")
                 return False
                 
-            # Read CSV and convert date to datetime
-            self.df = pd.read_csv(self.file_path)
-            self.df['date'] = pd.to_datetime(self.df['date'])
+            if self.window is not None:
+                self.df = WindowedEvents(self.file_path, REQUIRED_COLUMNS + self.group_by).hops(*self.window)
+            else:
+                # Read CSV and convert date to datetime
+                self.df = read_events(self.file_path, REQUIRED_COLUMNS + self.group_by)
+            self.source_file = self.file_path
             return True
             
         except Exception as e:
             print(f"Error reading CSV file: {e}")
             return False
     
+    @staged('paths.hops', rows=lambda result, analyzer: len(analyzer.df))
     def calculate_path_timings(self):
-        """Calculate timing statistics for each unique path segment."""
-        path_timings = []
+        """
+        Calculate timing statistics for each unique path segment, within the window if set.
         
-        # Process each ID separately
-        for id_val in self.df['id'].unique():
-            id_events = self.df[self.df['id'] == id_val].sort_values('date')
-            
-            # Look at each consecutive pair of events
-            for i in range(len(id_events) - 1):
-                current = id_events.iloc[i]
-                next_event = id_events.iloc[i + 1]
-                
-                # Calculate time difference in hours
-                time_diff = (next_event['date'] - current['date']).total_seconds() / 3600
-                
-                path_segment = f"{current['event']}-{next_event['event']}"
-                
-                path_timings.append({
-                    'path_segment': path_segment,
-                    'time_hours': time_diff,
-                    'id': id_val,
-                    'start_date': current['date'],
-                    'end_date': next_event['date']
-                })
+        When the events came from source_file, the timings go through the
+        result cache when one is enabled.
+        """
+        self.path_timings = result_cache.cached(
+            'paths.hops', [self.source_file], {'group_by': self.group_by, 'window': self.window},
+            lambda: window_hops(extract_hops(self.df, self.group_by), self.window))
+    
+    def iter_path_timings(self, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Yield path timings for the whole file one batch of ids at a time.
+        
+        The file must be sorted by id. Only about chunksize events are held
+        in memory, and ids that straddle a chunk boundary are completed
+        before their hops are emitted.
+        """
+        for batch in iter_event_batches(self.file_path, chunksize, REQUIRED_COLUMNS + self.group_by):
+            yield window_hops(extract_hops(batch, self.group_by), self.window)
+    
+    @staged('paths.aggregate', rows=_num_hops)
+    def accumulate_path_segments(self, chunksize=DEFAULT_CHUNKSIZE, percentiles=DEFAULT_PERCENTILES):
+        """
+        Create summary statistics, with duration percentiles, by streaming the file.
         
-        # Convert to DataFrame
-        self.path_timings = pd.DataFrame(path_timings)
+        Hop timings are folded batch by batch into running per-segment
+        moments and quantile sketches, so path_timings is never
+        materialized and memory follows the number of segments. The file
+        must be sorted by id.
+        """
+        hop_stats = HopStats(group_by=self.group_by)
+        for path_timings in self.iter_path_timings(chunksize):
+            hop_stats.update(path_timings)
+        return hop_stats.summary(percentiles)
     
+    @staged('paths.aggregate', rows=_num_hops)
+    def analyze_path_segments_parallel(self, workers, percentiles=()):
+        """
+        Create summary statistics with the events sharded by id across workers.
+        
+        Each worker extracts the hops of its own ids into a HopStats, and
+        the partial statistics are merged. Event stores are mapped by the
+        workers directly; otherwise, or with a window, the events loaded
+        by read_data are partitioned and shipped to them.
+        """
+        source = self.file_path if is_event_store(self.file_path) and self.window is None else self.df
+        partials = map_shards(shard_hop_stats, source, workers, self.group_by, self.window)
+        hop_stats = partials[0]
+        for partial in partials[1:]:
+            hop_stats.merge(partial)
+        return hop_stats.summary(percentiles)
+    
+    @staged('paths.aggregate', rows=_num_hops)
+    def analyze_windows(self, size, step=None, start=None, end=None, percentiles=()):
+        """
+        Create summary statistics for the hops that start in each of a series of rolling windows.
+        
+        Windows of length size begin every step (default size) from start
+        until end, which default to the span of the events. Each window
+        reads only the events of its hops, through a time index over the
+        loaded events or the input file, and all windows
+        fold into one HopStats keyed by window_start, window_end and
+        group_by, so the result is a single long table.
+        """
+        events = WindowedEvents(self.file_path if self.df is None else self.df, REQUIRED_COLUMNS + self.group_by)
+        first, last = events.index.date_range()
+        if (start is None or end is None) and first is None:
+            raise ValueError("No events to place windows on")
+        start = first if start is None else start
+        end = last + np.timedelta64(1, 'ns') if end is None else end
+        
+        hop_stats = HopStats(group_by=WINDOW_COLUMNS + self.group_by)
+        for window_start, window_end in rolling_windows(start, end, size, step):
+            hops = window_hops(extract_hops(events.hops(window_start, window_end), self.group_by),
+                               (window_start, window_end))
+            hop_stats.update(hops.assign(window_start=window_start, window_end=window_end))
+        return hop_stats.summary(percentiles)
+    
+    @staged('paths.aggregate', rows=_num_hops)
     def analyze_path_segments(self):
-        """Create summary statistics for each unique path segment."""
-        # Group by path segment and calculate statistics
-        stats = self.path_timings.groupby('path_segment').agg({
+        """
+        Create summary statistics for each unique path segment.
+        
+        With group_by set on the analyzer, statistics are computed per
+        (group_by..., source, target) in the same groupby, in long format.
+        """
+        # Group by segment keys and the two events of each hop and calculate statistics
+        keys = self.group_by + list(HOP_KEYS)
+        stats = self.path_timings.groupby(keys, dropna=False, observed=True).agg({
             'time_hours': ['count', 'mean', 'min', 'max', 'std'],
             'id': 'nunique'
         }).round(2)
         
         # Flatten column names
         stats.columns = ['frequency', 'avg_hours', 'min_hours', 'max_hours', 'std_hours', 'unique_ids']
-        stats = stats.reset_index()
+        stats = segment_frame(stats.reset_index(), self.group_by)
         
-        # Sort by path_segment alphabetically
-        stats = stats.sort_values('path_segment', ascending=True)
+        # Sort by segment keys and path_segment alphabetically
+        stats = stats.sort_values(segment_order(self.group_by), ascending=True).reset_index(drop=True)
         
         return stats
     
-    def save_results(self, stats):
+    @staged('paths.save', rows=lambda result, analyzer, stats, *args, **kwargs: len(stats))
+    def save_results(self, stats, output_file='sequence_analysis_paths.csv', show_sample=True):
         """Save analysis results to CSV file."""
-        output_file = 'sequence_analysis_paths.csv'
+        
+        # The event columns came after the others were fixed, so they go last
+        # and readers that index the file by position keep working
+        events = [col for col in HOP_KEYS if col in stats.columns]
+        stats = stats[[col for col in stats.columns if col not in events] + events]
         
         # Rename columns for clarity
-        stats_output = stats.copy()
+        stats_output = stats.rename(columns={col: saved for saved, col in SAVED_STATS_COLUMNS.items()})
+        # Percentile columns such as p90_hours become P90_Hours
         stats_output.columns = [
-            'Path_Segment',
-            'Frequency',
-            'Average_Hours',
-            'Minimum_Hours',
-            'Maximum_Hours',
-            'Std_Dev_Hours',
-            'Unique_IDs'
+            f"P{col[1:-len('_hours')]}_Hours" if col.startswith('p') and col.endswith('_hours') else col
+            for col in stats_output.columns
         ]
         
         # Save to CSV
         stats_output.to_csv(output_file, index=False)
         print(f"\nAnalysis results saved to: {output_file}")
+        if not show_sample:
+            return
         
         # Display sample of results
         print("\nFirst few rows of the output file:")
@@ -103,26 +258,60 @@ class PathTimingAnalyzer:
             floatfmt=".2f"
         ))
     
+    @staged('paths.display', rows=lambda result, analyzer, stats: len(stats))
     def display_summary(self, stats):
         """Display summary statistics."""
         print("\nPath Segment Analysis Summary")
         print("=" * 50)
-        print(f"Total unique path segments: {len(stats)}")
+        keys = window_keys(stats) + self.group_by
+        if keys:
+            print(f"Number of segments ({', '.join(keys)}): "
+                  f"{stats.groupby(keys, dropna=False, observed=True).ngroups}")
+            print(f"Total unique path segments: {stats['path_segment'].nunique()}")
+        else:
+            print(f"Total unique path segments: {len(stats)}")
         print(f"Total transitions analyzed: {stats['frequency'].sum()}")
         print(f"Average transition time: {stats['avg_hours'].mean():.2f} hours")
         print(f"Overall time range: {stats['min_hours'].min():.2f} to {stats['max_hours'].max():.2f} hours")
 
+def read_path_stats(file_path):
+    """Read a saved path analysis CSV back into the layout of analyze_path_segments."""
+    stats = pd.read_csv(file_path)
+    stats.columns = [
+        SAVED_STATS_COLUMNS.get(col, f"p{col[1:-len('_Hours')]}_hours" if col.startswith('P') and col.endswith('_Hours') else col)
+        for col in stats.columns
+    ]
+    if 'path_segment' not in stats.columns:
+        raise ValueError("Path statistics must contain a 'Path_Segment' column")
+    if 'source' not in stats.columns or 'target' not in stats.columns:
+        # Files saved before the event columns only have the joined name,
+        # which is ambiguous for event names containing '-'
+        events = stats['path_segment'].astype(str).str.split('-', n=1)
+        stats['source'], stats['target'] = events.str[0], events.str[1]
+    return stats
+
 def main():
+    parser = argparse.ArgumentParser(description='Summarize the duration of every path segment.')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes to shard the analysis across')
+    parser.add_argument('--group-by', nargs='+', default=[], help='Summarize hops per value of these columns')
+    args = parser.parse_args()
+    enable_from_env()
+    result_cache.enable_from_env()
+    
     # Initialize analyzer
-    analyzer = PathTimingAnalyzer()
+    analyzer = PathTimingAnalyzer(group_by=args.group_by)
     
     # Read and process data
     if analyzer.read_data():
-        # Calculate path timings
-        analyzer.calculate_path_timings()
-        
-        # Analyze path segments
-        stats = analyzer.analyze_path_segments()
+        if args.workers > 1:
+            # Hops are calculated and summarized inside the workers
+            stats = analyzer.analyze_path_segments_parallel(args.workers)
+        else:
+            # Calculate path timings
+            analyzer.calculate_path_timings()
+            
+            # Analyze path segments
+            stats = analyzer.analyze_path_segments()
         
         # Display summary
         analyzer.display_summary(stats)
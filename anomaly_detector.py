@@ -0,0 +1,260 @@
+import argparse
+import csv
+import heapq
+import sys
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from analyze_sequences_paths import extract_hops, read_path_stats
+from event_store import is_event_store
+from event_stream import read_events
+from hop_stats import HopStats
+
+DETECTION_METHODS = ('zscore', 'quantile')
+ALERT_COLUMNS = ['alert', 'id', 'path_segment', 'date', 'hours', 'expected_hours', 'limit_hours', 'score']
+DEFAULT_MAX_OPEN_IDS = 1_000_000
+
+def hop_limits(stats, method='zscore', threshold=3.0, quantile=99):
+    """
+    Return the lower and upper duration limit of every path segment.
+
+    With 'zscore' the limits are avg_hours -/+ threshold * std_hours. With
+    'quantile' the upper limit is the pNN_hours column for quantile and
+    there is no lower limit. Segments without a usable spread get no
+    limits (NaN), so they are never flagged as slow or fast.
+    """
+    if method not in DETECTION_METHODS:
+        raise ValueError(f"method must be one of: {', '.join(DETECTION_METHODS)}")
+    if method == 'quantile':
+        column = f"p{quantile:g}_hours"
+        if column not in stats.columns:
+            raise ValueError(f"Path statistics have no {column} column; rerun the path analysis with percentiles")
+        return pd.Series(np.nan, index=stats.index), stats[column].astype('float64')
+    spread = threshold * stats['std_hours'].where(stats['std_hours'] > 0)
+    return (stats['avg_hours'] - spread).round(2), (stats['avg_hours'] + spread).round(2)
+
+class AnomalyDetector:
+    """
+    Scores an event stream, one event at a time, against per-hop durations.
+
+    Every transition of an id is checked against the duration limits of
+    its path segment (see hop_limits). Hops that were never seen in the
+    baseline are flagged as unseen, and events older than their id's
+    previous event are flagged as out of order. An id is flagged as
+    stalled once its wait since the last event exceeds the slowest usual
+    hop out of that event.
+
+    All baseline values are precomputed into dicts, so each event costs a
+    few dict lookups. The state per open id is its last event and date,
+    kept in an OrderedDict in order of activity. Past max_open_ids, the
+    least recently active id is dropped. Ids that reach a final event are
+    closed right away. Deadlines for the stall check sit in a heap.
+    Entries that a newer event has superseded are skipped as they
+    surface, and the heap is compacted whenever it grows to twice the
+    number of open ids.
+    """
+
+    def __init__(self, stats, method='zscore', threshold=3.0, quantile=99, max_open_ids=DEFAULT_MAX_OPEN_IDS,
+                 final_events=()):
+        lower, upper = hop_limits(stats, method, threshold, quantile)
+        # Hops are looked up by their (source, target) events
+        hops = list(zip(stats['source'].tolist(), stats['target'].tolist()))
+        self.expected_hours = dict(zip(hops, stats['avg_hours'].tolist()))
+        self.std_hours = dict(zip(hops, stats['std_hours'].fillna(0).tolist()))
+        self.lower_hours = dict(zip(hops, lower.tolist()))
+        self.upper_hours = dict(zip(hops, upper.tolist()))
+
+        # The wait allowed after an event is the slowest usual hop out of it
+        # (or the slowest seen, for segments without limits); events never
+        # followed by another one in the baseline are not watched
+        limits = upper.fillna(stats['max_hours']) if 'max_hours' in stats.columns else upper
+        self.wait_hours = limits.groupby(stats['source']).max().dropna().to_dict()
+
+        self.max_open_ids = max_open_ids
+        self.final_events = set(final_events)
+        self.open_ids = OrderedDict()
+        self.deadlines = []
+        self.evicted = 0
+        self.counts = Counter()
+
+    @classmethod
+    def from_events(cls, df, method='zscore', threshold=3.0, quantile=99, **kwargs):
+        """Build the baseline from the hops of an id,event,date frame."""
+        stats = HopStats().update(extract_hops(df)).summary((quantile,))
+        return cls(stats, method, threshold, quantile, **kwargs)
+
+    def _alert(self, alert, id_val, segment, date, hours=None, expected=None, limit=None, score=None):
+        """Count an alert and return it as a record in ALERT_COLUMNS order."""
+        self.counts[alert] += 1
+        return {'alert': alert, 'id': id_val, 'path_segment': segment, 'date': date, 'hours': hours,
+                'expected_hours': expected, 'limit_hours': limit, 'score': score}
+
+    def process(self, id_val, event, date):
+        """
+        Fold one event into the state and return the alerts it raises.
+
+        The returned list is empty for a normal event. The stall check is
+        separate (see check_stalled), so it can run on a clock of its own.
+        """
+        self.counts['events'] += 1
+        alerts = []
+        previous = self.open_ids.get(id_val)
+        if previous is not None:
+            last_event, last_date = previous
+            if date < last_date:
+                return [self._alert('out_of_order', id_val, f"{last_event}-{event}", date)]
+            alerts = self._score_hop(id_val, (last_event, event), date, (date - last_date).total_seconds() / 3600)
+            self.open_ids.move_to_end(id_val)
+
+        if event in self.final_events:
+            self.open_ids.pop(id_val, None)
+            return alerts
+
+        self.open_ids[id_val] = (event, date)
+        wait = self.wait_hours.get(event)
+        if wait is not None:
+            heapq.heappush(self.deadlines, (date + timedelta(hours=wait), id_val, date))
+        if len(self.open_ids) > self.max_open_ids:
+            self.open_ids.popitem(last=False)
+            self.evicted += 1
+        if len(self.deadlines) > 2 * len(self.open_ids) + 1024:
+            self._compact_deadlines()
+        return alerts
+
+    def _compact_deadlines(self):
+        """Drop the deadlines of closed, evicted or since-updated ids from the heap."""
+        self.deadlines = [entry for entry in self.deadlines
+                          if self.open_ids.get(entry[1], (None, None))[1] == entry[2]]
+        heapq.heapify(self.deadlines)
+
+    def _score_hop(self, id_val, hop, date, hours):
+        """Check one (source, target) hop duration against its segment's limits."""
+        segment = f"{hop[0]}-{hop[1]}"
+        if hop not in self.expected_hours:
+            return [self._alert('unseen_hop', id_val, segment, date, round(hours, 2))]
+        expected = self.expected_hours[hop]
+        std = self.std_hours[hop]
+        score = round((hours - expected) / std, 2) if std > 0 else None
+        if hours > self.upper_hours[hop]:
+            return [self._alert('slow_hop', id_val, segment, date, round(hours, 2), expected,
+                                self.upper_hours[hop], score)]
+        if hours < self.lower_hours[hop]:
+            return [self._alert('fast_hop', id_val, segment, date, round(hours, 2), expected,
+                                self.lower_hours[hop], score)]
+        return []
+
+    def check_stalled(self, now):
+        """Return alerts for open ids whose wait since their last event has run past its limit at now."""
+        alerts = []
+        while self.deadlines and self.deadlines[0][0] < now:
+            _, id_val, last_date = heapq.heappop(self.deadlines)
+            current = self.open_ids.get(id_val)
+            # A later event or an eviction supersedes the deadline
+            if current is None or current[1] != last_date:
+                continue
+            event = current[0]
+            alerts.append(self._alert('stalled', id_val, event, now, round((now - last_date).total_seconds() / 3600, 2),
+                                      None, self.wait_hours[event]))
+        return alerts
+
+    def run(self, events):
+        """
+        Yield the alerts of an iterable of (id, event, date) tuples in arrival order.
+
+        The stream itself is the clock: before each event, ids are checked
+        for stalls at the latest date seen so far.
+        """
+        clock = None
+        for id_val, event, date in events:
+            clock = date if clock is None or date > clock else clock
+            yield from self.check_stalled(clock)
+            yield from self.process(id_val, event, date)
+
+def iter_csv_events(f):
+    """
+    Yield (id, event, date) tuples from an id,event,date CSV stream, one line at a time.
+
+    Ids are kept as the strings they are written as, since a stream
+    cannot be checked for non-numeric ids such as 'c1' up front.
+    """
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    try:
+        id_col, event_col, date_col = header.index('id'), header.index('event'), header.index('date')
+    except ValueError:
+        raise ValueError("CSV must contain columns: id, event, date")
+    for row in reader:
+        if row:
+            yield row[id_col].strip(), row[event_col], datetime.fromisoformat(row[date_col])
+
+def load_detector(baseline, method, threshold, quantile, **kwargs):
+    """Build a detector from a path analysis CSV, or learn it from an events file or event store."""
+    if not is_event_store(baseline) and 'Path_Segment' in pd.read_csv(baseline, nrows=0).columns:
+        return AnomalyDetector(read_path_stats(baseline), method, threshold, quantile, **kwargs)
+    return AnomalyDetector.from_events(read_events(baseline), method, threshold, quantile, **kwargs)
+
+def write_alerts(detector, input_path='-', output_path='anomalies.csv'):
+    """
+    Score an id,event,date CSV stream and write its alerts as CSV, as they are raised.
+
+    '-' reads stdin or writes stdout, so the detector can sit at the end
+    of a pipe and run for as long as the stream does.
+    """
+    source = sys.stdin if input_path == '-' else open(input_path, newline='')
+    output = sys.stdout if output_path == '-' else open(output_path, 'w', newline='')
+    try:
+        writer = csv.DictWriter(output, fieldnames=ALERT_COLUMNS)
+        writer.writeheader()
+        for alert in detector.run(iter_csv_events(source)):
+            writer.writerow(alert)
+            output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+def display_alert_summary(detector):
+    """Print how many events were scored and how many alerts of each kind were raised."""
+    print("\nAnomaly Detection Summary")
+    print("=" * 50)
+    print(f"Events scored: {detector.counts['events']}")
+    print(f"Open ids: {len(detector.open_ids)} (evicted: {detector.evicted})")
+    rows = [[alert, detector.counts[alert]] for alert in ('slow_hop', 'fast_hop', 'unseen_hop', 'stalled', 'out_of_order')]
+    print(tabulate(rows, headers=['Alert', 'Count'], tablefmt='grid'))
+
+def main():
+    parser = argparse.ArgumentParser(description='Flag anomalous hops and stalled ids in an event stream.')
+    parser.add_argument('--baseline', default='sequence_analysis_paths.csv',
+                        help='Path analysis CSV, or an events file or event store to learn hop durations from')
+    parser.add_argument('--input', default='-', help="Id,event,date stream to score ('-' for stdin)")
+    parser.add_argument('--method', choices=DETECTION_METHODS, default='zscore')
+    parser.add_argument('--threshold', type=float, default=3.0, help='Z-score beyond which a hop is flagged')
+    parser.add_argument('--quantile', type=float, default=99, help='Percentile used as the upper limit with --method quantile')
+    parser.add_argument('--max-open-ids', type=int, default=DEFAULT_MAX_OPEN_IDS, help='Open ids kept in memory')
+    parser.add_argument('--final-event', action='append', default=[], help='Event after which an id is closed')
+    parser.add_argument('--output', default='anomalies.csv', help="Alert CSV ('-' for stdout)")
+    args = parser.parse_args()
+
+    for path in (args.baseline, args.input):
+        if path != '-' and not Path(path).exists():
+            print(f"Error: {path} not found.")
+            sys.exit(1)
+    try:
+        detector = load_detector(args.baseline, args.method, args.threshold, args.quantile,
+                                 max_open_ids=args.max_open_ids, final_events=args.final_event)
+        write_alerts(detector, args.input, args.output)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.output != '-':
+        print(f"Alerts saved to '{args.output}'")
+        display_alert_summary(detector)
+
+if __name__ == "__main__":
+    main()
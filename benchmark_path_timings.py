@@ -0,0 +1,82 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from analyze_sequences_paths import extract_hops
+
+def legacy_path_timings(df):
+    """Per-id loop used by PathTimingAnalyzer before hops were vectorized."""
+    path_timings = []
+    for id_val in df['id'].unique():
+        id_events = df[df['id'] == id_val].sort_values('date')
+        for i in range(len(id_events) - 1):
+            current = id_events.iloc[i]
+            next_event = id_events.iloc[i + 1]
+            time_diff = (next_event['date'] - current['date']).total_seconds() / 3600
+            path_timings.append({
+                'path_segment': f"{current['event']}-{next_event['event']}",
+                'time_hours': time_diff,
+                'id': id_val,
+                'start_date': current['date'],
+                'end_date': next_event['date']
+            })
+    return pd.DataFrame(path_timings)
+
+def make_events(num_rows, events_per_id=8, seed=0):
+    """Build a shuffled synthetic event frame with the given number of rows."""
+    rng = np.random.default_rng(seed)
+    num_ids = max(num_rows // events_per_id, 1)
+    ids = rng.integers(1, num_ids + 1, size=num_rows)
+    events = np.array(list('ABCDEFG'), dtype=object)[rng.integers(0, 7, size=num_rows)]
+    # Distinct timestamps, so the legacy unstable per-id sort has no ties to reorder
+    dates = np.datetime64('2024-01-01T00:00:00') + rng.permutation(num_rows).astype('timedelta64[s]')
+    return pd.DataFrame({'id': ids, 'event': events, 'date': pd.to_datetime(dates)})
+
+def time_call(func, df):
+    """Return (seconds, result) for one call of func(df)."""
+    start = time.perf_counter()
+    result = func(df)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hop extraction for PathTimingAnalyzer.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000, 50_000_000],
+                        help='Row counts to benchmark the vectorized engine at')
+    parser.add_argument('--legacy-rows', type=int, default=20_000,
+                        help='Row count used to time the legacy per-id loop')
+    args = parser.parse_args()
+
+    # The legacy loop is quadratic, so it is timed once on a small frame
+    # and its cost per row is used to estimate the larger sizes.
+    legacy_df = make_events(args.legacy_rows)
+    legacy_seconds, legacy_result = time_call(legacy_path_timings, legacy_df)
+    _, vectorized_result = time_call(extract_hops, legacy_df)
+    # The legacy loop has no source and target columns
+    pd.testing.assert_frame_equal(legacy_result, vectorized_result[legacy_result.columns], check_dtype=False)
+    print(f"Vectorized output matches legacy output on {args.legacy_rows:,} rows")
+
+    rows = []
+    for size in args.sizes:
+        df = make_events(size)
+        seconds, result = time_call(extract_hops, df)
+        # Legacy cost grows with ids x rows
+        estimated_legacy = legacy_seconds * (size / args.legacy_rows) ** 2
+        rows.append([
+            f"{size:,}",
+            f"{len(result):,}",
+            f"{seconds:.2f}",
+            f"{size / seconds:,.0f}",
+            f"{estimated_legacy:,.0f}",
+            f"{estimated_legacy / seconds:,.0f}x"
+        ])
+        del df, result
+
+    print(tabulate(
+        rows,
+        headers=['Rows', 'Hops', 'Seconds', 'Rows/sec', 'Legacy est. seconds', 'Speedup'],
+        tablefmt='grid'
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from analyze_sequences import SequenceAnalyzer
+from analyze_sequences_paths import PathTimingAnalyzer
+from generator_random_events import PatternedPathGenerator
+from seq_read_csv import create_sequence_results
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+FULL_SCALES = [10_000, 100_000, 1_000_000, 10_000_000, 50_000_000]
+RESULT_COLUMNS = ['events', 'num_patterns', 'max_hops', 'stage', 'rows', 'seconds', 'rows_per_sec', 'peak_mb']
+
+def events_per_id(num_patterns, max_hops, min_hops=3, seed=0):
+    """Estimate the mean events per id of a generator configuration from a small sample."""
+    sample = PatternedPathGenerator(num_ids=2_000, num_patterns=num_patterns, min_hops=min_hops,
+                                    max_hops=max_hops, seed=seed)
+    return sum(len(block) for block in sample.iter_blocks()) / 2_000
+
+def measure(func, track_memory=True, repeat=1):
+    """
+    Run func() and return (result, seconds, peak_mb).
+
+    seconds is the best of repeat untraced calls, since tracemalloc slows
+    allocation-heavy code several times over. With track_memory, func
+    runs once more under tracemalloc, and peak_mb is the largest traced
+    allocation total of that run, numpy and pandas buffers included;
+    otherwise it is None.
+    """
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = min(seconds, time.perf_counter() - start)
+    peak_mb = None
+    if track_memory:
+        tracemalloc.start()
+        func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+def run_config(num_events, num_patterns, max_hops, seed=0, track_memory=True, repeat=1):
+    """Generate one dataset and time every pipeline stage on it. Returns one record per stage."""
+    num_ids = max(int(num_events / events_per_id(num_patterns, max_hops, seed=seed)), 1)
+    generator = PatternedPathGenerator(num_ids=num_ids, num_patterns=num_patterns, max_hops=max_hops, seed=seed)
+
+    records = []
+    def record(stage, func, rows):
+        result, seconds, peak_mb = measure(func, track_memory, repeat)
+        count = rows(result)
+        records.append({
+            'events': num_events,
+            'num_patterns': num_patterns,
+            'max_hops': max_hops,
+            'stage': stage,
+            'rows': count,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(count / seconds) if seconds > 0 else None,
+            'peak_mb': None if peak_mb is None else round(peak_mb, 1),
+        })
+        return result
+
+    events = record('generate', lambda: pd.concat(generator.iter_blocks(parse_dates=True), ignore_index=True), len)
+    results_df = record('create_sequence_results', lambda: create_sequence_results(events), lambda _: len(events))
+
+    sequences = SequenceAnalyzer()
+    sequences.df = results_df
+    record('analyze_sequences', lambda: sequences.analyze_sequences(), lambda _: len(results_df))
+    del results_df, sequences
+
+    paths = PathTimingAnalyzer()
+    paths.df = events
+    record('calculate_path_timings', paths.calculate_path_timings, lambda _: len(events))
+    record('analyze_path_segments', paths.analyze_path_segments, lambda _: len(paths.path_timings))
+    return records
+
+def environment():
+    """Describe the machine and code version a run was made on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+def save_results(records, env, output_prefix):
+    """Write the records as <prefix>.json (with the environment) and <prefix>.csv."""
+    with open(f"{output_prefix}.json", 'w') as f:
+        json.dump({'environment': env, 'results': records}, f, indent=2)
+    pd.DataFrame(records, columns=RESULT_COLUMNS).to_csv(f"{output_prefix}.csv", index=False)
+    print(f"\nBenchmark results saved to '{output_prefix}.json' and '{output_prefix}.csv'")
+
+def compare_results(records, baseline_file, threshold=0.2):
+    """
+    Compare seconds per (configuration, stage) with a previous JSON run.
+
+    Returns the comparison frame; ratio > 1 + threshold is marked as a
+    regression.
+    """
+    with open(baseline_file) as f:
+        baseline = pd.DataFrame(json.load(f)['results'])
+    keys = ['events', 'num_patterns', 'max_hops', 'stage']
+    merged = pd.DataFrame(records).merge(baseline[keys + ['seconds']], on=keys, suffixes=('', '_baseline'))
+    merged['ratio'] = (merged['seconds'] / merged['seconds_baseline']).round(2)
+    merged['status'] = np.where(merged['ratio'] > 1 + threshold, 'REGRESSION',
+                                np.where(merged['ratio'] < 1 - threshold, 'faster', 'ok'))
+    return merged[keys + ['seconds_baseline', 'seconds', 'ratio', 'status']]
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and profile the analysis pipeline at several scales.')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='Approximate events per dataset')
+    parser.add_argument('--full', action='store_true', help=f"Use scales {FULL_SCALES}")
+    parser.add_argument('--num-patterns', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--max-hops', type=int, nargs='+', default=[10, 20])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage; the best is kept')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip the second, tracemalloc-traced run of each stage')
+    parser.add_argument('--output', default='benchmark_results', help='Prefix of the .json and .csv result files')
+    parser.add_argument('--compare', help='Previous .json results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Slowdown ratio flagged as a regression')
+    args = parser.parse_args()
+
+    scales = FULL_SCALES if args.full else args.scales
+    records = []
+    for num_events in scales:
+        for num_patterns in args.num_patterns:
+            for max_hops in args.max_hops:
+                print(f"Running {num_events:,} events, {num_patterns} patterns, max {max_hops} hops...")
+                records.extend(run_config(num_events, num_patterns, max_hops, args.seed,
+                                          not args.no_memory, args.repeat))
+
+    print(tabulate(pd.DataFrame(records, columns=RESULT_COLUMNS), headers='keys', tablefmt='grid', showindex=False))
+    save_results(records, environment(), args.output)
+
+    if args.compare:
+        comparison = compare_results(records, args.compare, args.threshold)
+        print(f"\nComparison with {args.compare}:")
+        print(tabulate(comparison, headers='keys', tablefmt='grid', showindex=False))
+        if (comparison['status'] == 'REGRESSION').any():
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from event_stream import DEFAULT_CHUNKSIZE, read_event_chunks
+
+META_FILE = 'meta.json'
+# Derived from the columns, so rewriting a store removes it
+INDEX_DIR = 'time_index'
+
+def is_event_store(path):
+    """Return True if path is an event store directory."""
+    return Path(path, META_FILE).is_file()
+
+class EventStore:
+    """
+    Columnar, memory-mapped store for id,event,date files.
+
+    A store is a directory holding one raw array file per column plus
+    meta.json. ids are int32, dates are int64 nanoseconds since the epoch
+    and string columns such as event are stored as integer codes into a
+    vocabulary kept in meta.json (uint8 for event). Opening a store maps
+    the arrays read-only, so nothing is parsed or copied up front.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_FILE) as f:
+            self.meta = json.load(f)
+        self.num_rows = self.meta['num_rows']
+        self.columns = list(self.meta['columns'])
+
+    def __len__(self):
+        return self.num_rows
+
+    def array(self, column):
+        """Return the raw memory-mapped array of a column."""
+        info = self.meta['columns'][column]
+        if self.num_rows == 0:
+            return np.empty(0, dtype=info['dtype'])
+        return np.memmap(self.path / f"{column}.bin", dtype=info['dtype'], mode='r', shape=(self.num_rows,))
+
+    def vocabulary(self, column):
+        """Return the vocabulary of a coded column, indexed by code."""
+        return np.array(self.meta['columns'][column]['vocabulary'], dtype=object)
+
+    def column(self, column, start=0, stop=None):
+        """
+        Return rows [start, stop) of a column as pandas-ready values.
+
+        Numeric columns and dates are views of the mapped file; coded
+        columns become a pandas Categorical over their vocabulary.
+        """
+        return self._values(column, self.array(column)[start:stop])
+
+    def _values(self, column, values):
+        """Convert raw stored values of a column to pandas-ready values."""
+        info = self.meta['columns'][column]
+        if info['kind'] == 'date':
+            return values.view('datetime64[ns]')
+        if info['kind'] == 'code':
+            return pd.Categorical.from_codes(values, categories=self.vocabulary(column))
+        return values
+
+    def to_frame(self, columns=None, start=0, stop=None):
+        """Return rows [start, stop) as a DataFrame without copying the mapped arrays."""
+        columns = self.columns if columns is None else columns
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        return pd.DataFrame(
+            {col: self.column(col, start, stop) for col in columns},
+            index=pd.RangeIndex(start, max(stop, start)),
+            copy=False
+        )
+
+    def take(self, rows, columns=None):
+        """
+        Return the given row positions as a DataFrame labelled by position.
+
+        Only the pages holding those rows are read from the mapped files,
+        so passing rows in ascending order keeps the reads sequential.
+        """
+        columns = self.columns if columns is None else columns
+        rows = np.asarray(rows, dtype=np.int64)
+        return pd.DataFrame(
+            {col: self._values(col, self.array(col)[rows]) for col in columns},
+            index=pd.Index(rows),
+            copy=False
+        )
+
+    def iter_chunks(self, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+        """Yield the store as DataFrames of at most chunksize rows."""
+        for start in range(0, self.num_rows, chunksize):
+            yield self.to_frame(columns, start, start + chunksize)
+
+class EventStoreWriter:
+    """Append DataFrame chunks to a new event store directory."""
+
+    def __init__(self, path, event_dtype='uint8'):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        shutil.rmtree(self.path / INDEX_DIR, ignore_errors=True)
+        self.event_dtype = np.dtype(event_dtype)
+        self.columns = None
+        self.vocabularies = {}
+        self.files = {}
+        self.num_rows = 0
+        self.sorted_by_id = True
+        self.last_id = None
+
+    def _column_info(self, chunk):
+        """Decide how each column of the first chunk is stored."""
+        columns = {}
+        for col in chunk.columns:
+            if col == 'id':
+                columns[col] = {'kind': 'value', 'dtype': 'int32'}
+            elif col == 'date':
+                columns[col] = {'kind': 'date', 'dtype': 'int64'}
+            elif col == 'event':
+                columns[col] = {'kind': 'code', 'dtype': self.event_dtype.name}
+            elif pd.api.types.is_numeric_dtype(chunk[col]):
+                columns[col] = {'kind': 'value', 'dtype': chunk[col].dtype.name}
+            else:
+                columns[col] = {'kind': 'code', 'dtype': 'uint32'}
+        return columns
+
+    def _encode(self, col, values):
+        """Map a string column to integer codes, growing its vocabulary."""
+        vocabulary = self.vocabularies.setdefault(col, {})
+        for value in pd.unique(values):
+            if value not in vocabulary:
+                vocabulary[value] = len(vocabulary)
+        dtype = np.dtype(self.columns[col]['dtype'])
+        if len(vocabulary) - 1 > np.iinfo(dtype).max:
+            raise ValueError(f"Column '{col}' has more than {np.iinfo(dtype).max + 1} distinct values")
+        return values.map(vocabulary).to_numpy(dtype=dtype)
+
+    def append(self, chunk):
+        """Append a chunk with id, event and date columns (dates already parsed)."""
+        if self.columns is None:
+            self.columns = self._column_info(chunk)
+            self.files = {col: open(self.path / f"{col}.bin", 'wb') for col in self.columns}
+
+        ids = chunk['id'].to_numpy()
+        if len(ids) and (ids.min() < np.iinfo(np.int32).min or ids.max() > np.iinfo(np.int32).max):
+            raise ValueError("ids must fit in int32")
+
+        # Track whether the whole file is sorted by id, across chunk boundaries
+        if len(ids):
+            if self.last_id is not None and ids[0] < self.last_id:
+                self.sorted_by_id = False
+            if (ids[1:] < ids[:-1]).any():
+                self.sorted_by_id = False
+            self.last_id = ids[-1]
+
+        for col, info in self.columns.items():
+            if info['kind'] == 'code':
+                values = self._encode(col, chunk[col])
+            elif info['kind'] == 'date':
+                values = chunk[col].to_numpy().astype('datetime64[ns]').view(np.int64)
+            else:
+                values = chunk[col].to_numpy().astype(info['dtype'])
+            self.files[col].write(np.ascontiguousarray(values).tobytes())
+
+        self.num_rows += len(chunk)
+
+    def close(self):
+        """Flush the column files and write meta.json."""
+        for f in self.files.values():
+            f.close()
+        columns = self.columns or {}
+        for col, vocabulary in self.vocabularies.items():
+            columns[col]['vocabulary'] = list(vocabulary)
+        for info in columns.values():
+            if info['kind'] == 'code':
+                info.setdefault('vocabulary', [])
+        with open(self.path / META_FILE, 'w') as f:
+            json.dump({
+                'num_rows': self.num_rows,
+                'sorted_by_id': self.sorted_by_id,
+                'columns': columns
+            }, f, indent=2)
+        return EventStore(self.path)
+
+def convert_csv(csv_path, store_path, chunksize=DEFAULT_CHUNKSIZE):
+    """One-time conversion of an id,event,date CSV file into an event store."""
+    writer = EventStoreWriter(store_path)
+    for chunk in read_event_chunks(csv_path, chunksize):
+        writer.append(chunk)
+    return writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert an id,event,date CSV file into an event store.')
+    parser.add_argument('csv_file', help='Input CSV file, e.g. patterned_events.csv')
+    parser.add_argument('store_dir', help='Output event store directory')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='Rows read from the CSV file at a time')
+    args = parser.parse_args()
+
+    if not Path(args.csv_file).exists():
+        print(f"Error: {args.csv_file} not found.")
+        sys.exit(1)
+
+    store = convert_csv(args.csv_file, args.store_dir, args.chunksize)
+    print(f"\nConverted {len(store)} events to event store '{args.store_dir}'")
+    print(f"Columns: {', '.join(store.columns)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import pandas as pd
+from profiling import staged
+from result_cache import cached
+
+REQUIRED_COLUMNS = ['id', 'event', 'date']
+DEFAULT_CHUNKSIZE = 1_000_000
+
+def check_columns(df, required_columns=REQUIRED_COLUMNS):
+    """Raise ValueError if df is missing any of the required columns."""
+    missing = [col for col in required_columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"CSV must contain columns: {', '.join(required_columns)}")
+
+@staged('events.read')
+def read_events(file_path, required_columns=REQUIRED_COLUMNS):
+    """
+    Read a whole id,event,date file and parse its dates.
+    
+    file_path may also be an event store directory, which is opened
+    memory-mapped instead of parsed. Parsed files go through the result
+    cache when one is enabled.
+    """
+    # Imported here because event_store builds on this module
+    from event_store import EventStore, is_event_store
+    if is_event_store(file_path):
+        df = EventStore(file_path).to_frame()
+        check_columns(df, required_columns)
+        return df
+    
+    def parse():
+        df = pd.read_csv(file_path)
+        check_columns(df, required_columns)
+        df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+        return df
+    
+    # A cached frame may have been parsed for a caller needing other columns
+    df = cached('events.read', [file_path], {}, parse)
+    check_columns(df, required_columns)
+    return df
+
+def read_event_chunks(file_path, chunksize=DEFAULT_CHUNKSIZE, required_columns=REQUIRED_COLUMNS):
+    """
+    Yield an id,event,date file in chunks of at most chunksize rows.
+
+    Dates are parsed per chunk and the row index keeps counting across
+    chunks, so every row keeps its position in the file. Event store
+    directories are sliced instead of parsed.
+    """
+    from event_store import EventStore, is_event_store
+    if is_event_store(file_path):
+        for chunk in EventStore(file_path).iter_chunks(chunksize):
+            check_columns(chunk, required_columns)
+            yield chunk
+        return
+    
+    with pd.read_csv(file_path, chunksize=chunksize) as reader:
+        for chunk in reader:
+            check_columns(chunk, required_columns)
+            chunk['date'] = pd.to_datetime(chunk['date'], format='ISO8601')
+            yield chunk
+
+def iter_id_batches(chunks, id_column='id'):
+    """
+    Regroup chunks of an id-sorted file so that no id spans two batches.
+
+    The rows of the last id in each chunk are held back and prepended to
+    the next chunk, so every yielded batch holds complete ids only. Memory
+    is bounded by the chunk size plus the largest single id. Raises
+    ValueError if the ids are not sorted.
+    """
+    carry = None
+    for chunk in chunks:
+        if carry is not None and len(carry):
+            chunk = pd.concat([carry, chunk])
+
+        ids = chunk[id_column]
+        if not ids.is_monotonic_increasing:
+            raise ValueError(f"Streaming requires the input to be sorted by '{id_column}'")
+
+        # Everything before the last id's first row is complete
+        split = ids.searchsorted(ids.iloc[-1], side='left')
+        carry = chunk.iloc[split:]
+        if split:
+            yield chunk.iloc[:split]
+
+    if carry is not None and len(carry):
+        yield carry
+
+def iter_event_batches(file_path, chunksize=DEFAULT_CHUNKSIZE, required_columns=REQUIRED_COLUMNS):
+    """Yield batches of complete ids from an id-sorted event file."""
+    return iter_id_batches(read_event_chunks(file_path, chunksize, required_columns))
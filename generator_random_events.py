@@ -3,10 +3,15 @@ import numpy as np
 from datetime import datetime, timedelta
 import random
 import string
+from event_store import EventStoreWriter
+from seq_read_csv import format_days
+
+# Ids that share one random generator in generate_block
+RANDOM_RUN_IDS = 4096
 
 class PatternedPathGenerator:
     def __init__(self, num_ids, num_patterns=10, min_hops=3, max_hops=10, 
-                 start_date=datetime(2024, 1, 1)):
+                 start_date=datetime(2024, 1, 1), seed=None):
         self.num_ids = num_ids
         self.num_patterns = num_patterns
         self.min_hops = min_hops
@@ -14,13 +19,18 @@ class PatternedPathGenerator:
         self.start_date = start_date
         self.events = list(string.ascii_uppercase[:7])  # A through G
         self.data = []
+        # Separate generators so a seed reproduces both patterns and paths
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+        # Root of the per-run generators of generate_block
+        self.seed_sequence = np.random.SeedSequence(seed)
         self.patterns = self.generate_base_patterns()
 
     def generate_base_patterns(self):
         """Generate base patterns that will be used as templates."""
         patterns = []
         for _ in range(self.num_patterns):
-            pattern_length = random.randint(self.min_hops, self.max_hops)
+            pattern_length = self.random.randint(self.min_hops, self.max_hops)
             
             # Create a more structured pattern
             pattern = []
@@ -34,15 +44,15 @@ class PatternedPathGenerator:
                     prev = pattern[-1]
                     next_choices = [c for c in self.events if c > prev]
                     if next_choices:
-                        pattern.append(random.choice(next_choices))
+                        pattern.append(self.random.choice(next_choices))
                     else:
-                        pattern.append(random.choice(self.events))
+                        pattern.append(self.random.choice(self.events))
                 else:
                     # Odd positions are more random
-                    pattern.append(random.choice(self.events))
+                    pattern.append(self.random.choice(self.events))
             
             # Last event tends to be towards end of alphabet
-            pattern.append(random.choice(self.events[3:]))  # Choose from D-G
+            pattern.append(self.random.choice(self.events[3:]))  # Choose from D-G
             
             patterns.append(pattern)
         return patterns
@@ -52,14 +62,14 @@ class PatternedPathGenerator:
         pattern = base_pattern.copy()
         
         # Possibly add an extra event (20% chance)
-        if random.random() < 0.2 and len(pattern) < self.max_hops:
-            insert_pos = random.randint(1, len(pattern)-1)
-            pattern.insert(insert_pos, random.choice(self.events))
+        if self.random.random() < 0.2 and len(pattern) < self.max_hops:
+            insert_pos = self.random.randint(1, len(pattern)-1)
+            pattern.insert(insert_pos, self.random.choice(self.events))
             
         # Possibly modify one event (30% chance)
-        if random.random() < 0.3 and len(pattern) > 3:
-            modify_pos = random.randint(1, len(pattern)-2)  # Don't modify first or last
-            pattern[modify_pos] = random.choice(self.events)
+        if self.random.random() < 0.3 and len(pattern) > 3:
+            modify_pos = self.random.randint(1, len(pattern)-2)  # Don't modify first or last
+            pattern[modify_pos] = self.random.choice(self.events)
         
         return pattern
 
@@ -70,19 +80,19 @@ class PatternedPathGenerator:
             end=start_date + timedelta(days=180),
             periods=num_dates
         )
-        return sorted(pd.to_datetime(np.random.choice(date_range, num_dates, replace=False)))
+        return sorted(pd.to_datetime(self.rng.choice(date_range, num_dates, replace=False)))
 
     def generate_path(self, id_num):
         """Generate a path based on one of the patterns."""
         # Select a base pattern
-        base_pattern = random.choice(self.patterns)
+        base_pattern = self.random.choice(self.patterns)
         
         # Apply variations to create unique but similar path
         events = self.apply_pattern_variation(base_pattern)
         
         # Random start date for this ID
         id_start_date = self.start_date + timedelta(
-            days=random.randint(0, 30)
+            days=self.random.randint(0, 30)
         )
         
         # Generate dates
@@ -107,11 +117,143 @@ class PatternedPathGenerator:
         df = df.sort_values(['id', 'date'])
         return df
 
+    def block_draws(self, first_id, num_ids):
+        """
+        Draw the random choices of ids first_id .. first_id + num_ids - 1.
+        
+        Ids are split into runs of RANDOM_RUN_IDS counted from id 1, and
+        each run draws from its own generator, seeded by the seed and the
+        run's first id. An id's path therefore does not depend on the block
+        size it is generated with. Returns a dict of per-id arrays.
+        """
+        num_patterns, num_events = len(self.patterns), len(self.events)
+        first_run = (first_id - 1) // RANDOM_RUN_IDS
+        last_run = max((first_id + num_ids - 2) // RANDOM_RUN_IDS, first_run)
+        runs = []
+        for run in range(first_run, last_run + 1):
+            seed = np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(1 + run * RANDOM_RUN_IDS,))
+            rng = np.random.default_rng(seed)
+            runs.append({
+                'choice': rng.integers(num_patterns, size=RANDOM_RUN_IDS),
+                'insert': rng.random(RANDOM_RUN_IDS),
+                'insert_pos': rng.random(RANDOM_RUN_IDS),
+                'inserted_event': rng.integers(num_events, size=RANDOM_RUN_IDS),
+                'modify': rng.random(RANDOM_RUN_IDS),
+                'modify_pos': rng.random(RANDOM_RUN_IDS),
+                'modified_event': rng.integers(num_events, size=RANDOM_RUN_IDS),
+                'start_day': rng.integers(0, 31, size=RANDOM_RUN_IDS),
+            })
+        offset = first_id - 1 - first_run * RANDOM_RUN_IDS
+        return {key: np.concatenate([draws[key] for draws in runs])[offset:offset + num_ids] for key in runs[0]}
+
+    def generate_block(self, first_id, num_ids, parse_dates=False):
+        """
+        Generate the paths of ids first_id .. first_id + num_ids - 1 at once.
+        
+        Follows the same rules as generate_path, but pattern choices,
+        variations, start offsets and dates are drawn as NumPy arrays for
+        the whole block (see block_draws). Returns a frame sorted by id and
+        date, with dates as 'YYYY-MM-DD' strings, or as datetime64 days if
+        parse_dates.
+        """
+        draws = self.block_draws(first_id, num_ids)
+        num_events = len(self.events)
+        width = self.max_hops + 1
+        
+        # Base patterns as a padded code matrix
+        lengths = np.array([len(pattern) for pattern in self.patterns])
+        codes = np.zeros((len(self.patterns), max(lengths.max(), width)), dtype=np.int64)
+        for i, pattern in enumerate(self.patterns):
+            codes[i, :len(pattern)] = [self.events.index(event) for event in pattern]
+        
+        choice = draws['choice']
+        length = lengths[choice]
+        col = np.arange(width)
+        
+        # Possibly add an extra event (20% chance) at position 1 .. length-1
+        insert = (draws['insert'] < 0.2) & (length < self.max_hops)
+        insert_pos = np.where(insert, 1 + (draws['insert_pos'] * (length - 1)).astype(np.int64), width)
+        source = np.where(col < insert_pos[:, None], col, col - 1)
+        paths = codes[choice[:, None], np.clip(source, 0, codes.shape[1] - 1)]
+        paths = np.where(col == insert_pos[:, None], draws['inserted_event'][:, None], paths)
+        length = length + insert
+        
+        # Possibly modify one event (30% chance), never the first or last
+        modify = (draws['modify'] < 0.3) & (length > 3)
+        modify_pos = 1 + (draws['modify_pos'] * np.maximum(length - 2, 0)).astype(np.int64)
+        rows = np.flatnonzero(modify)
+        paths[rows, modify_pos[rows]] = draws['modified_event'][rows]
+        
+        # Evenly spaced dates over 180 days from a random start within 30 days,
+        # matching the spacing pd.date_range gives generate_random_dates
+        valid = col < length[:, None]
+        step = np.timedelta64(180, 'D') / np.timedelta64(1, 'ns') / np.maximum(length - 1, 1)
+        offsets = (col * step[:, None]).astype(np.int64)
+        offsets = np.where(col == (length - 1)[:, None], np.int64(180 * 86_400 * 10**9), offsets)
+        offsets = np.where(length[:, None] == 1, 0, offsets)
+        start = np.datetime64(self.start_date, 'ns') + draws['start_day'].astype('timedelta64[D]')
+        dates = start[:, None] + offsets.astype('timedelta64[ns]')
+        
+        days = dates[valid].astype('datetime64[D]')
+        pattern_names = np.array([''.join(pattern) for pattern in self.patterns], dtype=object)
+        return pd.DataFrame({
+            'id': np.repeat(np.arange(first_id, first_id + num_ids), length),
+            'event': np.array(self.events, dtype=object)[paths[valid]],
+            'date': days.astype('datetime64[ns]') if parse_dates else format_days(days),
+            'pattern_base': pattern_names[np.repeat(choice, length)]
+        })
+    
+    def iter_blocks(self, block_size=100_000, parse_dates=False):
+        """Yield the paths of all ids as frames of block_size ids."""
+        for first_id in range(1, self.num_ids + 1, block_size):
+            yield self.generate_block(first_id, min(block_size, self.num_ids + 1 - first_id), parse_dates)
+    
+    def generate_all_paths_vectorized(self, block_size=100_000):
+        """Generate paths for all IDs block by block and return one frame."""
+        return pd.concat(self.iter_blocks(block_size), ignore_index=True)
+    
+    def write_csv(self, filename='random_events.csv', block_size=100_000):
+        """
+        Generate paths for all IDs and stream them to a CSV file block by block.
+        
+        Only one block is held in memory at a time. Returns the number of
+        events written.
+        """
+        num_events = 0
+        with open(filename, 'w') as f:
+            for i, block in enumerate(self.iter_blocks(block_size)):
+                if i == 0:
+                    f.write(','.join(block.columns) + '\n')
+                # Every field is a plain id, letter, date or pattern, so no quoting is needed
+                rows = zip(block['id'].to_numpy().astype(str).tolist(), block['event'].tolist(),
+                           block['date'].tolist(), block['pattern_base'].tolist())
+                f.write(''.join([f"{id_val},{event},{date},{pattern}\n" for id_val, event, date, pattern in rows]))
+                num_events += len(block)
+        return num_events
+    
+    def write_event_store(self, store_path, block_size=100_000):
+        """
+        Generate paths for all IDs straight into an event store directory.
+        
+        Skips CSV text entirely, which makes it the fastest way to build
+        large synthetic logs. Returns the opened EventStore.
+        """
+        writer = EventStoreWriter(store_path)
+        for block in self.iter_blocks(block_size, parse_dates=True):
+            writer.append(block)
+        return writer.close()
+    
     def save_to_csv(self, df, filename='random_events.csv'):
         """Save the generated paths to a CSV file."""
         df.to_csv(filename, index=False)
         print(f"\nData saved to {filename}")
 
+    def display_patterns(self):
+        """Display the base patterns paths are generated from."""
+        print("\nBase Patterns Used:")
+        for i, pattern in enumerate(self.patterns, 1):
+            print(f"Pattern {i}: {' → '.join(pattern)}")
+    
     def display_summary(self, df):
         """Display summary of generated paths."""
         print("\nGenerated Paths Summary:")
@@ -120,9 +262,7 @@ class PatternedPathGenerator:
         print(f"Number of unique IDs: {df['id'].nunique()}")
         print(f"Date range: {df['date'].min()} to {df['date'].max()}")
         
-        print("\nBase Patterns Used:")
-        for i, pattern in enumerate(self.patterns, 1):
-            print(f"Pattern {i}: {' → '.join(pattern)}")
+        self.display_patterns()
         
         print("\nSample of Generated Sequences:")
         sample_ids = sorted(df['id'].unique())[:5]  # Show first 5 IDs
@@ -0,0 +1,253 @@
+import numpy as np
+import pandas as pd
+
+MOMENT_COLUMNS = ['count', 'mean', 'm2', 'min', 'max', 'unique_ids']
+DEFAULT_PERCENTILES = (50, 90, 99)
+# Hops are keyed by their two events; path_segment only labels them
+HOP_KEYS = ('source', 'target')
+
+class QuantileSketch:
+    """
+    Mergeable KLL quantile sketch over float values.
+
+    Values are kept in a stack of compactors; level h holds items that
+    each stand for 2**h original values. When a level outgrows its
+    capacity, and the sketch as a whole is over budget, that level is
+    sorted and every other item (from a random offset) is promoted. Memory
+    stays around O(k) and the rank error around 1/k. Updates take whole
+    arrays at a time.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        """Capacity of a level; lower levels get geometrically less room."""
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        """Compact the lowest full level until the sketch fits its total capacity."""
+        while sum(len(items) for items in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            level = next(h for h, items in enumerate(self.levels) if len(items) > self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind at this level
+            keep = items[:len(items) % 2]
+            pairs = items[len(keep):]
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], pairs[self.rng.integers(2)::2]])
+
+    def update(self, values):
+        """Add an array of values."""
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self.count += len(values)
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        """Return the estimated values at quantiles qs (each in [0, 1])."""
+        qs = np.atleast_1d(np.asarray(qs, dtype='float64'))
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        return values[np.minimum(positions, len(values) - 1)]
+
+def sketch_key(key):
+    """
+    Return the sketch dict key of a group.
+
+    Missing group values become None. NaN is not equal to itself, so
+    a NaN key only matches the very same object, which a merge or a
+    pickle round trip replaces.
+    """
+    if isinstance(key, tuple):
+        return tuple(None if pd.isna(value) else value for value in key)
+    return key
+
+def empty_moments(keys=HOP_KEYS):
+    """Return an empty moments frame indexed by keys (by default the source and target event)."""
+    moments = pd.DataFrame({col: pd.Series(dtype='float64') for col in MOMENT_COLUMNS})
+    if len(keys) > 1:
+        moments.index = pd.MultiIndex.from_arrays([[]] * len(keys), names=list(keys))
+    else:
+        moments.index.name = keys[0]
+    return moments
+
+def batch_moments(path_timings, count_ids=True, keys=HOP_KEYS):
+    """
+    Compute count, mean, M2, min and max of time_hours per hop.
+
+    keys are the grouping columns, ending with source and target; extra leading
+    keys (such as office) are aggregated in the same groupby. unique_ids is
+    the number of distinct ids per group in this batch, or 0 when
+    count_ids is False.
+    """
+    if len(path_timings) == 0:
+        return empty_moments(keys)
+    grouped = path_timings.groupby(list(keys), dropna=False, observed=True)['time_hours']
+    moments = pd.DataFrame({
+        'count': grouped.count().astype('float64'),
+        'mean': grouped.mean(),
+        'm2': grouped.var(ddof=0) * grouped.count(),
+        'min': grouped.min(),
+        'max': grouped.max(),
+    })
+    if count_ids:
+        moments['unique_ids'] = path_timings.groupby(list(keys), dropna=False, observed=True)['id'].nunique().astype('float64')
+    else:
+        moments['unique_ids'] = 0.0
+    return moments
+
+def merge_moments(left, right):
+    """
+    Combine two moments frames with Chan's parallel update.
+
+    unique_ids are added, which is exact when the two sides cover
+    disjoint sets of ids.
+    """
+    if len(left) == 0:
+        return right.copy()
+    if len(right) == 0:
+        return left.copy()
+
+    # Group values of different types (say str and float) cannot be sorted
+    segments = left.index.union(right.index, sort=False)
+    a = left.reindex(segments)
+    b = right.reindex(segments)
+    n_a = a['count'].fillna(0)
+    n_b = b['count'].fillna(0)
+    n = n_a + n_b
+    delta = b['mean'].fillna(0) - a['mean'].fillna(0)
+
+    merged = pd.DataFrame({
+        'count': n,
+        'mean': np.where(n_b == 0, a['mean'], np.where(n_a == 0, b['mean'], a['mean'] + delta * n_b / n)),
+        'm2': a['m2'].fillna(0) + b['m2'].fillna(0) + delta ** 2 * n_a * n_b / n,
+        'min': np.fmin(a['min'], b['min']),
+        'max': np.fmax(a['max'], b['max']),
+        'unique_ids': a['unique_ids'].fillna(0) + b['unique_ids'].fillna(0),
+    }, index=segments)
+    merged.index.names = left.index.names
+    return merged
+
+def segment_frame(frame, group_by=()):
+    """Return a copy of a frame led by group_by, source and target columns, with the path_segment label before source."""
+    labels = frame['source'].astype(str) + '-' + frame['target'].astype(str)
+    frame = frame.copy()
+    frame.insert(len(group_by), 'path_segment', labels.to_numpy(dtype=object))
+    return frame
+
+def segment_order(group_by=()):
+    """Return the columns that sort summary rows: group_by, then the label, then the events behind it."""
+    return list(group_by) + ['path_segment'] + list(HOP_KEYS)
+
+class HopStats:
+    """
+    Running duration statistics per path segment.
+
+    Segments are keyed by their (source, target) events, so event names
+    containing '-' never run together, and path_segment is only the
+    label of the summary rows. Keeps count, mean, M2 (sum of squared
+    deviations), min and max of time_hours for every segment, plus a
+    QuantileSketch per segment for
+    percentiles. Memory grows with the number of segments rather than
+    the number of transitions. Batches and other HopStats objects (for
+    example from separate shards) fold in with Chan's parallel update
+    and sketch merges. With group_by, statistics are kept per
+    (group_by..., source, target) instead, from the same batches.
+    """
+
+    def __init__(self, sketch_k=200, group_by=()):
+        self.group_by = list(group_by)
+        self.keys = self.group_by + list(HOP_KEYS)
+        self.moments = empty_moments(self.keys)
+        self.sketch_k = sketch_k
+        self.sketches = {}
+
+    def _sketch(self, segment):
+        """Return the sketch of a segment, creating it on first use."""
+        key = sketch_key(segment)
+        if key not in self.sketches:
+            self.sketches[key] = QuantileSketch(self.sketch_k)
+        return self.sketches[key]
+
+    def update(self, path_timings, count_ids=True):
+        """
+        Fold a path_timings frame into the running statistics.
+
+        unique_ids are added per batch, which is exact when batches cover
+        disjoint ids. Pass count_ids=False and use add_unique_ids otherwise.
+        """
+        self.moments = merge_moments(self.moments, batch_moments(path_timings, count_ids, self.keys))
+        for segment, hours in path_timings.groupby(self.keys, dropna=False, observed=True)['time_hours']:
+            self._sketch(segment).update(hours.to_numpy())
+        return self
+
+    def add_unique_ids(self, counts):
+        """Add distinct-id counts per segment, e.g. ids newly seen on a segment."""
+        counts = counts.reindex(self.moments.index, fill_value=0)
+        self.moments['unique_ids'] += counts.astype('float64')
+        return self
+
+    def merge(self, other):
+        """Fold another HopStats into this one."""
+        self.moments = merge_moments(self.moments, other.moments)
+        for segment, sketch in other.sketches.items():
+            self._sketch(segment).merge(sketch)
+        return self
+
+    def percentiles(self, percentiles=DEFAULT_PERCENTILES):
+        """Return estimated duration percentiles per segment, one column per percentile."""
+        qs = np.asarray(percentiles, dtype='float64') / 100
+        # Read-only: a segment without a sketch has no percentiles, and none is created
+        empty = QuantileSketch(self.sketch_k)
+        rows = [self.sketches.get(sketch_key(segment), empty).quantiles(qs) for segment in self.moments.index]
+        return pd.DataFrame(
+            np.array(rows).reshape(len(rows), len(qs)),
+            index=self.moments.index,
+            columns=[f"p{p:g}_hours" for p in percentiles]
+        )
+
+    def summary(self, percentiles=()):
+        """
+        Return per-segment statistics in the layout of
+        PathTimingAnalyzer.analyze_path_segments, with one extra
+        pNN_hours column per requested percentile.
+        """
+        m = self.moments
+        std = np.sqrt(m['m2'] / (m['count'] - 1)).where(m['count'] > 1)
+        stats = segment_frame(m.index.to_frame(index=False), self.group_by).assign(**{
+            'frequency': m['count'].astype('int64').to_numpy(),
+            'avg_hours': m['mean'].to_numpy(),
+            'min_hours': m['min'].to_numpy(),
+            'max_hours': m['max'].to_numpy(),
+            'std_hours': std.to_numpy(),
+            'unique_ids': m['unique_ids'].astype('int64').to_numpy(),
+        })
+        if len(percentiles):
+            stats = pd.concat([stats, self.percentiles(percentiles).reset_index(drop=True)], axis=1)
+        stats = stats.round({col: 2 for col in stats.columns if col not in self.keys})
+        return stats.sort_values(segment_order(self.group_by), ascending=True).reset_index(drop=True)
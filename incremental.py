@@ -0,0 +1,319 @@
+import argparse
+import sys
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from analyze_sequences import SequenceAnalyzer
+from analyze_sequences_paths import PathTimingAnalyzer, extract_hops
+from event_stream import read_events
+from hop_stats import DEFAULT_PERCENTILES, HOP_KEYS, HopStats
+from profiling import enable_from_env, staged
+from seq_read_csv import create_sequence_results, id_date_order
+from sequence_table import SEPARATOR
+
+TAIL_DTYPES = {
+    'last_event': object,
+    'last_date': 'datetime64[ns]',
+    'sequence': object,
+    'num_events': 'int64',
+    'start_date': object,
+    'end_date': object,
+}
+MIN_CAPACITY = 1024
+
+def grow(values, capacity):
+    """Return a copy of an array extended to capacity, the new slots zeroed."""
+    grown = np.zeros(capacity, dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
+
+class TailTable:
+    """
+    One tail row per id, in column arrays that grow in place.
+
+    Every id keeps the position it was given when first seen, found
+    through a dict, and the columns keep spare capacity that doubles
+    whenever it runs out. Looking up, adding and updating ids costs time
+    in proportion to their number, not to the number of ids held. The
+    rows of a batch are written, and its new ids registered, in one step
+    under a lock that row() shares, so a reader in another thread sees
+    each id either before or after the batch.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.ids = np.empty(0, dtype=object)
+        self.columns = {col: np.empty(0, dtype=dtype) for col, dtype in TAIL_DTYPES.items()}
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, id_val):
+        return id_val in self.positions
+
+    def lookup(self, ids):
+        """Return the positions of ids, -1 for ids not in the table."""
+        return np.array([self.positions.get(id_val, -1) for id_val in ids], dtype=np.int64)
+
+    def add(self, ids):
+        """Reserve the next free positions for new ids and return them; assign makes the ids visible."""
+        start, end = len(self), len(self) + len(ids)
+        if end > len(self.ids):
+            capacity = max(end, 2 * len(self.ids), MIN_CAPACITY)
+            with self.lock:
+                self.ids = grow(self.ids, capacity)
+                self.columns = {col: grow(values, capacity) for col, values in self.columns.items()}
+        self.ids[start:end] = ids
+        return np.arange(start, end)
+
+    def assign(self, positions, values):
+        """Write the columns in values at positions and register the ids there, in one step."""
+        with self.lock:
+            for col, column_values in values.items():
+                self.columns[col][positions] = column_values
+            self.positions.update(zip(self.ids[positions].tolist(), positions.tolist()))
+
+    def row(self, id_val):
+        """Return the tail of one id as a dict, or None for an unknown id."""
+        with self.lock:
+            position = self.positions.get(id_val)
+            if position is None:
+                return None
+            return {col: values[position] for col, values in self.columns.items()}
+
+    def to_frame(self):
+        """Return the tails as a frame indexed by id, in the order the ids were first seen."""
+        size = len(self)
+        return pd.DataFrame({col: values[:size] for col, values in self.columns.items()},
+                            index=pd.Index(self.ids[:size].tolist(), name='id'))
+
+class IncrementalAnalyzer:
+    """
+    Append-only sequence and hop analysis with state kept between runs.
+
+    The state holds one tail row per id (last event, last timestamp and
+    the sequence so far), the running count of every sequence, and the
+    running hop moments (count, mean, M2, min, max) and quantile sketch
+    per path segment. update() only touches the ids, sequences and
+    segments of the batch, so folding it in costs time in proportion to
+    the batch instead of the history. save() and write_outputs() still
+    write the whole state and output files, in proportion to the ids,
+    sequences and segments held.
+    """
+
+    def __init__(self):
+        self.tails = TailTable()
+        self.sequence_counts = {}
+        self.hop_stats = HopStats()
+        # Per segment, a bitmap over tail positions of the ids seen on it
+        self.segment_ids = {}
+
+    @classmethod
+    def load(cls, state_file):
+        """Load persisted state, or start empty if state_file does not exist."""
+        analyzer = cls()
+        if Path(state_file).exists():
+            state = pd.read_pickle(state_file)
+            analyzer.tails = state['tails']
+            analyzer.sequence_counts = state['sequence_counts']
+            analyzer.hop_stats.moments = state['hop_moments']
+            analyzer.hop_stats.sketches = state.get('hop_sketches', {})
+            analyzer.segment_ids = state['segment_ids']
+            if analyzer.hop_stats.moments.index.names == ['path_segment']:
+                analyzer._key_segments_by_events(state.get('hop_endpoints', {}))
+        return analyzer
+
+    def _key_segments_by_events(self, endpoints):
+        """
+        Re-key hop state saved under path_segment names by (source, target).
+
+        Older states kept the events of each segment in endpoints; the
+        oldest had none, and their names are split at the first '-' as
+        they were when the state was written.
+        """
+        def events(segment):
+            return endpoints.get(segment) or tuple(segment.split('-', 1))
+        moments = self.hop_stats.moments
+        keys = [events(segment) for segment in moments.index]
+        moments.index = pd.MultiIndex.from_arrays([[source for source, _ in keys], [target for _, target in keys]],
+                                                  names=list(HOP_KEYS))
+        self.hop_stats.sketches = {events(segment): sketch for segment, sketch in self.hop_stats.sketches.items()}
+        self.segment_ids = {events(segment): bits for segment, bits in self.segment_ids.items()}
+
+    @staged('incremental.save', rows=lambda result, analyzer, state_file: len(analyzer.tails))
+    def save(self, state_file):
+        """Persist the state for the next run, rewriting the whole state file."""
+        pd.to_pickle({
+            'tails': self.tails,
+            'sequence_counts': self.sequence_counts,
+            'hop_moments': self.hop_stats.moments,
+            'hop_sketches': self.hop_stats.sketches,
+            'segment_ids': self.segment_ids,
+        }, state_file)
+
+    @staged('incremental.update', rows=lambda result, analyzer, batch: len(batch))
+    def update(self, batch):
+        """
+        Fold a batch of new id,event,date rows into the state.
+
+        Events of an id that is already known must not be older than its
+        last recorded event. Raises ValueError otherwise.
+        """
+        batch = batch[['id', 'event', 'date']]
+        batch = batch.iloc[id_date_order(batch['id'].to_numpy(), batch['date'].to_numpy())]
+        if len(batch) == 0:
+            return self
+
+        # One entry per batch id, in id order, as create_sequence_results returns them
+        batch_ids = batch['id'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, batch_ids[1:] != batch_ids[:-1]])
+        ends = np.r_[starts[1:], len(batch)] - 1
+        ids = batch_ids[starts]
+        positions = self.tails.lookup(ids.tolist())
+        known = positions >= 0
+
+        # New events must continue each known id, not rewrite its history
+        dates = batch['date'].to_numpy().astype('datetime64[ns]')
+        if (dates[starts[known]] < self.tails.columns['last_date'][positions[known]]).any():
+            raise ValueError("Batch contains events older than the last recorded event of their id")
+
+        hops = self._update_hops(batch, ids[known], positions[known])
+        positions[~known] = self.tails.add(ids[~known].tolist())
+        self._update_segment_ids(hops, ids, positions)
+        self._update_sequences(batch, positions, known, ends)
+        return self
+
+    def _update_hops(self, batch, known_ids, known_positions):
+        """Fold the hops of a batch, including the hop from each known id's tail, and return them."""
+        tail_rows = pd.DataFrame({
+            'id': known_ids,
+            'event': self.tails.columns['last_event'][known_positions],
+            'date': self.tails.columns['last_date'][known_positions],
+        })
+        hops = extract_hops(pd.concat([tail_rows, batch], ignore_index=True))
+        self.hop_stats.update(hops, count_ids=False)
+        return hops
+
+    def _update_segment_ids(self, hops, ids, positions):
+        """Count each (segment, id) pair of the hops once over the whole history."""
+        pairs = hops[list(HOP_KEYS) + ['id']].drop_duplicates()
+        pair_positions = positions[pd.Index(ids).get_indexer(pairs['id'])]
+        new_ids = {}
+        for segment, rows in pairs.groupby(list(HOP_KEYS), sort=False).indices.items():
+            rows_positions = pair_positions[rows]
+            bits = self.segment_ids.get(segment, np.zeros(0, dtype=np.uint8))
+            needed = int(rows_positions.max()) // 8 + 1
+            if needed > len(bits):
+                bits = grow(bits, max(needed, 2 * len(bits)))
+            byte, mask = rows_positions // 8, (1 << (rows_positions % 8)).astype(np.uint8)
+            is_new = (bits[byte] & mask) == 0
+            np.bitwise_or.at(bits, byte[is_new], mask[is_new])
+            self.segment_ids[segment] = bits
+            new_ids[segment] = int(is_new.sum())
+        self.hop_stats.add_unique_ids(pd.Series(new_ids, dtype='int64'))
+
+    def _update_sequences(self, batch, positions, known, ends):
+        """Extend the sequences of the batch ids and move their counts."""
+        results = create_sequence_results(batch)
+        columns = self.tails.columns
+        previous = columns['sequence'][positions[known]]
+        sequences = results['sequence'].to_numpy(dtype=object, copy=True)
+        sequences[known] = previous + SEPARATOR + sequences[known]
+
+        # Only the sequences the batch leaves or reaches change their count
+        for sequence, count in pd.Series(previous).value_counts().items():
+            remaining = self.sequence_counts[sequence] - count
+            if remaining:
+                self.sequence_counts[sequence] = remaining
+            else:
+                del self.sequence_counts[sequence]
+        for sequence, count in pd.Series(sequences).value_counts().items():
+            self.sequence_counts[sequence] = self.sequence_counts.get(sequence, 0) + count
+
+        num_events = results['num_events'].to_numpy(copy=True)
+        num_events[known] += columns['num_events'][positions[known]]
+        start_dates = results['start_date'].to_numpy(dtype=object, copy=True)
+        start_dates[known] = columns['start_date'][positions[known]]
+        self.tails.assign(positions, {
+            'last_event': batch['event'].to_numpy()[ends],
+            'last_date': batch['date'].to_numpy()[ends],
+            'sequence': sequences,
+            'num_events': num_events,
+            'start_date': start_dates,
+            'end_date': results['end_date'].to_numpy(dtype=object),
+        })
+
+    def sequence_results(self):
+        """Return the current per-id sequences in the layout of results_id_seq.csv."""
+        results = self.tails.to_frame().sort_index().reset_index()
+        return results[['id', 'sequence', 'num_events', 'start_date', 'end_date']]
+
+    def write_outputs(self, sequence_file='sequence_analysis.csv', paths_file='sequence_analysis_paths.csv',
+                      ids_format='list'):
+        """
+        Rewrite the sequence and path analysis files from the state.
+
+        The default ids_format='list' writes the layout analyze_sequences.py
+        does, with the id lists rebuilt from every per-id tail.
+        ids_format='count' leaves the ids column out and writes the
+        sequence file from the running counts alone, without that pass
+        over the whole history.
+        """
+        analyzer = SequenceAnalyzer()
+        if ids_format == 'count':
+            counts = pd.Series(self.sequence_counts, dtype='int64').sort_index()
+            counts = counts.sort_values(ascending=False, kind='stable')
+            analyzer.unique_sequences = pd.DataFrame({
+                'sequence': counts.index,
+                'count': counts.to_numpy(),
+                'length': counts.index.str.count('→') + 1,
+            })
+        else:
+            analyzer.df = self.sequence_results()
+            analyzer.analyze_sequences(ids_format)
+        analyzer.save_analysis(sequence_file)
+
+        PathTimingAnalyzer().save_results(self.hop_stats.summary(DEFAULT_PERCENTILES), paths_file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Fold new event batches into the persisted analysis state.')
+    parser.add_argument('batch_files', nargs='+', help='New id,event,date files, in arrival order')
+    parser.add_argument('--state', default='analysis_state.pkl', help='State file kept between runs')
+    parser.add_argument('--sequence-output', default='sequence_analysis.csv')
+    parser.add_argument('--paths-output', default='sequence_analysis_paths.csv')
+    parser.add_argument('--ids-format', choices=['list', 'count'], default='list',
+                        help="'count' leaves out the ids of every sequence, which are rebuilt from the whole history")
+    args = parser.parse_args()
+    enable_from_env()
+
+    analyzer = IncrementalAnalyzer.load(args.state)
+    for batch_file in args.batch_files:
+        if not Path(batch_file).exists():
+            print(f"Error: {batch_file} not found.")
+            sys.exit(1)
+        try:
+            analyzer.update(read_events(batch_file))
+        except ValueError as e:
+            print(f"Error applying {batch_file}: {e}")
+            sys.exit(1)
+        print(f"Applied {batch_file}")
+
+    analyzer.save(args.state)
+    print(f"\nState saved to '{args.state}' ({len(analyzer.tails)} ids, "
+          f"{len(analyzer.sequence_counts)} unique sequences)")
+
+    analyzer.write_outputs(args.sequence_output, args.paths_output, args.ids_format)
+
+if __name__ == "__main__":
+    main()
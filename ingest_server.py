@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import heapq
+import io
+import json
+import os
+import signal
+import sys
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+import numpy as np
+import pandas as pd
+from generator_random_events import PatternedPathGenerator
+from hop_stats import DEFAULT_PERCENTILES
+from incremental import IncrementalAnalyzer
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_SNAPSHOT_SECONDS = 60.0
+MAX_BODY_BYTES = 64 * 2**20
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+def parse_batch(body, content_type=''):
+    """
+    Parse an ingestion body into an id,event,date frame.
+
+    The body is either CSV with an id,event,date (or id,event,timestamp)
+    header, or, with a JSON content type, a list of objects with the
+    same keys. Raises ValueError for anything else.
+    """
+    if 'json' in content_type:
+        records = json.loads(body or b'[]')
+        if not isinstance(records, list):
+            raise ValueError("JSON body must be a list of records")
+        df = pd.DataFrame.from_records(records)
+    else:
+        df = pd.read_csv(io.BytesIO(body)) if body.strip() else pd.DataFrame()
+    if len(df) == 0:
+        return pd.DataFrame({'id': pd.Series(dtype='int64'), 'event': pd.Series(dtype=object),
+                             'date': pd.Series(dtype='datetime64[ns]')})
+    df = df.rename(columns={'timestamp': 'date'})
+    missing = [col for col in ('id', 'event', 'date') if col not in df.columns]
+    if missing:
+        raise ValueError(f"Records must contain: id, event, date (or timestamp); missing {', '.join(missing)}")
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+    df['event'] = df['event'].astype(str)
+    return df[['id', 'event', 'date']]
+
+class IngestionService:
+    """
+    Live sequence and hop aggregates behind a small asyncio HTTP server.
+
+    Batches posted to /events are folded into an IncrementalAnalyzer, which
+    keeps the per-id tails, sequence counts and hop moments/sketches that
+    the batch analyzers would compute over the whole history. Batches are
+    applied one at a time, in a worker thread behind a lock, so the event
+    loop keeps answering queries while a batch is folded in. Queries read
+    an immutable view of the aggregates (sequence counts, hop statistics
+    and totals) that the worker builds after each batch and swaps in, so
+    they cost a lookup or a small sort instead of a rescan and never see
+    a batch half applied. Per-id tails are read from the analyzer, which
+    publishes the rows of each batch in one step. Snapshots pickle the
+    state in a worker thread behind the same lock, while queries go on
+    reading the view. Each snapshot is written to a temporary file and
+    then renamed, so a crash never leaves a half-written state behind.
+
+    Endpoints:
+        POST /events                 CSV or JSON batch of id,event,date records
+        GET  /sequences/top?n=10     most frequent sequences
+        GET  /hops[?segment=A-B]     hop duration statistics
+        GET  /ids/<id>               current sequence of one id
+        GET  /stats                  totals and ingestion counters
+        POST /snapshot               write a snapshot now
+    """
+
+    def __init__(self, state_file=None, snapshot_seconds=DEFAULT_SNAPSHOT_SECONDS):
+        self.state_file = state_file
+        self.snapshot_seconds = snapshot_seconds
+        self.analyzer = IncrementalAnalyzer.load(state_file) if state_file else IncrementalAnalyzer()
+        self.view = self.build_view()
+        self.lock = asyncio.Lock()
+        self.events_ingested = 0
+        self.batches_ingested = 0
+        self.last_snapshot = None
+        self.started = time.time()
+
+    def build_view(self):
+        """Return a copy of the aggregates that queries can read while the next batch is applied."""
+        stats = self.analyzer.hop_stats.summary(DEFAULT_PERCENTILES)
+        return {
+            'sequence_counts': dict(self.analyzer.sequence_counts),
+            'hops': json.loads(stats.to_json(orient='records')),
+            'ids': len(self.analyzer.tails),
+            'path_segments': len(stats),
+        }
+
+    def apply(self, batch):
+        """Fold a batch into the analyzer and return the new view; runs in a worker thread."""
+        self.analyzer.update(batch)
+        return self.build_view()
+
+    async def ingest(self, batch):
+        """Fold one parsed batch into the aggregates; raises ValueError for out-of-order events."""
+        async with self.lock:
+            self.view = await asyncio.get_running_loop().run_in_executor(None, self.apply, batch)
+        self.events_ingested += len(batch)
+        self.batches_ingested += 1
+        return {'accepted': len(batch), 'events_ingested': self.events_ingested}
+
+    async def snapshot(self):
+        """Write the state to state_file, atomically, without blocking queries."""
+        if not self.state_file:
+            return None
+        temp_file = f"{self.state_file}.tmp"
+        async with self.lock:
+            await asyncio.get_running_loop().run_in_executor(None, self.analyzer.save, temp_file)
+            os.replace(temp_file, self.state_file)
+        self.last_snapshot = time.time()
+        return self.state_file
+
+    async def snapshot_periodically(self):
+        """Snapshot every snapshot_seconds while the server runs."""
+        while True:
+            await asyncio.sleep(self.snapshot_seconds)
+            await self.snapshot()
+
+    def top_sequences(self, n=10):
+        """Return the n most frequent sequences with their counts."""
+        top = heapq.nlargest(n, self.view['sequence_counts'].items(), key=lambda item: item[1])
+        return [{'sequence': sequence, 'count': int(count)} for sequence, count in top]
+
+    def hop_stats(self, segment=None):
+        """Return the hop statistics of every segment, or of one."""
+        hops = self.view['hops']
+        if segment is not None:
+            hops = [hop for hop in hops if hop['path_segment'] == segment]
+        return hops
+
+    def id_sequence(self, id_val):
+        """Return the current sequence of one id, or None if it was never seen."""
+        tail = self.analyzer.tails.row(id_val)
+        if tail is None:
+            return None
+        return {
+            'id': id_val,
+            'sequence': tail['sequence'],
+            'num_events': int(tail['num_events']),
+            'last_event': tail['last_event'],
+            'last_date': pd.Timestamp(tail['last_date']).isoformat(),
+            'start_date': tail['start_date'],
+            'end_date': tail['end_date'],
+        }
+
+    def stats(self):
+        """Return totals and ingestion counters."""
+        return {
+            'ids': self.view['ids'],
+            'unique_sequences': len(self.view['sequence_counts']),
+            'path_segments': self.view['path_segments'],
+            'events_ingested': self.events_ingested,
+            'batches_ingested': self.batches_ingested,
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'last_snapshot': self.last_snapshot,
+        }
+
+    async def route(self, method, target, headers, body):
+        """Dispatch one request and return (status, payload)."""
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/') or '/'
+
+        if path == '/events':
+            if method != 'POST':
+                return 405, {'error': 'Use POST to send events'}
+            try:
+                return 200, await self.ingest(parse_batch(body, headers.get('content-type', '')))
+            except (ValueError, pd.errors.ParserError) as e:
+                return 400, {'error': str(e)}
+        if path == '/snapshot' and method == 'POST':
+            return 200, {'snapshot': await self.snapshot()}
+        if method != 'GET':
+            return 405, {'error': f"{method} is not supported on {path}"}
+        if path == '/sequences/top':
+            if not query.get('n', '10').isdigit():
+                return 400, {'error': 'n must be a positive integer'}
+            return 200, self.top_sequences(int(query.get('n', 10)))
+        if path == '/hops':
+            return 200, self.hop_stats(query.get('segment'))
+        if path.startswith('/ids/'):
+            # Ids keep the type they were ingested with, so try the text as sent first
+            id_text = unquote(path[len('/ids/'):])
+            result = self.id_sequence(id_text)
+            if result is None:
+                try:
+                    result = self.id_sequence(int(id_text))
+                except ValueError:
+                    pass
+            return (200, result) if result is not None else (404, {'error': 'Unknown id'})
+        if path == '/stats':
+            return 200, self.stats()
+        return 404, {'error': f"No endpoint {path}"}
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {'error': f"Batches are limited to {MAX_BODY_BYTES} bytes"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.route(method.upper(), target, headers, body)
+                close = headers.get('connection', '').lower() == 'close'
+                await self.respond(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, close=False):
+        """Write one JSON response."""
+        body = json.dumps(payload, default=str).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Run the server until SIGINT or SIGTERM, taking a final snapshot on the way out."""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:  # Not available on Windows
+                pass
+
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        snapshots = asyncio.create_task(self.snapshot_periodically()) if self.state_file else None
+        print(f"Serving on http://{host}:{port} ({len(self.analyzer.tails)} ids loaded)", flush=True)
+        async with server:
+            await stop.wait()
+        if snapshots:
+            snapshots.cancel()
+            await self.snapshot()
+            print(f"State saved to '{self.state_file}'")
+
+async def http_request(reader, writer, method, path, body=b'', content_type='text/csv'):
+    """Send one keep-alive request and return (status, decoded JSON body)."""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def run_load(host=DEFAULT_HOST, port=DEFAULT_PORT, num_ids=10_000, num_patterns=10, batch_size=1_000,
+                   connections=4, seed=None):
+    """
+    Feed the server with PatternedPathGenerator events and time a few queries.
+
+    Ids are split across connections by id modulo connections, and each
+    connection sends its ids' events in date order, so every id's events
+    arrive in order even though the connections run concurrently.
+    """
+    generator = PatternedPathGenerator(num_ids=num_ids, num_patterns=num_patterns, seed=seed)
+    events = pd.concat(generator.iter_blocks(), ignore_index=True)[['id', 'event', 'date']]
+    events = events.iloc[np.argsort(events['date'].to_numpy(), kind='stable')]
+
+    async def feed(part):
+        reader, writer = await asyncio.open_connection(host, port)
+        latencies = []
+        for start in range(0, len(part), batch_size):
+            body = part.iloc[start:start + batch_size].to_csv(index=False).encode()
+            sent = time.perf_counter()
+            status, payload = await http_request(reader, writer, 'POST', '/events', body)
+            latencies.append(time.perf_counter() - sent)
+            if status != 200:
+                raise RuntimeError(f"Server rejected a batch: {payload['error']}")
+        writer.close()
+        return latencies
+
+    started = time.perf_counter()
+    parts = [events[events['id'] % connections == c] for c in range(connections)]
+    latencies = sum(await asyncio.gather(*(feed(part) for part in parts)), [])
+    elapsed = time.perf_counter() - started
+
+    reader, writer = await asyncio.open_connection(host, port)
+    query_ms = {}
+    for path in ('/sequences/top?n=10', '/hops', f"/ids/{int(events['id'].iloc[0])}", '/stats'):
+        sent = time.perf_counter()
+        await http_request(reader, writer, 'GET', path)
+        query_ms[path] = round((time.perf_counter() - sent) * 1000, 2)
+    writer.close()
+
+    return {
+        'events': len(events),
+        'seconds': round(elapsed, 2),
+        'events_per_sec': round(len(events) / elapsed) if elapsed > 0 else None,
+        'batch_p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 2),
+        'batch_p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 2),
+        'query_ms': query_ms,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve live sequence and hop aggregates, or load-test the server.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--state', default='ingest_state.pkl', help='Snapshot file, loaded at start if present')
+    parser.add_argument('--snapshot-seconds', type=float, default=DEFAULT_SNAPSHOT_SECONDS)
+    parser.add_argument('--load', action='store_true', help='Send generated events to a running server instead')
+    parser.add_argument('--num-ids', type=int, default=10_000, help='Ids generated with --load')
+    parser.add_argument('--batch-size', type=int, default=1_000, help='Events per request with --load')
+    parser.add_argument('--connections', type=int, default=4, help='Concurrent connections with --load')
+    args = parser.parse_args()
+
+    try:
+        if args.load:
+            result = asyncio.run(run_load(args.host, args.port, args.num_ids, batch_size=args.batch_size,
+                                          connections=args.connections))
+            print(json.dumps(result, indent=2))
+        else:
+            asyncio.run(IngestionService(args.state, args.snapshot_seconds).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    except (OSError, RuntimeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from event_store import EventStore
+from sequence_table import SequenceTable
+
+def shard_of(ids, num_shards):
+    """Hash ids into shard numbers 0..num_shards-1."""
+    return (pd.util.hash_array(np.asarray(ids)) % np.uint64(num_shards)).astype(np.int64)
+
+def split_by_id(df, num_shards):
+    """
+    Hash-partition df by id into num_shards frames.
+
+    Every id lands in exactly one shard, rows keep their original index
+    labels, and each shard keeps the original row order.
+    """
+    shards = shard_of(df['id'].to_numpy(), num_shards)
+    order = np.argsort(shards, kind='stable')
+    bounds = np.searchsorted(shards[order], np.arange(num_shards + 1))
+    return [df.iloc[order[bounds[i]:bounds[i + 1]]] for i in range(num_shards)]
+
+def split_table_by_id(table, num_shards):
+    """Hash-partition a SequenceTable by id into num_shards tables, each keeping the row order."""
+    shards = shard_of(table.ids, num_shards)
+    return [table.take(np.flatnonzero(shards == shard)) for shard in range(num_shards)]
+
+def _run_store_shard(func, store_path, shard, num_shards, args):
+    """Open an event store in the worker and run func on one id shard of it."""
+    store = EventStore(store_path)
+    ids = store.array('id')
+    rows = np.flatnonzero(shard_of(ids, num_shards) == shard)
+    df = store.to_frame().iloc[rows]
+    return func(df, *args)
+
+def map_shards(func, source, workers, *args):
+    """
+    Run func(shard, *args) on every id shard of source in a process pool.
+
+    source is either a DataFrame or a SequenceTable, which is partitioned
+    here and shipped to the workers, or an event store path, which every
+    worker maps and partitions itself so no event data crosses process
+    boundaries.
+    Returns the per-shard results in shard order, ready to be merged.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if isinstance(source, (str, Path)):
+            futures = [pool.submit(_run_store_shard, func, str(source), shard, workers, args)
+                       for shard in range(workers)]
+        elif isinstance(source, SequenceTable):
+            futures = [pool.submit(func, shard, *args) for shard in split_table_by_id(source, workers)]
+        else:
+            futures = [pool.submit(func, shard_df, *args) for shard_df in split_by_id(source, workers)]
+        return [future.result() for future in futures]
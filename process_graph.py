@@ -0,0 +1,232 @@
+import argparse
+import json
+import math
+import sys
+from itertools import islice
+from pathlib import Path
+import networkx as nx
+import pandas as pd
+from tabulate import tabulate
+from analyze_sequences_paths import PathTimingAnalyzer, extract_hops, read_path_stats
+from event_store import is_event_store
+from event_stream import read_events
+from hop_stats import DEFAULT_PERCENTILES, HopStats
+
+GRAPH_FORMATS = ('.graphml', '.json')
+DEFAULT_MAX_PATHS = 1000
+
+class ProcessGraph:
+    """
+    Directed, weighted graph of the hops between events.
+
+    Every edge is one path segment of the hop statistics, carrying its
+    frequency, duration columns (avg_hours, pNN_hours, ...), probability
+    (its share of the hops leaving the source event) and total_hours, the
+    cumulative wait spent on it (frequency * avg_hours). The graph is
+    built from the aggregated statistics, one edge per segment, so its
+    size follows the number of distinct hops, not transitions.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    @classmethod
+    def from_stats(cls, stats):
+        """Build the graph from per-segment statistics in the layout of analyze_path_segments."""
+        edges = stats.copy()
+        if edges.duplicated(['source', 'target']).any():
+            raise ValueError("Path statistics must have one row per path segment (analyze them without --group-by)")
+        edges['probability'] = (edges['frequency'] / edges.groupby('source')['frequency'].transform('sum')).round(4)
+        edges['total_hours'] = (edges['frequency'] * edges['avg_hours']).round(2)
+
+        graph = nx.DiGraph()
+        # Plain Python values, which every export format can write
+        for record in edges.astype(object).where(edges.notna(), None).to_dict('records'):
+            graph.add_edge(record.pop('source'), record.pop('target'), **record)
+        for event in graph:
+            graph.nodes[event]['frequency'] = int(sum(data['frequency'] for *_, data in graph.in_edges(event, data=True)))
+            graph.nodes[event]['wait_hours'] = round(sum(data['total_hours'] for *_, data in graph.in_edges(event, data=True)), 2)
+        return cls(graph)
+
+    @classmethod
+    def from_events(cls, df, percentiles=DEFAULT_PERCENTILES):
+        """Build the graph from the hops of an id,event,date frame."""
+        return cls.from_stats(HopStats().update(extract_hops(df)).summary(percentiles))
+
+    def bottlenecks(self, top=10):
+        """
+        Return the hops with the highest cumulative wait, largest first.
+
+        share is each hop's fraction of the wait over all hops.
+        """
+        edges = nx.to_pandas_edgelist(self.graph)
+        edges = edges.sort_values(['total_hours', 'path_segment'], ascending=[False, True]).head(top)
+        total = sum(data['total_hours'] for *_, data in self.graph.edges(data=True))
+        edges['share'] = (edges['total_hours'] / total).round(4) if total else 0.0
+        return edges[['path_segment', 'frequency', 'avg_hours', 'total_hours', 'share']].reset_index(drop=True)
+
+    def event_waits(self):
+        """Return the cumulative wait spent reaching each event, largest first."""
+        waits = pd.DataFrame.from_dict(dict(self.graph.nodes(data=True)), orient='index')
+        waits.index.name = 'event'
+        return waits.sort_values('wait_hours', ascending=False).reset_index()
+
+    def _check_event(self, event):
+        """Raise ValueError for an event that is not in the graph."""
+        if event not in self.graph:
+            raise ValueError(f"Unknown event: {event}")
+
+    def _check_weight(self, weight):
+        """Raise ValueError for a weight that not every edge has."""
+        if any(data.get(weight) is None for *_, data in self.graph.edges(data=True)):
+            raise ValueError(f"Not every path segment has a value for {weight}")
+
+    def _route(self, path, weight):
+        """Describe a path by its events, total weight and probability of following it."""
+        hops = [self.graph.edges[source, target] for source, target in zip(path, path[1:])]
+        return {
+            'path': list(path),
+            'hours': round(sum(hop[weight] for hop in hops), 2),
+            'probability': float(f"{math.prod(hop['probability'] for hop in hops):.4g}"),
+        }
+
+    def shortest_path(self, source, target, weight='avg_hours'):
+        """Return the path from source to target with the lowest total expected time (Dijkstra)."""
+        self._check_event(source)
+        self._check_event(target)
+        self._check_weight(weight)
+        try:
+            return self._route(nx.dijkstra_path(self.graph, source, target, weight=weight), weight)
+        except nx.NetworkXNoPath:
+            raise ValueError(f"No path from {source} to {target}")
+
+    def critical_path(self, source, target, weight='avg_hours', max_paths=DEFAULT_MAX_PATHS):
+        """
+        Return the simple path from source to target with the highest total expected time.
+
+        Self-loops never lie on a simple path, so they are dropped. When
+        the rest of the graph between source and target is acyclic, the
+        answer is exact, by a longest-path pass over its topological
+        order. Otherwise the longest path is NP-hard, and the answer is
+        the longest among the max_paths most likely simple paths.
+        """
+        self._check_event(source)
+        self._check_event(target)
+        self._check_weight(weight)
+        # Only events on some source -> target path matter
+        between = (nx.descendants(self.graph, source) | {source}) & (nx.ancestors(self.graph, target) | {target})
+        if target not in between or source == target:
+            raise ValueError(f"No path from {source} to {target}")
+        graph = self.graph.subgraph(between).copy()
+        graph.remove_edges_from(list(nx.selfloop_edges(graph)))
+
+        if nx.is_directed_acyclic_graph(graph):
+            hours = {source: (0.0, None)}
+            for event in nx.topological_sort(graph):
+                if event not in hours:
+                    continue
+                for _, following, data in graph.out_edges(event, data=True):
+                    candidate = hours[event][0] + data[weight]
+                    if following not in hours or candidate > hours[following][0]:
+                        hours[following] = (candidate, event)
+            path = [target]
+            while path[-1] != source:
+                path.append(hours[path[-1]][1])
+            return self._route(path[::-1], weight)
+
+        # Most likely paths first: the cost of a hop is -log of its probability
+        for _, _, data in graph.edges(data=True):
+            data['surprise'] = -math.log(data['probability']) if data['probability'] > 0 else math.inf
+        paths = islice(nx.shortest_simple_paths(graph, source, target, weight='surprise'), max_paths)
+        routes = [self._route(path, weight) for path in paths]
+        return max(routes, key=lambda route: route['hours'])
+
+    def save(self, path):
+        """Write the graph as GraphML or node-link JSON, chosen by the file suffix."""
+        suffix = Path(path).suffix.lower()
+        if suffix == '.graphml':
+            # GraphML has no null, so missing values are left off the element
+            graph = self.graph.copy()
+            for _, _, data in graph.edges(data=True):
+                for key in [key for key, value in data.items() if value is None]:
+                    del data[key]
+            nx.write_graphml(graph, path)
+        elif suffix == '.json':
+            with open(path, 'w') as f:
+                json.dump(nx.node_link_data(self.graph), f, indent=2)
+        else:
+            raise ValueError(f"Graph file must end in one of: {', '.join(GRAPH_FORMATS)}")
+
+def load_path_stats(path, workers=1, chunksize=None, percentiles=DEFAULT_PERCENTILES):
+    """
+    Return per-segment statistics from a saved path analysis CSV, or computed from an events file or event store.
+
+    Events are summarized as by seqmodel paths: sharded across workers,
+    or streamed in chunks from an id-sorted file.
+    """
+    if not is_event_store(path) and 'Path_Segment' in pd.read_csv(path, nrows=0).columns:
+        return read_path_stats(path)
+    analyzer = PathTimingAnalyzer(path)
+    if chunksize:
+        return analyzer.accumulate_path_segments(chunksize, percentiles)
+    if workers > 1:
+        if not is_event_store(path):
+            analyzer.df = read_events(path)
+        return analyzer.analyze_path_segments_parallel(workers, percentiles)
+    return HopStats().update(extract_hops(read_events(path))).summary(percentiles)
+
+def display_graph(process_graph, top=10, routes=(), weight='avg_hours'):
+    """Print the graph size, the bottleneck hops and events, and the requested routes."""
+    graph = process_graph.graph
+    print("\nProcess Graph Summary")
+    print("=" * 50)
+    print(f"Events: {graph.number_of_nodes()}")
+    print(f"Path segments: {graph.number_of_edges()}")
+    print(f"Transitions: {sum(data['frequency'] for *_, data in graph.edges(data=True))}")
+
+    print(f"\nBottleneck hops (highest cumulative wait, top {top}):")
+    print(tabulate(process_graph.bottlenecks(top), headers=['Path_Segment', 'Frequency', 'Average_Hours',
+                                                            'Total_Hours', 'Share'],
+                   tablefmt='grid', showindex=False, floatfmt=('', '', '.2f', '.2f', '.4f')))
+
+    print("\nCumulative wait by event reached:")
+    waits = process_graph.event_waits().head(top)
+    print(tabulate(waits[['event', 'frequency', 'wait_hours']], headers=['Event', 'Arrivals', 'Wait_Hours'],
+                   tablefmt='grid', showindex=False, floatfmt=".2f"))
+
+    rows = []
+    for source, target in routes:
+        for kind, route in (('shortest', process_graph.shortest_path(source, target, weight)),
+                            ('critical', process_graph.critical_path(source, target, weight))):
+            rows.append([f"{source} → {target}", kind, ' → '.join(route['path']), route['hours'], route['probability']])
+    if rows:
+        print(f"\nExpected-time paths ({weight}):")
+        print(tabulate(rows, headers=['Route', 'Kind', 'Path', 'Hours', 'Probability'], tablefmt='grid',
+                       floatfmt=('', '', '', '.2f', '.4g')))
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the process graph of the hops between events.')
+    parser.add_argument('--input', default='patterned_events.csv',
+                        help='Events file, event store or saved path analysis CSV')
+    parser.add_argument('--route', nargs=2, action='append', default=[], metavar=('SOURCE', 'TARGET'),
+                        help='Report the shortest and critical expected-time paths between two events')
+    parser.add_argument('--weight', default='avg_hours', help='Edge duration to use, e.g. avg_hours or p90_hours')
+    parser.add_argument('--top', type=int, default=10, help='Bottlenecks to list')
+    parser.add_argument('--output', help='Save the graph to this .graphml or .json file')
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"Error: {args.input} not found.")
+        sys.exit(1)
+    try:
+        process_graph = ProcessGraph.from_stats(load_path_stats(args.input))
+        display_graph(process_graph, args.top, args.route, args.weight)
+        if args.output:
+            process_graph.save(args.output)
+            print(f"\nGraph saved to '{args.output}'")
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
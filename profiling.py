@@ -0,0 +1,167 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+PROFILE_ENV = 'SEQMODEL_PROFILE'
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+class StageProfiler:
+    """
+    Records wall time, rows, rows/sec and peak RSS for each pipeline stage.
+
+    Stages nest: a stage opened inside another is recorded as
+    'outer/inner'. Every finished stage is passed to each hook, so a
+    caller can alert on slow stages as they happen. With cprofile_dir,
+    each top-level stage also runs under cProfile and its stats are
+    dumped there as a .prof file.
+    """
+
+    def __init__(self, hooks=(), cprofile_dir=None):
+        self.hooks = list(hooks)
+        self.cprofile_dir = Path(cprofile_dir) if cprofile_dir else None
+        self.stages = []
+        self.stack = []
+        self.started = datetime.now()
+        self.start_time = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time the body as one stage; set record['rows'] inside it if rows is known later."""
+        record = {'stage': '/'.join(self.stack + [name]), 'rows': rows}
+        profile = None
+        if self.cprofile_dir and not self.stack:
+            profile = cProfile.Profile()
+        self.stack.append(name)
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+            seconds = time.perf_counter() - start
+            self.stack.pop()
+            rss_after = peak_rss_mb()
+            record['seconds'] = round(seconds, 4)
+            record['rows_per_sec'] = round(record['rows'] / seconds) if record['rows'] and seconds > 0 else None
+            record['peak_rss_mb'] = None if rss_after is None else round(rss_after, 1)
+            record['rss_growth_mb'] = None if rss_after is None else round(rss_after - rss_before, 1)
+            if profile:
+                self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+                prof_file = self.cprofile_dir / f"{len(self.stages):02d}_{record['stage'].replace('/', '_')}.prof"
+                profile.dump_stats(prof_file)
+                record['cprofile'] = str(prof_file)
+            self.stages.append(record)
+            for hook in self.hooks:
+                hook(record)
+
+    def report(self):
+        """Return the run report as a JSON-serializable dict."""
+        return {
+            'command': sys.argv,
+            'started': self.started.isoformat(timespec='seconds'),
+            'total_seconds': round(time.perf_counter() - self.start_time, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': self.stages,
+        }
+
+    def save(self, report_file):
+        """Write the run report to report_file as JSON."""
+        with open(report_file, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+
+_active = None
+
+def enable(report_file=None, hooks=(), cprofile_dir=None):
+    """
+    Start recording stages in this process and return the profiler.
+
+    With report_file, the JSON report is written when the process exits
+    (or earlier, by finish).
+    """
+    global _active
+    _active = StageProfiler(hooks, cprofile_dir)
+    if report_file:
+        profiler = _active
+        atexit.register(lambda: profiler is _active and finish(report_file))
+    return _active
+
+def enable_from_env():
+    """Enable profiling if SEQMODEL_PROFILE names a report file."""
+    if os.environ.get(PROFILE_ENV):
+        enable(os.environ[PROFILE_ENV])
+
+def finish(report_file=None):
+    """Stop recording, optionally write the report, and return the profiler."""
+    global _active
+    profiler, _active = _active, None
+    if profiler is not None and report_file:
+        profiler.save(report_file)
+        print(f"\nProfile report saved to '{report_file}'", file=sys.stderr)
+    return profiler
+
+@contextmanager
+def stage(name, rows=None):
+    """Record the body as a stage of the active profiler; does nothing when profiling is off."""
+    if _active is None:
+        yield {'stage': name, 'rows': rows}
+        return
+    with _active.stage(name, rows) as record:
+        yield record
+
+def staged(name, rows=None):
+    """
+    Decorate a function so each call is recorded as a stage.
+
+    rows(result, *args, **kwargs) gives the rows processed; by default it
+    is len(result) when the result has a length.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _active.stage(name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record['rows'] = rows(result, *args, **kwargs)
+                elif hasattr(result, '__len__'):
+                    record['rows'] = len(result)
+                return result
+        return wrapper
+    return decorator
+
+def slow_stage_hook(threshold_seconds, alert=None):
+    """
+    Return a hook that calls alert(record) for stages slower than threshold_seconds.
+
+    The default alert prints a warning to stderr.
+    """
+    def default_alert(record):
+        print(f"Warning: stage '{record['stage']}' took {record['seconds']:.2f}s", file=sys.stderr)
+    alert = alert or default_alert
+    def hook(record):
+        if record['seconds'] > threshold_seconds:
+            alert(record)
+    return hook
@@ -0,0 +1,179 @@
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from event_stream import read_events
+from seq_read_csv import id_date_order
+from sequence_table import iter_levels
+from transition_model import TransitionModel
+
+DEFAULT_MIN_SUPPORT = 5
+
+def sequence_layout(df, states):
+    """
+    Sort events by (id, date) and lay them out as model codes.
+
+    Returns (order, ids, codes, offsets): row order[k] of df is event k,
+    and the events of id ids[i] are codes[offsets[i]:offsets[i + 1]],
+    with -1 for events not in states.
+    """
+    order = id_date_order(df['id'].to_numpy(), df['date'].to_numpy())
+    ids = df['id'].to_numpy()[order]
+    codes = pd.Categorical(df['event'].to_numpy()[order], categories=states).codes.astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.arange(0)
+    return order, ids[starts], codes, np.append(starts, len(ids))
+
+class RemainingTimePredictor:
+    """
+    Predicts the hours left until an in-flight id has its last event.
+
+    Every observed prefix of every completed sequence is a node of a
+    prefix trie, stored as the sorted array of its edge keys
+    (parent node * number of events + event code); node k + 1 is the child
+    reached by keys[k], and node 0 is the root. Each node keeps how many
+    ids passed through it and their mean remaining hours after it.
+    Prefixes seen fewer than min_support times fall back to the expected
+    time to the end from the last event under the TransitionModel built
+    from the same hops. Scoring walks all prefixes one level at a time
+    with searchsorted, so a batch costs a handful of numpy passes per
+    event position rather than Python work per id.
+    """
+
+    def __init__(self, states, keys, counts, mean_hours, markov_hours, min_support=DEFAULT_MIN_SUPPORT):
+        self.states = np.asarray(states)
+        self.keys = keys
+        self.counts = counts
+        self.mean_hours = mean_hours
+        self.markov_hours = markov_hours
+        self.min_support = min_support
+
+    @classmethod
+    def fit(cls, df, min_support=DEFAULT_MIN_SUPPORT):
+        """Train on an id,event,date frame of completed ids."""
+        states = np.unique(df['event'].to_numpy().astype(str))
+        order, ids, codes, offsets = sequence_layout(df, states)
+        dates = df['date'].to_numpy()[order]
+        remaining = (np.repeat(dates[offsets[1:] - 1], np.diff(offsets)) - dates) / np.timedelta64(1, 'h')
+
+        # Number the prefixes level by level; a level's parents all come
+        # from the previous level, so the keys come out globally sorted
+        nodes = np.zeros(len(codes), dtype=np.int64)
+        keys = []
+        num_nodes = 1
+        for level, rows in iter_levels(offsets):
+            parents = nodes[rows - 1] if level else np.zeros(len(rows), dtype=np.int64)
+            level_keys, inverse = np.unique(parents * len(states) + codes[rows], return_inverse=True)
+            nodes[rows] = num_nodes + inverse
+            keys.append(level_keys)
+            num_nodes += len(level_keys)
+
+        # The root stands for any event at all, the last resort for unknown events
+        counts = np.bincount(nodes, minlength=num_nodes)
+        counts[0] = len(nodes)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_hours = np.bincount(nodes, weights=remaining, minlength=num_nodes) / counts
+        mean_hours[0] = remaining.mean() if len(remaining) else 0.0
+        markov_hours = TransitionModel.from_events(df).expected_time_to_end().reindex(states).to_numpy()
+        return cls(states, np.concatenate(keys) if keys else np.arange(0), counts, mean_hours, markov_hours,
+                   min_support)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save."""
+        with np.load(path) as data:
+            return cls(data['states'], data['keys'], data['counts'], data['mean_hours'],
+                       data['markov_hours'], int(data['min_support']))
+
+    def save(self, path):
+        """Save the model arrays to an uncompressed .npz file, which loads without parsing."""
+        np.savez(path, states=self.states, keys=self.keys, counts=self.counts, mean_hours=self.mean_hours,
+                 markov_hours=self.markov_hours, min_support=self.min_support)
+
+    def prefix_nodes(self, codes, offsets):
+        """Return the trie node of every event's prefix, or -1 if that prefix was never seen."""
+        nodes = np.full(len(codes), -1, dtype=np.int64)
+        if len(self.keys) == 0:
+            return nodes
+        for level, rows in iter_levels(offsets):
+            parents = nodes[rows - 1] if level else np.zeros(len(rows), dtype=np.int64)
+            keys = parents * len(self.states) + codes[rows]
+            found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            known = (parents >= 0) & (codes[rows] >= 0) & (self.keys[found] == keys)
+            nodes[rows] = np.where(known, found + 1, -1)
+        return nodes
+
+    def predict_codes(self, codes, offsets, elapsed_hours=0.0):
+        """
+        Predict remaining hours for sequences given as model codes.
+
+        elapsed_hours is the time already spent since each sequence's
+        latest event and is subtracted from the estimate. Returns
+        (remaining_hours, from_prefix), where from_prefix tells whether the
+        prefix table or the Markov fallback answered.
+        """
+        last = offsets[1:] - 1
+        nodes = self.prefix_nodes(codes, offsets)[last]
+        from_prefix = (nodes >= 0) & (self.counts[np.maximum(nodes, 0)] >= self.min_support)
+
+        last_codes = codes[last]
+        fallback = np.where(last_codes >= 0, self.markov_hours[np.maximum(last_codes, 0)], self.mean_hours[0])
+        hours = np.where(from_prefix, self.mean_hours[np.maximum(nodes, 0)], fallback)
+        return np.maximum(hours - elapsed_hours, 0), from_prefix
+
+    def predict(self, df, now=None):
+        """
+        Predict remaining hours for the in-flight ids of an id,event,date frame.
+
+        With now, the time since each id's latest event counts as already
+        elapsed. Returns one row per id.
+        """
+        order, ids, codes, offsets = sequence_layout(df, self.states)
+        last_rows = order[offsets[1:] - 1]
+        elapsed = 0.0
+        if now is not None:
+            last_dates = df['date'].to_numpy()[last_rows]
+            elapsed = np.maximum((np.datetime64(pd.Timestamp(now)) - last_dates) / np.timedelta64(1, 'h'), 0)
+        remaining, from_prefix = self.predict_codes(codes, offsets, elapsed)
+        return pd.DataFrame({
+            'id': ids,
+            'last_event': df['event'].to_numpy()[last_rows],
+            'num_events': np.diff(offsets),
+            'remaining_hours': remaining.round(2),
+            'method': np.where(from_prefix, 'prefix', 'markov'),
+        })
+
+def main():
+    parser = argparse.ArgumentParser(description='Train or apply the remaining-time predictor.')
+    parser.add_argument('--train', help='Completed id,event,date events to train on')
+    parser.add_argument('--model', default='remaining_time.npz', help='Model file to write or read')
+    parser.add_argument('--min-support', type=int, default=DEFAULT_MIN_SUPPORT,
+                        help='Ids a prefix needs before its own mean is used')
+    parser.add_argument('--input', help='Events of the in-flight ids to score')
+    parser.add_argument('--now', help='Current time (ISO format); defaults to each id\'s latest event')
+    parser.add_argument('--output', default='remaining_time_predictions.csv')
+    args = parser.parse_args()
+
+    for path in (args.train, args.input):
+        if path and not Path(path).exists():
+            print(f"Error: {path} not found.")
+            sys.exit(1)
+
+    if args.train:
+        predictor = RemainingTimePredictor.fit(read_events(args.train), args.min_support)
+        predictor.save(args.model)
+        print(f"Model trained on {args.train} saved to '{args.model}' ({len(predictor.keys)} prefixes)")
+    elif Path(args.model).exists():
+        predictor = RemainingTimePredictor.load(args.model)
+    else:
+        print(f"Error: {args.model} not found; train one with --train.")
+        sys.exit(1)
+
+    if args.input:
+        predictions = predictor.predict(read_events(args.input), args.now)
+        predictions.to_csv(args.output, index=False)
+        print(f"Predictions for {len(predictions)} ids saved to '{args.output}'")
+        print(f"Mean remaining hours: {predictions['remaining_hours'].mean():.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from profiling import stage
+
+CACHE_ENV = 'SEQMODEL_CACHE'
+CACHE_SIZE_ENV = 'SEQMODEL_CACHE_MB'
+DEFAULT_MAX_MB = 2048
+FINGERPRINTS_FILE = 'fingerprints.json'
+HASH_BLOCK_BYTES = 8 * 2**20
+
+_code_version = None
+
+def code_version():
+    """Hash of the source of every module next to this one, computed once per process."""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.blake2b(digest_size=16)
+        for source in sorted(Path(__file__).resolve().parent.glob('*.py')):
+            digest.update(source.name.encode())
+            digest.update(source.read_bytes())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+def hash_file(path):
+    """Return the content hash of a file, read in blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Content-addressed store of intermediate results on disk.
+
+    An entry is keyed by a hash of its stage name, the content of its
+    input files, its parameters and the code version (the sources of this
+    package), so a change to any of them misses instead of returning a
+    stale result. Entries are pickled to <key>.pkl, which loads pandas
+    and numpy data several times faster than parsing it again. A hit
+    refreshes the entry's modification time, and whenever the cache
+    grows past max_bytes, the least recently used entries are deleted.
+
+    Input files are hashed in full the first time they are seen. The hash
+    is remembered against their size and modification time, so unchanged
+    inputs are not read again on later runs.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_MB * 2**20):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        fingerprints_file = self.path / FINGERPRINTS_FILE
+        try:
+            with open(fingerprints_file) as f:
+                self.fingerprints = json.load(f)
+        except (OSError, ValueError):
+            self.fingerprints = {}
+
+    def file_fingerprint(self, path):
+        """Return the content hash of a file, reusing the remembered one while its size and mtime match."""
+        path = Path(path).resolve()
+        info = path.stat()
+        known = self.fingerprints.get(str(path))
+        if known and known['size'] == info.st_size and known['mtime_ns'] == info.st_mtime_ns:
+            return known['hash']
+        with stage('cache.hash', rows=info.st_size):
+            digest = hash_file(path)
+        self.fingerprints[str(path)] = {'size': info.st_size, 'mtime_ns': info.st_mtime_ns, 'hash': digest}
+        self._write_json(self.path / FINGERPRINTS_FILE, self.fingerprints)
+        return digest
+
+    def fingerprint(self, path):
+        """Return the content hash of an input file, or of every file in a directory such as an event store."""
+        path = Path(path)
+        if not path.is_dir():
+            return self.file_fingerprint(path)
+        return {child.name: self.file_fingerprint(child) for child in sorted(path.iterdir()) if child.is_file()}
+
+    def key(self, stage_name, inputs=(), params=None):
+        """Return the cache key of a stage run on the given input files with the given parameters."""
+        description = {
+            'stage': stage_name,
+            'inputs': [self.fingerprint(path) for path in inputs],
+            'params': params or {},
+            'code': code_version(),
+        }
+        return hashlib.blake2b(json.dumps(description, sort_keys=True, default=str).encode(),
+                               digest_size=20).hexdigest()
+
+    def _entry(self, key):
+        return self.path / f"{key}.pkl"
+
+    def _write_json(self, path, value):
+        """Write JSON through a temporary file, so readers never see a partial file."""
+        temp_file = path.with_name(path.name + '.tmp')
+        with open(temp_file, 'w') as f:
+            json.dump(value, f)
+        os.replace(temp_file, path)
+
+    def get(self, key):
+        """Return (True, value) for a cached key, or (False, None) on a miss."""
+        entry = self._entry(key)
+        try:
+            with stage('cache.load', rows=entry.stat().st_size):
+                with open(entry, 'rb') as f:
+                    value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return False, None
+        os.utime(entry)
+        self.hits += 1
+        return True, value
+
+    def put(self, key, value):
+        """Store a value under key, then evict down to max_bytes."""
+        entry = self._entry(key)
+        temp_file = entry.with_name(entry.name + '.tmp')
+        with stage('cache.save'):
+            with open(temp_file, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, entry)
+        self.evict()
+
+    def size(self):
+        """Return the total size of the cached entries in bytes."""
+        return sum(entry.stat().st_size for entry in self.path.glob('*.pkl'))
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = [(entry.stat(), entry) for entry in self.path.glob('*.pkl')]
+        total = sum(info.st_size for info, _ in entries)
+        for info, entry in sorted(entries, key=lambda item: item[0].st_mtime_ns):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= info.st_size
+
+    def clear(self):
+        """Delete every entry and remembered fingerprint."""
+        for entry in self.path.glob('*.pkl'):
+            entry.unlink(missing_ok=True)
+        self.fingerprints = {}
+        (self.path / FINGERPRINTS_FILE).unlink(missing_ok=True)
+
+    def get_or_compute(self, stage_name, inputs, params, compute):
+        """Return the cached result of a stage, or compute and cache it."""
+        key = self.key(stage_name, inputs, params)
+        hit, value = self.get(key)
+        if not hit:
+            value = compute()
+            self.put(key, value)
+        return value
+
+_active = None
+
+def enable(path, max_mb=DEFAULT_MAX_MB):
+    """Start caching stage results in the directory path and return the cache."""
+    global _active
+    _active = ResultCache(path, int(max_mb * 2**20))
+    return _active
+
+def enable_from_env():
+    """Enable caching if SEQMODEL_CACHE names a cache directory (sized by SEQMODEL_CACHE_MB)."""
+    if os.environ.get(CACHE_ENV):
+        enable(os.environ[CACHE_ENV], float(os.environ.get(CACHE_SIZE_ENV, DEFAULT_MAX_MB)))
+
+def disable():
+    """Stop caching and return the cache that was active."""
+    global _active
+    cache, _active = _active, None
+    return cache
+
+def cached(stage_name, inputs, params, compute):
+    """
+    Return compute(), through the active cache when one is enabled.
+
+    inputs are the files the result is derived from. Results derived
+    from anything else, marked by a None input, are always computed.
+    """
+    if _active is None or any(path is None for path in inputs):
+        return compute()
+    return _active.get_or_compute(stage_name, [Path(path) for path in inputs], params, compute)
@@ -1,70 +1,150 @@
+import argparse
 import pandas as pd
+import numpy as np
 from pathlib import Path
 import sys
 from tabulate import tabulate
+from event_stream import DEFAULT_CHUNKSIZE, REQUIRED_COLUMNS, iter_event_batches, read_events
+from profiling import enable_from_env, stage, staged
+import result_cache
 
-def read_events_csv():
+RESULT_COLUMNS = ['id', 'sequence', 'num_events', 'start_date', 'end_date']
+
+def read_events_csv(file_path='random_events.csv'):
     """
-    Read events.csv into a pandas DataFrame.
-    Returns DataFrame with events data sorted by id and date.
+    Read an events CSV file (or event store) into a pandas DataFrame.
+    Returns DataFrame with events data sorted by id and date, from the
+    result cache when one is enabled and the file is unchanged.
     """
     try:
         # Define the file path
-        file_path = Path('random_events.csv')
+        file_path = Path(file_path)
         
         # Check if file exists
         if not file_path.exists():
             print(f"Error: {file_path} not found.")
             sys.exit(1)
             
-        # Read CSV into DataFrame
-        df = pd.read_csv(file_path)
-        
-        # Verify required columns exist
-        required_columns = ['id', 'event', 'date']
-        if not all(col in df.columns for col in required_columns):
-            print(f"Error: CSV must contain columns: {', '.join(required_columns)}")
-            sys.exit(1)
+        def read_sorted():
+            # Read CSV into DataFrame with parsed dates
+            df = read_events(file_path)
             
-        # Convert date to datetime
-        df['date'] = pd.to_datetime(df['date'])
+            # Sort by date and id
+            with stage('events.sort', rows=len(df)):
+                return df.sort_values(['date', 'id'])
         
-        # Sort by date and id
-        df = df.sort_values(['date', 'id'])
-        
-        return df
+        try:
+            return result_cache.cached('events.sorted', [file_path], {}, read_sorted)
+        except pd.errors.EmptyDataError:
+            # An EmptyDataError is also a ValueError, so it is caught first
+            print("Error: The CSV file is empty.")
+            sys.exit(1)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
         
-    except pd.errors.EmptyDataError:
-        print("Error: The CSV file is empty.")
-        sys.exit(1)
     except Exception as e:
         print(f"Error reading CSV file: {e}")
         sys.exit(1)
 
-def create_sequence_results(df):
+def id_date_order(ids, dates):
+    """
+    Return the positions that stably sort events by (id, date).
+    
+    Inputs that are already sorted by date, or by id and date, skip the
+    full two-key sort.
+    """
+    if len(ids) == 0:
+        return np.arange(0)
+    same_id = ids[1:] == ids[:-1]
+    if (ids[1:] >= ids[:-1]).all() and (dates[1:] >= dates[:-1])[same_id].all():
+        return np.arange(len(ids))
+    if (dates[1:] >= dates[:-1]).all():
+        return np.argsort(ids, kind='stable')
+    order = np.argsort(dates, kind='stable')
+    return order[np.argsort(ids[order], kind='stable')]
+
+def format_days(dates):
+    """Format datetime64 values as 'YYYY-MM-DD' strings, one conversion per distinct day."""
+    days, inverse = np.unique(dates.astype('datetime64[D]'), return_inverse=True)
+    return days.astype(str)[inverse]
+
+def factorize_keys(df, columns):
+    """
+    Number the distinct combinations of df[columns] in one hashed scan.
+    
+    Returns (codes, keys): codes gives every row the number of its
+    combination, in order of first appearance, and keys holds one row per
+    combination. Missing values count as a value of their own.
+    """
+    codes = df.groupby(list(columns), sort=False, dropna=False).ngroup().to_numpy()
+    _, first_positions = np.unique(codes, return_index=True)
+    return codes, df[list(columns)].iloc[first_positions].reset_index(drop=True)
+
+@staged('sequences.build', rows=lambda result, df, *args, **kwargs: len(df))
+def build_sequences(df, group_by=()):
+    """
+    Build the sequence of every ID in one sorted scan.
+    
+    Returns a SequenceTable with one row per ID, ordered by ID, holding
+    the events as integer codes rather than strings. Each column in
+    group_by (such as office or case type) is taken from the first event
+    of the ID.
+    """
+    # Imported here because sequence_table builds on this module
+    from sequence_table import SequenceTable
+    return SequenceTable.from_events(df, group_by)
+
+def create_sequence_results(df, group_by=()):
     """
     Create a DataFrame with sequence results for each ID.
     """
-    results = []
-    for id_val in sorted(df['id'].unique()):
-        events = df[df['id'] == id_val].sort_values('date')
-        sequence = " → ".join(events['event'])
-        start_date = events['date'].min().strftime('%Y-%m-%d')
-        end_date = events['date'].max().strftime('%Y-%m-%d')
-        
-        results.append({
-            'id': id_val,
-            'sequence': sequence,
-            'num_events': len(events),
-            'start_date': start_date,
-            'end_date': end_date
-        })
+    table = build_sequences(df, group_by)
+    with stage('sequences.decode', rows=len(table)):
+        return table.to_results()
+
+def iter_sequence_results(file_path, chunksize=DEFAULT_CHUNKSIZE, group_by=(), window=None):
+    """
+    Yield sequence results for an id-sorted event file, one batch at a time.
+    
+    Only about chunksize events are held in memory at once, and ids that
+    straddle a chunk boundary are completed before they are emitted. With
+    window, a (start, end) pair, only the ids that started in it are kept.
+    Rows are labelled by their position in the whole output, as a chunked
+    read of the results file would label them.
+    """
+    num_ids = 0
+    for batch in iter_event_batches(file_path, chunksize, REQUIRED_COLUMNS + list(group_by)):
+        table = build_sequences(batch, group_by)
+        if window is not None:
+            table = table.take(table.starting(*window))
+        with stage('sequences.decode', rows=len(table)):
+            results_df = table.to_results()
+        results_df.index = pd.RangeIndex(num_ids, num_ids + len(results_df))
+        num_ids += len(results_df)
+        yield results_df
+
+def write_sequence_results(file_path, output_file='results_id_seq.csv', chunksize=DEFAULT_CHUNKSIZE, group_by=(),
+                           window=None):
+    """
+    Stream sequence results for an id-sorted event file to output_file.
     
-    return pd.DataFrame(results)
+    Each batch is yielded once it is written, so callers can analyze the
+    sequences in the same pass.
+    """
+    written = False
+    for results_df in iter_sequence_results(file_path, chunksize, group_by, window):
+        results_df.to_csv(output_file, mode='a' if written else 'w', header=not written, index=False)
+        written = True
+        yield results_df
+    if not written:
+        pd.DataFrame(columns=RESULT_COLUMNS + list(group_by)).to_csv(output_file, index=False)
 
-def display_event_sequence(df):
+@staged('events.display', rows=lambda result, df, *args, **kwargs: len(df))
+def display_event_sequence(df, results_df=None, summary_only=False):
     """
     Display events in a formatted table, ordered by date.
+    With summary_only, only the summary section is printed.
     """
     # Create a summary section
     print("\nEvent Sequence Summary:")
@@ -72,6 +152,8 @@ def display_event_sequence(df):
     print(f"Total events: {len(df)}")
     print(f"Date range: {df['date'].min().strftime('%Y-%m-%d')} to {df['date'].max().strftime('%Y-%m-%d')}")
     print(f"Number of unique IDs: {df['id'].nunique()}")
+    if summary_only:
+        return
     
     # Prepare data for tabulate
     # Format date column to be more readable
@@ -87,25 +169,50 @@ def display_event_sequence(df):
         showindex=False
     ))
     
-    # Display sequence by ID
+    # Display sequence by ID, reusing the sequences when already built
+    if results_df is None:
+        results_df = create_sequence_results(df)
     print("\nEvent Sequences by ID:")
     print("-" * 50)
-    for id_val in sorted(df['id'].unique()):
-        events = df[df['id'] == id_val].sort_values('date')
+    for id_val, sequence in zip(results_df['id'], results_df['sequence']):
         print(f"\nID: {id_val}")
-        sequence = " → ".join(events['event'])
         print(f"Sequence: {sequence}")
 
 def main():
+    parser = argparse.ArgumentParser(description='Build the event sequence of every id.')
+    parser.add_argument('--chunksize', type=int,
+                        help=f'Stream an id-sorted events file in chunks (e.g. {DEFAULT_CHUNKSIZE}) instead of reading it whole')
+    args = parser.parse_args()
+    enable_from_env()
+    result_cache.enable_from_env()
+    events_file = 'random_events.csv'
+    
+    if args.chunksize:
+        # Write each batch as it is built, without the full tables
+        if not Path(events_file).exists():
+            print(f"Error: {events_file} not found.")
+            sys.exit(1)
+        try:
+            num_ids = sum(len(results_df) for results_df in
+                          write_sequence_results(events_file, 'results_id_seq.csv', args.chunksize))
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"\nSequence results for {num_ids} IDs saved to 'results_id_seq.csv'")
+        return
+    
     # Read the CSV file
-    df = read_events_csv()
+    df = read_events_csv(events_file)
+    
+    # Build every sequence once, or reuse them while the events are unchanged
+    results_df = result_cache.cached('sequences.results', [events_file], {}, lambda: create_sequence_results(df))
     
     # Display formatted event sequence
-    display_event_sequence(df)
+    display_event_sequence(df, results_df)
     
-    # Create and save sequence results
-    results_df = create_sequence_results(df)
-    results_df.to_csv('results_id_seq.csv', index=False)
+    # Save sequence results
+    with stage('sequences.save', rows=len(results_df)):
+        results_df.to_csv('results_id_seq.csv', index=False)
     print("\nSequence results saved to 'results_id_seq.csv'")
     
     # Display the contents of the results file
@@ -0,0 +1,546 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import pandas as pd
+import profiling
+import result_cache
+from datetime import datetime
+from pathlib import Path
+from analyze_sequences import IDS_FORMATS, SequenceAnalyzer
+from analyze_sequences_paths import PathTimingAnalyzer
+from anomaly_detector import DETECTION_METHODS, DEFAULT_MAX_OPEN_IDS, display_alert_summary, load_detector, write_alerts
+from event_store import is_event_store
+from event_stream import DEFAULT_CHUNKSIZE, REQUIRED_COLUMNS, read_events
+from generator_random_events import PatternedPathGenerator
+from ingest_server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_SNAPSHOT_SECONDS, IngestionService, run_load
+from hop_stats import DEFAULT_PERCENTILES, HopStats
+from process_graph import ProcessGraph, display_graph, load_path_stats
+from remaining_time import DEFAULT_MIN_SUPPORT, RemainingTimePredictor
+from seq_read_csv import build_sequences, display_event_sequence, iter_sequence_results, write_sequence_results
+from sequence_clustering import DEFAULT_DURATION_TOLERANCE, SequenceClusterer, display_clusters, run_clustering
+from sequence_index import SequenceIndex, display_queries
+from sequence_path_generator import TIMELINE_MODES, plot_events_timeline, read_events_csv
+from time_index import WindowedEvents, to_datetime64
+from transition_model import TransitionModel, display_model
+
+def check_input(parser, path):
+    """Exit with a usage error if an input file or event store is missing."""
+    if not Path(path).exists():
+        parser.error(f"{path} not found")
+
+def read_input_events(parser, path, group_by=()):
+    """Read an events file or event store, with a usage error if it lacks a needed column."""
+    check_input(parser, path)
+    try:
+        return read_events(path, REQUIRED_COLUMNS + list(group_by))
+    except ValueError as e:
+        parser.error(str(e))
+
+def read_window_events(parser, path, window, group_by=()):
+    """Read the events of the ids that started in window, through the time index of the input."""
+    check_input(parser, path)
+    try:
+        return WindowedEvents(path, REQUIRED_COLUMNS + list(group_by)).starting(*window)
+    except ValueError as e:
+        parser.error(str(e))
+
+def parse_window(parser, args):
+    """
+    Check the window options and return the --start/--end window, or None.
+    
+    With --window the bounds only limit the range the rolling windows
+    cover, so the analyzers get no single window.
+    """
+    if args.step is not None and args.window is None:
+        parser.error("--step requires --window")
+    if args.window is not None and args.window <= pd.Timedelta(0):
+        parser.error("--window must be positive")
+    if args.step is not None and args.step <= pd.Timedelta(0):
+        parser.error("--step must be positive")
+    if args.start is not None and args.end is not None and args.end <= args.start:
+        parser.error("--end must be after --start")
+    if args.start is None and args.end is None:
+        return None
+    return args.start, args.end
+
+def make_generator(args):
+    """Build a PatternedPathGenerator from the generator options in args."""
+    return PatternedPathGenerator(
+        num_ids=args.num_ids,
+        num_patterns=args.num_patterns,
+        min_hops=args.min_hops,
+        max_hops=args.max_hops,
+        start_date=datetime.fromisoformat(args.start_date),
+        seed=args.seed
+    )
+
+def generate_events(args):
+    """Generate patterned events in memory with the generator options in args."""
+    generator = make_generator(args)
+    return generator, generator.generate_all_paths_vectorized(args.block_size)
+
+def save_sequence_table(table, output_file):
+    """Save per-id sequences as a SequenceTable .npz, or decoded in the results_id_seq.csv layout."""
+    if output_file.endswith('.npz'):
+        table.save(output_file)
+    else:
+        table.to_results().to_csv(output_file, index=False)
+    print(f"\nSequence results saved to '{output_file}'")
+
+def analyze_sequence_table(table, args):
+    """Count unique sequences of an in-memory SequenceTable, per rolling window with --window, and save them."""
+    analyzer = SequenceAnalyzer(group_by=args.group_by)
+    analyzer.table = table
+    if args.window is not None:
+        analyzer.analyze_windows(args.window, args.step, args.start, args.end, args.ids_format)
+    else:
+        analyzer.analyze_sequences(args.ids_format, workers=args.workers)
+    analyzer.display_results(summary_only=args.summary_only)
+    analyzer.save_analysis(args.sequence_output)
+
+def analyze_sequence_stream(parser, args, window):
+    """
+    Count unique sequences of an id-sorted events file streamed in chunks of --chunksize rows, and save them.
+    
+    The per-id sequences are written to --results-output batch by batch
+    as they are counted, so neither the events nor the sequences are held
+    whole.
+    """
+    check_input(parser, args.events)
+    if args.results_output and args.results_output.endswith('.npz'):
+        parser.error("--chunksize saves --results-output in the results_id_seq.csv layout, not as .npz")
+    if args.results_output:
+        results = write_sequence_results(args.events, args.results_output, args.chunksize, args.group_by, window)
+    else:
+        results = iter_sequence_results(args.events, args.chunksize, args.group_by, window)
+    analyzer = SequenceAnalyzer(group_by=args.group_by)
+    try:
+        analyzer.analyze_sequence_chunks(results, args.ids_format)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.results_output:
+        print(f"\nSequence results saved to '{args.results_output}'")
+    analyzer.display_results(summary_only=args.summary_only)
+    analyzer.save_analysis(args.sequence_output)
+
+def analyze_paths(analyzer, args):
+    """Summarize the path segments of a loaded PathTimingAnalyzer and save them."""
+    percentiles = DEFAULT_PERCENTILES if args.percentiles else ()
+    if args.window is not None:
+        stats = analyzer.analyze_windows(args.window, args.step, args.start, args.end, percentiles)
+    elif args.workers > 1:
+        stats = analyzer.analyze_path_segments_parallel(args.workers, percentiles)
+    elif args.percentiles:
+        # Percentiles come from the hop sketches, fed from the loaded events
+        analyzer.calculate_path_timings()
+        stats = HopStats(group_by=analyzer.group_by).update(analyzer.path_timings).summary(percentiles)
+    else:
+        analyzer.calculate_path_timings()
+        stats = analyzer.analyze_path_segments()
+    analyzer.display_summary(stats)
+    analyzer.save_results(stats, args.paths_output, show_sample=not args.summary_only)
+
+def cmd_generate(args, parser):
+    generator = make_generator(args)
+    # Blocks are streamed to disk, so the full log is never held in memory
+    if args.store:
+        num_events = len(generator.write_event_store(args.output, args.block_size))
+        print(f"\nData saved to event store {args.output}")
+    else:
+        num_events = generator.write_csv(args.output, args.block_size)
+        print(f"\nData saved to {args.output}")
+    print(f"Total events generated: {num_events}")
+    generator.display_patterns()
+
+def cmd_sequences(args, parser):
+    window = parse_window(parser, args)
+    if args.chunksize and args.window is not None:
+        parser.error("--window cannot be combined with --chunksize")
+    if args.events and args.chunksize:
+        analyze_sequence_stream(parser, args, window)
+        return
+    if args.events:
+        # Build the sequences in-process instead of reading results_id_seq.csv
+        table_window = window if args.window is None else None
+        def build():
+            if table_window is not None:
+                return build_sequences(read_window_events(parser, args.events, table_window, args.group_by),
+                                       args.group_by)
+            return build_sequences(read_input_events(parser, args.events, args.group_by), args.group_by)
+        check_input(parser, args.events)
+        table = result_cache.cached('sequences.table', [args.events],
+                                    {'group_by': args.group_by, 'window': table_window}, build)
+        if args.results_output:
+            save_sequence_table(table, args.results_output)
+        analyze_sequence_table(table, args)
+        return
+
+    check_input(parser, args.input)
+    analyzer = SequenceAnalyzer(args.input, args.group_by, window if args.window is None else None)
+    if args.chunksize:
+        analyzer.analyze_sequences_chunked(args.chunksize, args.ids_format)
+    elif args.window is not None:
+        analyzer.read_sequences()
+        try:
+            analyzer.analyze_windows(args.window, args.step, args.start, args.end, args.ids_format)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        # With workers, an event store is mapped and sequenced by each worker instead
+        if not (args.workers > 1 and is_event_store(args.input)):
+            analyzer.read_sequences()
+        analyzer.analyze_sequences(args.ids_format, workers=args.workers)
+    analyzer.display_results(summary_only=args.summary_only)
+    analyzer.save_analysis(args.sequence_output)
+
+def cmd_paths(args, parser):
+    window = parse_window(parser, args)
+    check_input(parser, args.input)
+    if args.chunksize and args.window is not None:
+        parser.error("--window cannot be combined with --chunksize")
+    analyzer = PathTimingAnalyzer(args.input, args.group_by, window if args.window is None else None)
+    if args.window is not None:
+        # Every window reads its own events through the time index
+        analyze_paths(analyzer, args)
+        return
+    if args.chunksize:
+        # Stream an id-sorted file through the hop accumulators
+        stats = analyzer.accumulate_path_segments(args.chunksize)
+        analyzer.display_summary(stats)
+        analyzer.save_results(stats, args.paths_output, show_sample=not args.summary_only)
+        return
+    if not analyzer.read_data():
+        sys.exit(1)
+    analyze_paths(analyzer, args)
+
+def cmd_query(args, parser):
+    check_input(parser, args.input)
+    index = SequenceIndex.from_file(args.input)
+    display_queries(index, args.prefix, args.contains, args.ngram, args.top)
+
+def cmd_transitions(args, parser):
+    check_input(parser, args.input)
+    model = TransitionModel.from_events(read_events(args.input))
+    unknown = [target for target in args.target if target not in model.events]
+    if unknown:
+        parser.error(f"unknown target event: {', '.join(unknown)}")
+    display_model(model, args.target)
+    if args.output:
+        model.save(args.output)
+        print(f"\nModel saved to '{args.output}'")
+
+def cmd_graph(args, parser):
+    check_input(parser, args.input)
+    try:
+        process_graph = ProcessGraph.from_stats(load_path_stats(args.input, args.workers, args.chunksize))
+        display_graph(process_graph, args.top, args.route, args.weight)
+        if args.output:
+            process_graph.save(args.output)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output:
+        print(f"\nGraph saved to '{args.output}'")
+
+def cmd_predict(args, parser):
+    if args.train:
+        check_input(parser, args.train)
+        predictor = RemainingTimePredictor.fit(read_events(args.train), args.min_support)
+        predictor.save(args.model)
+        print(f"Model trained on {args.train} saved to '{args.model}' ({len(predictor.keys)} prefixes)")
+    else:
+        check_input(parser, args.model)
+        predictor = RemainingTimePredictor.load(args.model)
+
+    if args.input:
+        check_input(parser, args.input)
+        predictions = predictor.predict(read_events(args.input), args.now)
+        predictions.to_csv(args.output, index=False)
+        print(f"Predictions for {len(predictions)} ids saved to '{args.output}'")
+        print(f"Mean remaining hours: {predictions['remaining_hours'].mean():.2f}")
+
+def cmd_cluster(args, parser):
+    check_input(parser, args.input)
+    clusterer = SequenceClusterer(args.max_distance, duration_tolerance=args.duration_tolerance)
+    clusters, assignments, scores = run_clustering(args.input, clusterer)
+    display_clusters(clusters, top=args.top, scores=scores)
+    assignments.to_csv(args.output, index=False)
+    print(f"\nCluster assignments saved to '{args.output}'")
+
+def cmd_anomalies(args, parser):
+    check_input(parser, args.baseline)
+    if args.input != '-':
+        check_input(parser, args.input)
+    try:
+        detector = load_detector(args.baseline, args.method, args.threshold, args.quantile,
+                                 max_open_ids=args.max_open_ids, final_events=args.final_event)
+        write_alerts(detector, args.input, args.output)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output != '-':
+        print(f"Alerts saved to '{args.output}'")
+        display_alert_summary(detector)
+
+def cmd_serve(args, parser):
+    try:
+        asyncio.run(IngestionService(args.state, args.snapshot_seconds).serve(args.host, args.port))
+    except OSError as e:
+        parser.exit(1, f"Error: {e}\n")
+
+def cmd_loadgen(args, parser):
+    try:
+        result = asyncio.run(run_load(args.host, args.port, args.num_ids, args.num_patterns, args.batch_size,
+                                      args.connections, args.seed))
+    except (OSError, RuntimeError) as e:
+        parser.exit(1, f"Error: {e}\n")
+    print(json.dumps(result, indent=2))
+
+def cmd_timeline(args, parser):
+    check_input(parser, args.input)
+    if args.summary_only:
+        df = read_events(args.input).sort_values(['id', 'date'])
+    else:
+        df = read_events_csv(args.input)
+    if df is not None:
+        plot_events_timeline(df, args.output, args.mode, args.sample, args.id_range)
+
+def cmd_pipeline(args, parser):
+    window = parse_window(parser, args)
+    if args.chunksize:
+        if not args.events:
+            parser.error("--chunksize requires --events")
+        if args.window is not None:
+            parser.error("--window cannot be combined with --chunksize")
+        # Both stages stream the id-sorted file, so the events are never loaded whole
+        analyze_sequence_stream(parser, args, window)
+        analyzer = PathTimingAnalyzer(args.events, args.group_by, window)
+        try:
+            stats = analyzer.accumulate_path_segments(args.chunksize)
+        except ValueError as e:
+            parser.error(str(e))
+        analyzer.display_summary(stats)
+        analyzer.save_results(stats, args.paths_output, show_sample=not args.summary_only)
+        return
+    if args.events:
+        events = read_input_events(parser, args.events, args.group_by)
+    else:
+        generator, events = generate_events(args)
+        events['date'] = pd.to_datetime(events['date'], format='ISO8601')
+        generator.display_summary(events)
+
+    # Every stage works on the frames already in memory
+    if args.group_by and not set(args.group_by) <= set(events.columns):
+        parser.error(f"The generated events have no column(s): {', '.join(args.group_by)}")
+    table_window = window if args.window is None else None
+    def build():
+        if table_window is not None:
+            return build_sequences(WindowedEvents(events).starting(*table_window), args.group_by)
+        return build_sequences(events, args.group_by)
+    # Generated events have no input file to key a cached table on
+    table = result_cache.cached('sequences.table', [args.events],
+                                {'group_by': args.group_by, 'window': table_window}, build)
+    display_event_sequence(events, None if args.summary_only else table.to_results(), summary_only=args.summary_only)
+    if args.results_output:
+        save_sequence_table(table, args.results_output)
+    analyze_sequence_table(table, args)
+
+    analyzer = PathTimingAnalyzer(group_by=args.group_by, window=table_window)
+    analyzer.df = events
+    analyzer.source_file = args.events
+    analyze_paths(analyzer, args)
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    output = common.add_mutually_exclusive_group()
+    output.add_argument('--quiet', action='store_true', help='Print nothing except errors')
+    output.add_argument('--summary-only', action='store_true',
+                        help='Print summaries but not the full per-row tables')
+    common.add_argument('--profile', metavar='REPORT',
+                        help='Write per-stage time, rows/sec and peak RSS to this JSON file')
+    common.add_argument('--cprofile-dir', help='Also dump cProfile stats of every top-level stage here')
+    common.add_argument('--slow-stage', type=float, metavar='SECONDS', help='Warn on stages slower than this')
+    common.add_argument('--cache', metavar='DIR',
+                        help='Reuse parsed events, sequences and hop timings cached here while inputs are unchanged')
+    common.add_argument('--cache-size', type=float, default=result_cache.DEFAULT_MAX_MB, metavar='MB',
+                        help='Evict least recently used cache entries beyond this size')
+
+    generator_options = argparse.ArgumentParser(add_help=False)
+    generator_options.add_argument('--num-ids', type=int, default=1000)
+    generator_options.add_argument('--num-patterns', type=int, default=1)
+    generator_options.add_argument('--min-hops', type=int, default=3)
+    generator_options.add_argument('--max-hops', type=int, default=10)
+    generator_options.add_argument('--start-date', default='2024-01-01', help='YYYY-MM-DD')
+    generator_options.add_argument('--seed', type=int, help='Seed for reproducible output')
+    generator_options.add_argument('--block-size', type=int, default=100_000, help='Ids generated per block')
+
+    sequence_options = argparse.ArgumentParser(add_help=False)
+    sequence_options.add_argument('--sequence-output', default='sequence_analysis.csv')
+    sequence_options.add_argument('--results-output',
+                                  help='Also save per-id sequences (results_id_seq.csv layout, or compact .npz)')
+    sequence_options.add_argument('--ids-format', choices=IDS_FORMATS, default='list')
+    sequence_options.add_argument('--workers', type=int, default=1, help='Worker processes to shard across')
+    sequence_options.add_argument('--group-by', nargs='+', default=[], metavar='COLUMN',
+                                  help='Break the results down by these event columns (e.g. office type)')
+
+    path_options = argparse.ArgumentParser(add_help=False)
+    path_options.add_argument('--paths-output', default='sequence_analysis_paths.csv')
+    path_options.add_argument('--percentiles', action='store_true', help='Add p50/p90/p99 hop durations')
+
+    window_options = argparse.ArgumentParser(add_help=False)
+    window_options.add_argument('--start', type=to_datetime64, metavar='DATE',
+                                help='Only ids (sequences) or hops (paths) that start on or after this date')
+    window_options.add_argument('--end', type=to_datetime64, metavar='DATE', help='... and before this date')
+    window_options.add_argument('--window', type=pd.Timedelta, metavar='SIZE',
+                                help='Analyze rolling windows of this length (e.g. 30D) between --start and --end')
+    window_options.add_argument('--step', type=pd.Timedelta, metavar='SIZE',
+                                help='Start a window this often (default: back to back)')
+
+    parser = argparse.ArgumentParser(prog='seqmodel', description='Sequence modeling pipeline.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', parents=[common, generator_options],
+                                     help='Generate patterned synthetic events')
+    generate.add_argument('--output', default='patterned_events.csv')
+    generate.add_argument('--store', action='store_true', help='Write --output as an event store directory')
+    generate.set_defaults(func=cmd_generate)
+
+    sequences = subparsers.add_parser('sequences', parents=[common, sequence_options, window_options],
+                                      help='Count unique sequences')
+    source = sequences.add_mutually_exclusive_group()
+    source.add_argument('--input', default='results_id_seq.csv', help='Per-id sequence file, .npz sequence table or event store')
+    source.add_argument('--events', help='Build the sequences from this events file instead')
+    sequences.add_argument('--chunksize', type=int,
+                           help='Read --input, or stream an id-sorted --events file, in chunks of this many rows')
+    sequences.set_defaults(func=cmd_sequences)
+
+    paths = subparsers.add_parser('paths', parents=[common, path_options, window_options], help='Summarize hop durations')
+    paths.add_argument('--input', default='patterned_events.csv', help='Events file or event store')
+    paths.add_argument('--workers', type=int, default=1, help='Worker processes to shard across')
+    paths.add_argument('--group-by', nargs='+', default=[], metavar='COLUMN',
+                       help='Break the results down by these event columns (e.g. office type)')
+    paths.add_argument('--chunksize', type=int,
+                       help=f'Stream an id-sorted input in chunks (e.g. {DEFAULT_CHUNKSIZE}), with percentiles')
+    paths.set_defaults(func=cmd_paths)
+
+    query = subparsers.add_parser('query', parents=[common], help='Query prefix and sub-path frequencies')
+    query.add_argument('--input', default='results_id_seq.csv', help='Per-id sequence file, events file or event store')
+    query.add_argument('--prefix', action='append', default=[], help="Count ids starting with a path, e.g. 'A → B'")
+    query.add_argument('--contains', action='append', default=[], help='Count occurrences of a sub-path')
+    query.add_argument('--ngram', type=int, default=2, help='Length of the frequent sub-paths to list')
+    query.add_argument('--top', type=int, default=10, help='Number of frequent sub-paths to list (0 for none)')
+    query.set_defaults(func=cmd_query)
+
+    transitions = subparsers.add_parser('transitions', parents=[common],
+                                        help='Markov transition model with expected times to target events')
+    transitions.add_argument('--input', default='patterned_events.csv', help='Events file or event store')
+    transitions.add_argument('--target', action='append', default=[], help='Event to report expected times to')
+    transitions.add_argument('--output', help='Save the model matrices to this .npz file')
+    transitions.set_defaults(func=cmd_transitions)
+
+    graph = subparsers.add_parser('graph', parents=[common],
+                                  help='Process graph of the hops with bottlenecks and expected-time paths')
+    graph.add_argument('--input', default='patterned_events.csv',
+                       help='Events file, event store or saved path analysis CSV')
+    graph.add_argument('--workers', type=int, default=1, help='Worker processes to shard the hop statistics across')
+    graph.add_argument('--chunksize', type=int, help='Stream an id-sorted input in chunks of this many rows')
+    graph.add_argument('--route', nargs=2, action='append', default=[], metavar=('SOURCE', 'TARGET'),
+                       help='Report the shortest and critical expected-time paths between two events')
+    graph.add_argument('--weight', default='avg_hours', help='Edge duration to use, e.g. avg_hours or p90_hours')
+    graph.add_argument('--top', type=int, default=10, help='Bottlenecks to list')
+    graph.add_argument('--output', help='Save the graph to this .graphml or .json file')
+    graph.set_defaults(func=cmd_graph)
+
+    predict = subparsers.add_parser('predict', parents=[common], help='Train or apply the remaining-time predictor')
+    predict.add_argument('--train', help='Completed events to train on (otherwise --model is loaded)')
+    predict.add_argument('--model', default='remaining_time.npz', help='Model file to write or read')
+    predict.add_argument('--min-support', type=int, default=DEFAULT_MIN_SUPPORT,
+                         help='Ids a prefix needs before its own mean is used')
+    predict.add_argument('--input', help='Events of the in-flight ids to score')
+    predict.add_argument('--now', help="Current time (ISO format); defaults to each id's latest event")
+    predict.add_argument('--output', default='remaining_time_predictions.csv')
+    predict.set_defaults(func=cmd_predict)
+
+    cluster = subparsers.add_parser('cluster', parents=[common], help='Group near-identical sequences')
+    cluster.add_argument('--input', default='patterned_events.csv', help='Events file, event store or results_id_seq.csv')
+    cluster.add_argument('--max-distance', type=int, default=1, help='Edits allowed between a sequence and its cluster center')
+    cluster.add_argument('--duration-tolerance', type=float, default=DEFAULT_DURATION_TOLERANCE,
+                         help='Largest gap between the mean durations of linked sequences, as a share of the longer one')
+    cluster.add_argument('--top', type=int, default=20, help='Largest clusters to print')
+    cluster.add_argument('--output', default='sequence_clusters.csv', help='Per-id cluster assignments')
+    cluster.set_defaults(func=cmd_cluster)
+
+    anomalies = subparsers.add_parser('anomalies', parents=[common], help='Flag slow, unseen and stalled hops in a stream')
+    anomalies.add_argument('--baseline', default='sequence_analysis_paths.csv',
+                           help='Path analysis CSV, or an events file or event store to learn hop durations from')
+    anomalies.add_argument('--input', default='-', help="Id,event,date stream to score ('-' for stdin)")
+    anomalies.add_argument('--method', choices=DETECTION_METHODS, default='zscore')
+    anomalies.add_argument('--threshold', type=float, default=3.0, help='Z-score beyond which a hop is flagged')
+    anomalies.add_argument('--quantile', type=float, default=99, help='Percentile used as the upper limit with --method quantile')
+    anomalies.add_argument('--max-open-ids', type=int, default=DEFAULT_MAX_OPEN_IDS, help='Open ids kept in memory')
+    anomalies.add_argument('--final-event', action='append', default=[], help='Event after which an id is closed')
+    anomalies.add_argument('--output', default='anomalies.csv', help="Alert CSV ('-' for stdout)")
+    anomalies.set_defaults(func=cmd_anomalies)
+
+    server_options = argparse.ArgumentParser(add_help=False)
+    server_options.add_argument('--host', default=DEFAULT_HOST)
+    server_options.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    serve = subparsers.add_parser('serve', parents=[common, server_options],
+                                  help='Run the live ingestion server (POST /events, GET /sequences/top, /hops, /ids/<id>)')
+    serve.add_argument('--state', default='ingest_state.pkl', help='Snapshot file, loaded at start if present')
+    serve.add_argument('--snapshot-seconds', type=float, default=DEFAULT_SNAPSHOT_SECONDS)
+    serve.set_defaults(func=cmd_serve)
+
+    loadgen = subparsers.add_parser('loadgen', parents=[common, server_options],
+                                    help='Feed generated events to a running server and time it')
+    loadgen.add_argument('--num-ids', type=int, default=10_000)
+    loadgen.add_argument('--num-patterns', type=int, default=10)
+    loadgen.add_argument('--seed', type=int, help='Seed for reproducible output')
+    loadgen.add_argument('--batch-size', type=int, default=1_000, help='Events per request')
+    loadgen.add_argument('--connections', type=int, default=4, help='Concurrent connections')
+    loadgen.set_defaults(func=cmd_loadgen)
+
+    timeline = subparsers.add_parser('timeline', parents=[common], help='Plot an events timeline')
+    timeline.add_argument('--input', default='events.csv', help='Events file or event store')
+    timeline.add_argument('--output', help='Render to this image file (.png, .svg, ...) instead of a window')
+    timeline.add_argument('--mode', choices=TIMELINE_MODES, default='auto',
+                          help='detail: per-id labels; scatter: one layer coloured by event; density: heatmap')
+    timeline.add_argument('--sample', type=int, help='Plot a random sample of this many ids')
+    timeline.add_argument('--id-range', type=int, nargs=2, metavar=('FIRST', 'LAST'), help='Plot only ids in this range')
+    timeline.set_defaults(func=cmd_timeline)
+
+    pipeline = subparsers.add_parser('pipeline', parents=[common, generator_options, sequence_options, path_options, window_options],
+                                     help='Run sequences and paths in one process, without intermediate files')
+    pipeline.add_argument('--events', help='Events file or event store (default: generate events)')
+    pipeline.add_argument('--chunksize', type=int,
+                          help=f'Stream an id-sorted --events file in chunks (e.g. {DEFAULT_CHUNKSIZE}), with percentiles')
+    pipeline.set_defaults(func=cmd_pipeline)
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # Nothing is shown with --quiet, so skip rendering the full tables
+    args.summary_only = args.summary_only or args.quiet
+    if args.profile or args.cprofile_dir or args.slow_stage is not None:
+        hooks = [profiling.slow_stage_hook(args.slow_stage)] if args.slow_stage is not None else []
+        profiling.enable(hooks=hooks, cprofile_dir=args.cprofile_dir)
+    if args.cache:
+        result_cache.enable(args.cache, args.cache_size)
+    try:
+        if args.quiet:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                args.func(args, parser)
+        else:
+            args.func(args, parser)
+    finally:
+        profiling.finish(args.profile)
+        cache = result_cache.disable()
+        if cache is not None:
+            print(f"Result cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from tabulate import tabulate
+from event_stream import read_events
+from seq_read_csv import create_sequence_results
+from sequence_table import SEPARATOR
+
+# A 31-bit prime keeps a * x + b below 2**63, so hashing never overflows uint64
+MERSENNE_PRIME = (1 << 31) - 1
+# Largest gap between the mean durations of linked sequences, as a share of the longer one
+DEFAULT_DURATION_TOLERANCE = 0.5
+
+def encode_sequences(sequences):
+    """
+    Turn ' → '-joined sequences into a padded code matrix.
+
+    Returns (codes, lengths, vocabulary); row i holds the event codes of
+    sequences[i] followed by -1 padding.
+    """
+    events = pd.Series(sequences).str.split(SEPARATOR).explode()
+    flat, vocabulary = pd.factorize(events.to_numpy(), sort=True)
+    lengths = np.bincount(pd.factorize(events.index)[0], minlength=len(sequences)) if len(events) else np.zeros(0, int)
+    positions = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    codes = np.full((len(sequences), lengths.max() if len(lengths) else 0), -1, dtype=np.int64)
+    codes[np.repeat(np.arange(len(sequences)), lengths), positions] = flat
+    return codes, lengths, np.asarray(vocabulary)
+
+def banded_levenshtein(a, a_lengths, b, b_lengths, max_distance):
+    """
+    Edit distance between rows a[p] and b[p] of two padded code matrices,
+    for every pair p at once.
+
+    Only the diagonal band of width max_distance is filled, since no
+    alignment leaving it can cost max_distance or less; distances above
+    max_distance are returned as max_distance + 1.
+    """
+    limit = max_distance + 1
+    num_pairs, width = a.shape[0], max(a.shape[1], b.shape[1])
+    a = np.pad(a, ((0, 0), (0, width - a.shape[1])), constant_values=-1)
+    b = np.pad(b, ((0, 0), (0, width - b.shape[1])), constant_values=-1)
+    distances = np.full(num_pairs, limit, dtype=np.int64)
+    rows = np.arange(num_pairs)
+
+    # Cells never exceed limit, so small integers keep the passes cheap
+    previous = np.minimum(np.broadcast_to(np.arange(width + 1, dtype=np.int16), (num_pairs, width + 1)), limit)
+    done = a_lengths == 0
+    distances[done] = np.minimum(b_lengths[done], limit)
+    for i in range(1, width + 1):
+        current = np.full((num_pairs, width + 1), limit, dtype=np.int16)
+        current[:, 0] = min(i, limit)
+        for j in range(max(1, i - max_distance), min(width, i + max_distance) + 1):
+            cost = (a[:, i - 1] != b[:, j - 1]).astype(np.int16)
+            current[:, j] = np.minimum(np.minimum(previous[:, j] + 1, current[:, j - 1] + 1),
+                                       previous[:, j - 1] + cost)
+        current = np.minimum(current, limit)
+        finished = a_lengths == i
+        distances[finished] = current[rows[finished], b_lengths[finished]]
+        previous = current
+    return distances
+
+def leader_clusters(num_nodes, left, right, distances):
+    """
+    Assign nodes 0..num_nodes-1, in order, to leaders.
+
+    Node j joins the closest earlier leader it has an edge to (ties go to
+    the earlier leader) and becomes a leader itself if it has none. Every
+    node is therefore within one edge of its leader, and clusters never
+    chain through intermediate nodes. Returns each node's leader.
+    """
+    # Edges point from the later node to the earlier one, closest first
+    later, earlier = np.maximum(left, right), np.minimum(left, right)
+    order = np.lexsort((earlier, distances, later))
+    earlier = earlier[order]
+    bounds = np.searchsorted(later[order], np.arange(num_nodes + 1))
+
+    leaders = np.arange(num_nodes)
+    is_leader = np.zeros(num_nodes, dtype=bool)
+    for node in range(num_nodes):
+        candidates = earlier[bounds[node]:bounds[node + 1]]
+        candidates = candidates[is_leader[candidates]]
+        if len(candidates):
+            leaders[node] = candidates[0]
+        else:
+            is_leader[node] = True
+    return leaders
+
+class SequenceClusterer:
+    """
+    Groups near-identical sequences without comparing all pairs.
+
+    Each unique sequence is reduced to a MinHash signature over its event
+    n-grams (padded with start and end markers). The signature is cut
+    into LSH bands, and sequences whose band hashes collide become
+    candidates: each is paired with the fanout most frequent sequences of
+    the bucket. Candidates within max_distance edits, by a banded
+    Levenshtein over all pairs at once, are linked, provided their mean
+    start-to-end durations differ by at most duration_tolerance times the
+    longer one. Going from the most frequent sequence down, each sequence
+    joins its closest linked cluster center or starts a new cluster.
+    Centers are therefore the common variants, every member is within
+    max_distance of its center, and rare variants cannot chain two
+    patterns together. Costs grow with the number of unique sequences
+    times bands * fanout.
+    """
+
+    def __init__(self, max_distance=1, ngram=2, num_perm=64, bands=32, fanout=8, seed=0,
+                 duration_tolerance=DEFAULT_DURATION_TOLERANCE):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.max_distance = max_distance
+        self.duration_tolerance = duration_tolerance
+        self.ngram = ngram
+        self.num_perm = num_perm
+        self.bands = bands
+        self.fanout = fanout
+        rng = np.random.default_rng(seed)
+        self.hash_a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.hash_b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def signatures(self, codes, lengths, vocabulary_size, block_size=10_000):
+        """MinHash signatures of the n-gram sets of padded code rows."""
+        # Markers: vocabulary_size for the start, vocabulary_size + 1 for the end
+        base = vocabulary_size + 2
+        padded = np.full((len(codes), codes.shape[1] + self.ngram), -1, dtype=np.int64)
+        padded[:, :self.ngram - 1] = vocabulary_size
+        padded[:, self.ngram - 1:self.ngram - 1 + codes.shape[1]] = codes
+        end_positions = lengths + self.ngram - 1
+        padded[np.arange(len(codes)), end_positions] = vocabulary_size + 1
+
+        num_grams = lengths + 1
+        signatures = np.empty((len(codes), self.num_perm), dtype=np.uint64)
+        for start in range(0, len(codes), block_size):
+            stop = min(start + block_size, len(codes))
+            block = padded[start:stop]
+            grams = np.zeros((stop - start, block.shape[1] - self.ngram + 1), dtype=np.uint64)
+            # Each n-gram is a number in base vocabulary_size + 2, reduced below the prime
+            for k in range(self.ngram):
+                grams = (grams * np.uint64(base) + (block[:, k:k + grams.shape[1]] % base).astype(np.uint64)) \
+                    % np.uint64(MERSENNE_PRIME)
+            valid = np.arange(grams.shape[1]) < num_grams[start:stop, None]
+            # Universal hashing of every n-gram under every permutation; take the minimum
+            hashed = (grams[:, :, None] * self.hash_a + self.hash_b) % np.uint64(MERSENNE_PRIME)
+            hashed[~valid] = np.iinfo(np.uint64).max
+            signatures[start:stop] = hashed.min(axis=1)
+        return signatures
+
+    def candidate_pairs(self, signatures):
+        """Pairs of rows whose signatures collide in at least one band."""
+        rows_per_band = self.num_perm // self.bands
+        left, right = [], []
+        for band in range(self.bands):
+            keys = pd.util.hash_array(np.ascontiguousarray(
+                signatures[:, band * rows_per_band:(band + 1) * rows_per_band]).view(
+                np.dtype((np.void, 8 * rows_per_band))).ravel())
+            buckets = pd.factorize(keys)[0]
+            # Rows arrive most frequent first, and stay in that order within a bucket
+            order = np.argsort(buckets, kind='stable')
+            first = np.r_[True, buckets[order][1:] != buckets[order][:-1]]
+            bucket_start = np.flatnonzero(first)[np.cumsum(first) - 1]
+            rank = np.arange(len(order)) - bucket_start
+            for top in range(self.fanout):
+                members = rank > top
+                left.append(order[members])
+                right.append(order[bucket_start[members] + top])
+        if not left:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        left, right = np.concatenate(left), np.concatenate(right)
+        # Deduplicate unordered pairs through one int64 key each
+        num_rows = len(signatures)
+        keys = np.unique(np.minimum(left, right) * num_rows + np.maximum(left, right))
+        return keys // num_rows, keys % num_rows
+
+    def fit(self, sequences, durations=None):
+        """
+        Cluster a Series of ' → '-joined sequences (one per id).
+
+        durations, if given, holds the start-to-end hours of each id,
+        aligned with sequences; sequences are only linked when their mean
+        durations are within duration_tolerance. Returns a frame with one
+        row per unique sequence: sequence, count and cluster, clusters
+        numbered from the largest.
+        """
+        sequences = pd.Series(sequences).reset_index(drop=True)
+        counts = sequences.value_counts(sort=False)
+        counts = counts.sort_index().sort_values(ascending=False, kind='stable')
+        unique = counts.index.to_numpy()
+        codes, lengths, vocabulary = encode_sequences(unique)
+
+        left, right = self.candidate_pairs(self.signatures(codes, lengths, len(vocabulary)))
+        # Sequences whose lengths differ by more than max_distance cannot be close
+        near = np.abs(lengths[left] - lengths[right]) <= self.max_distance
+        if durations is not None and self.duration_tolerance is not None:
+            hours = pd.Series(np.asarray(durations, dtype=float)).groupby(sequences).mean().reindex(unique).to_numpy()
+            # Unknown durations never keep two sequences apart
+            near &= ~(np.abs(hours[left] - hours[right]) >
+                      self.duration_tolerance * np.maximum(hours[left], hours[right]))
+        left, right = left[near], right[near]
+        distances = banded_levenshtein(codes[left], lengths[left], codes[right], lengths[right], self.max_distance)
+        close = distances <= self.max_distance
+        labels = leader_clusters(len(unique), left[close], right[close], distances[close])
+
+        # Number clusters by total ids, largest first
+        totals = pd.Series(counts.to_numpy()).groupby(labels).sum()
+        ranks = pd.Series(np.arange(len(totals)), index=totals.sort_values(ascending=False, kind='stable').index)
+        return pd.DataFrame({
+            'sequence': unique,
+            'count': counts.to_numpy(),
+            'cluster': ranks.reindex(labels).to_numpy(),
+        })
+
+def cluster_sequences(results_df, clusterer=None):
+    """
+    Cluster the per-id sequences of a results frame.
+
+    Returns (clusters, assignments). clusters has one row per cluster with
+    its most frequent sequence, the number of ids and unique sequences,
+    the mean length and, when start_date and end_date are present, the
+    mean and standard deviation of the start-to-end duration in hours.
+    assignments maps every id to its cluster.
+    """
+    clusterer = clusterer or SequenceClusterer()
+    hours = None
+    if {'start_date', 'end_date'} <= set(results_df.columns):
+        hours = (pd.to_datetime(results_df['end_date']) - pd.to_datetime(results_df['start_date'])).dt.total_seconds() / 3600
+    members = clusterer.fit(results_df['sequence'], hours)
+    assignments = results_df[['id', 'sequence']].merge(members[['sequence', 'cluster']], on='sequence', how='left')
+
+    grouped = members.groupby('cluster')
+    clusters = pd.DataFrame({
+        'representative': grouped['sequence'].first(),
+        'ids': grouped['count'].sum(),
+        'unique_sequences': grouped.size(),
+        'avg_length': (members['sequence'].str.count('→').add(1) * members['count']).groupby(members['cluster']).sum()
+                      / grouped['count'].sum(),
+    })
+    if hours is not None:
+        by_cluster = hours.groupby(assignments['cluster'].to_numpy())
+        clusters['avg_duration_hours'] = by_cluster.mean()
+        clusters['std_duration_hours'] = by_cluster.std()
+    clusters.index.name = 'cluster'
+    return clusters.round(2).reset_index(), assignments
+
+def compare_with_labels(assignments, labels):
+    """
+    Score clusters against known labels (e.g. pattern_base) per id.
+
+    Returns purity (share of ids in their cluster's majority label),
+    completeness (share of ids in their label's majority cluster) and the
+    adjusted Rand index.
+    """
+    table = pd.crosstab(assignments['cluster'].to_numpy(), labels.reindex(assignments['id']).to_numpy()).to_numpy()
+    total = table.sum()
+    pairs = lambda x: (x * (x - 1) / 2).sum()
+    index = pairs(table)
+    expected = pairs(table.sum(axis=1)) * pairs(table.sum(axis=0)) / pairs(np.array([total]))
+    maximum = (pairs(table.sum(axis=1)) + pairs(table.sum(axis=0))) / 2
+    return {
+        'purity': table.max(axis=1).sum() / total,
+        'completeness': table.max(axis=0).sum() / total,
+        'adjusted_rand': (index - expected) / (maximum - expected) if maximum != expected else 1.0,
+    }
+
+def display_clusters(clusters, top=20, scores=None):
+    """Print the largest clusters and, if given, the scores against known labels."""
+    print("\nSequence Clusters")
+    print("=" * 50)
+    print(f"Clusters: {len(clusters)} (from {clusters['unique_sequences'].sum()} unique sequences, "
+          f"{clusters['ids'].sum()} ids)")
+    print(tabulate(clusters.head(top), headers='keys', tablefmt='grid', showindex=False))
+    if scores:
+        print("\nAgreement with pattern_base:")
+        for name, value in scores.items():
+            print(f"  {name}: {value:.3f}")
+
+def run_clustering(file_path, clusterer=None):
+    """
+    Cluster the sequences of an events file, event store or results file.
+
+    Returns (clusters, assignments, scores); scores compares the clusters
+    with the pattern_base column when the events have one, else None.
+    """
+    columns = [] if Path(file_path).is_dir() else pd.read_csv(file_path, nrows=0).columns
+    if 'sequence' in columns:
+        return cluster_sequences(pd.read_csv(file_path), clusterer) + (None,)
+    events = read_events(file_path)
+    clusters, assignments = cluster_sequences(create_sequence_results(events), clusterer)
+    scores = None
+    if 'pattern_base' in events.columns:
+        scores = compare_with_labels(assignments, events.groupby('id')['pattern_base'].first())
+    return clusters, assignments, scores
+
+def main():
+    parser = argparse.ArgumentParser(description='Cluster near-identical sequences.')
+    parser.add_argument('--input', default='patterned_events.csv', help='Events file, event store or results_id_seq.csv')
+    parser.add_argument('--max-distance', type=int, default=1, help='Edits allowed between linked sequences')
+    parser.add_argument('--duration-tolerance', type=float, default=DEFAULT_DURATION_TOLERANCE,
+                        help='Largest gap between the mean durations of linked sequences, as a share of the longer one')
+    parser.add_argument('--output', default='sequence_clusters.csv', help='Per-id cluster assignments')
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"Error: {args.input} not found.")
+        sys.exit(1)
+    clusterer = SequenceClusterer(args.max_distance, duration_tolerance=args.duration_tolerance)
+    clusters, assignments, scores = run_clustering(args.input, clusterer)
+    display_clusters(clusters, scores=scores)
+    assignments.to_csv(args.output, index=False)
+    print(f"\nCluster assignments saved to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import sys
+from bisect import bisect_left, bisect_right
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from tabulate import tabulate
+from event_store import is_event_store
+from event_stream import REQUIRED_COLUMNS, read_events
+from seq_read_csv import build_sequences
+from sequence_table import SEPARATOR, SequenceTable
+
+def parse_path(path):
+    """Turn 'A → B → C' (or 'A,B,C' or a list of events) into a list of events."""
+    if isinstance(path, str):
+        path = path.replace('→', ',').split(',')
+    return [str(event).strip() for event in path if str(event).strip()]
+
+def suffix_array(text, depth):
+    """
+    Sort the suffixes of an integer text by their first depth symbols.
+
+    Uses prefix doubling: each round sorts by the rank of the first half
+    and then of the second half, packed into one int64 key, so
+    ceil(log2(depth)) sorts suffice. Suffixes that agree on their first
+    depth symbols keep text order. Returns the sorted start positions
+    and the final ranks.
+    """
+    n = len(text)
+    rank = np.asarray(text, dtype=np.int64)
+    sa = np.argsort(rank, kind='stable')
+    sorted_depth = 1
+    while sorted_depth < depth:
+        # Suffixes shorter than the shift sort before any longer one
+        second = np.zeros(n, dtype=np.int64)
+        second[:n - sorted_depth] = rank[sorted_depth:] + 1
+        keys = rank * (n + 2) + second
+        sa = np.argsort(keys, kind='stable')
+        sorted_keys = keys[sa]
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = np.cumsum(np.r_[0, sorted_keys[1:] != sorted_keys[:-1]])
+        sorted_depth *= 2
+    return sa, rank
+
+def common_prefix_lengths(text, remaining, suffixes):
+    """
+    Return how many events each sorted suffix shares with the one before it.
+
+    remaining holds the events from each text position to the end of its
+    sequence, where a shared run stops. The first suffix shares none.
+    Matching runs are extended one event at a time for all suffixes at
+    once, so the cost is the total length of the shared runs.
+    """
+    shared = np.zeros(len(suffixes), dtype=np.int64)
+    if len(suffixes) < 2:
+        return shared
+    limit = np.minimum(remaining[suffixes[1:]], remaining[suffixes[:-1]])
+    rows = np.flatnonzero(limit > 0)
+    depth = 0
+    while len(rows):
+        rows = rows[text[suffixes[rows] + depth] == text[suffixes[rows + 1] + depth]]
+        depth += 1
+        shared[rows + 1] = depth
+        rows = rows[limit[rows] > depth]
+    return shared
+
+class SequenceIndex:
+    """
+    Suffix-array index over the integer-coded sequences of every id.
+
+    All sequences are laid end to end as event codes (shifted up by one)
+    with a 0 after each sequence, and the suffixes of that text are sorted
+    up to the longest sequence. Every occurrence of a sub-path then sits
+    in one contiguous run of the suffix array, found by binary search in
+    O(len(path) * log(total events)) time. The suffixes that start a
+    sequence are kept separately for prefix queries, and the events each
+    suffix shares with the one sorted before it for n-gram counts.
+    """
+
+    def __init__(self, ids, codes, offsets, vocabulary):
+        self.ids = np.asarray(ids)
+        self.vocabulary = np.asarray(vocabulary)
+        self.lookup = {event: code + 1 for code, event in enumerate(self.vocabulary.tolist())}
+        offsets = np.asarray(offsets, dtype=np.int64)
+        lengths = np.diff(offsets)
+
+        # Sequence i occupies text[starts[i]:starts[i] + lengths[i]], then a 0
+        self.starts = offsets[:-1] + np.arange(len(lengths))
+        text = np.zeros(offsets[-1] + len(lengths), dtype=np.int64)
+        positions = np.repeat(self.starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        text[positions] = np.asarray(codes) + 1
+        self.text = text
+        # Events from each position to the end of its sequence, 0 on separators
+        remaining = np.zeros(len(text), dtype=np.int64)
+        remaining[positions] = np.repeat(offsets[1:], lengths) - np.arange(offsets[-1])
+        self.max_length = int(lengths.max()) if len(lengths) else 0
+
+        sa, _ = suffix_array(text, self.max_length + 1)
+        # Suffixes starting on a separator never match a path
+        self.suffixes = sa[text[sa] != 0]
+        is_start = np.zeros(len(text), dtype=bool)
+        is_start[self.starts] = True
+        self.prefixes = sa[is_start[sa]]
+        self.suffix_lengths = remaining[self.suffixes]
+        self.common_prefixes = common_prefix_lengths(text, remaining, self.suffixes)
+        # Ranked n-gram counts and first positions, filled per n on first use
+        self._ngram_counts = {}
+
+    @classmethod
+    def from_events(cls, df):
+        """Build the index from an id,event,date frame."""
+        table = build_sequences(df)
+        return cls(table.ids, table.codes, table.offsets, table.vocabulary.events)
+
+    @classmethod
+    def from_results(cls, results_df):
+        """Build the index from a frame in the layout of results_id_seq.csv."""
+        table = SequenceTable.from_results(results_df)
+        return cls(table.ids, table.codes, table.offsets, table.vocabulary.events)
+
+    @classmethod
+    def from_file(cls, file_path):
+        """Build the index from results_id_seq.csv, an events file or an event store."""
+        if is_event_store(file_path):
+            return cls.from_events(read_events(file_path))
+        columns = pd.read_csv(file_path, nrows=0).columns
+        if all(col in columns for col in REQUIRED_COLUMNS):
+            return cls.from_events(read_events(file_path))
+        return cls.from_results(pd.read_csv(file_path))
+
+    def _encode(self, path):
+        """Return the text codes of a path, or None if it has an unknown event."""
+        codes = [self.lookup.get(event) for event in parse_path(path)]
+        return None if None in codes else codes
+
+    def _range(self, positions, path):
+        """Return the slice of sorted positions whose suffixes start with path."""
+        codes = self._encode(path)
+        if codes is None:
+            return slice(0, 0)
+        if not codes:
+            return slice(0, len(positions))
+        text = self.text
+        size = len(codes)
+        key = lambda position: text[position:position + size].tolist()
+        return slice(bisect_left(positions, codes, key=key), bisect_right(positions, codes, key=key))
+
+    def prefix_count(self, path):
+        """Number of ids whose sequence starts with path."""
+        matches = self._range(self.prefixes, path)
+        return matches.stop - matches.start
+
+    def subpath_count(self, path):
+        """Number of times path occurs as consecutive events, over all ids."""
+        matches = self._range(self.suffixes, path)
+        return matches.stop - matches.start
+
+    def subpath_ids(self, path):
+        """Sorted ids whose sequence contains path at least once."""
+        positions = self.suffixes[self._range(self.suffixes, path)]
+        sequences = np.searchsorted(self.starts, positions, side='right') - 1
+        return np.unique(self.ids[sequences])
+
+    def top_ngrams(self, n, k=10):
+        """
+        Return the k most frequent sub-paths of n events, most frequent first.
+
+        Equal n-grams are adjacent in the suffix array, and each shares at
+        least n events with the one before it, so the shared lengths kept
+        at build time split the suffixes into n-grams in one vectorized
+        comparison per suffix. That first call for an n is still linear in
+        the number of events; its ranked counts are kept, so later calls
+        for the same n only slice them. Ties are broken alphabetically.
+        """
+        if n < 1 or n > self.max_length:
+            return pd.DataFrame({'ngram': pd.Series(dtype=object), 'count': pd.Series(dtype='int64')})
+        if n not in self._ngram_counts:
+            # Keep suffixes with n events before the end of their sequence
+            valid = self.suffix_lengths >= n
+            positions = self.suffixes[valid]
+            group_starts = np.flatnonzero(self.common_prefixes[valid] < n)
+            counts = np.diff(np.append(group_starts, len(positions)))
+            ranked = np.argsort(-counts, kind='stable')
+            self._ngram_counts[n] = counts[ranked], positions[group_starts[ranked]]
+        counts, first = self._ngram_counts[n]
+        counts, first = counts[:k], first[:k]
+        events = self.vocabulary[self.text[first[:, None] + np.arange(n)] - 1]
+        return pd.DataFrame({
+            'ngram': [SEPARATOR.join(row) for row in events.tolist()],
+            'count': counts,
+        })
+
+def display_queries(index, prefixes=(), contains=(), n=2, top=10):
+    """Print prefix counts, sub-path counts and the top n-grams of an index."""
+    print(f"\nIndexed {len(index.ids)} ids, {len(index.suffixes)} events")
+    if prefixes:
+        print("\nPrefix counts (ids starting with the path):")
+        rows = [[path, index.prefix_count(path)] for path in prefixes]
+        print(tabulate(rows, headers=['Prefix', 'IDs'], tablefmt='grid'))
+    if contains:
+        print("\nSub-path counts:")
+        rows = [[path, index.subpath_count(path), len(index.subpath_ids(path))] for path in contains]
+        print(tabulate(rows, headers=['Sub-path', 'Occurrences', 'IDs'], tablefmt='grid'))
+    if top:
+        print(f"\nTop {top} sub-paths of {n} events:")
+        print(tabulate(index.top_ngrams(n, top), headers=['Sub-path', 'Occurrences'],
+                       tablefmt='grid', showindex=False))
+
+def main():
+    parser = argparse.ArgumentParser(description='Query prefix and sub-path frequencies of the id sequences.')
+    parser.add_argument('--input', default='results_id_seq.csv', help='Per-id sequence file, events file or event store')
+    parser.add_argument('--prefix', action='append', default=[], help="Count ids starting with a path, e.g. 'A → B'")
+    parser.add_argument('--contains', action='append', default=[], help='Count occurrences of a sub-path')
+    parser.add_argument('--ngram', type=int, default=2, help='Length of the frequent sub-paths to list')
+    parser.add_argument('--top', type=int, default=10, help='Number of frequent sub-paths to list (0 for none)')
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"Error: {args.input} not found.")
+        sys.exit(1)
+    index = SequenceIndex.from_file(args.input)
+    display_queries(index, args.prefix, args.contains, args.ngram, args.top)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,20 @@
+import argparse
+import numpy as np
 import pandas as pd
+import matplotlib
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
 from pathlib import Path
+from event_stream import read_events
 
 def read_events_csv(file_path):
     """Read and display events from CSV file."""
     try:
-        # Read the CSV file
-        df = pd.read_csv(file_path)
-        
-        # Convert date to datetime
-        df['date'] = pd.to_datetime(df['date'])
+        # Read the CSV file and convert date to datetime
+        df = read_events(file_path)
         
         # Sort by ID and date
         df = df.sort_values(['id', 'date'])
@@ -23,11 +28,10 @@ def read_events_csv(file_path):
         
         # Display events by ID
         print("\n=== Events by ID ===")
-        for id_val in df['id'].unique():
+        for id_val, id_events in df.groupby('id', sort=False):
             print(f"\nID: {id_val}")
-            id_events = df[df['id'] == id_val]
-            for _, row in id_events.iterrows():
-                print(f"  {row['date'].strftime('%Y-%m-%d')}: {row['event']}")
+            for date, event in zip(id_events['date'].dt.strftime('%Y-%m-%d'), id_events['event']):
+                print(f"  {date}: {event}")
         
         return df
     
@@ -38,46 +42,140 @@ def read_events_csv(file_path):
         print(f"Error reading file: {e}")
         return None
 
-def plot_events_timeline(df):
-    """Create a simple timeline plot of events."""
-    plt.figure(figsize=(12, 6))
-    
-    # Plot events for each ID
-    for id_val in df['id'].unique():
-        id_events = df[df['id'] == id_val]
-        plt.plot(id_events['date'], [id_val] * len(id_events), 'o', 
+# Above DETAIL_MAX_IDS ids the per-id legend and labels are dropped, and
+# above DENSITY_THRESHOLD events points give way to a 2D histogram
+DETAIL_MAX_IDS = 20
+DENSITY_THRESHOLD = 200_000
+TIMELINE_MODES = ('auto', 'detail', 'scatter', 'density')
+
+def select_ids(df, sample=None, id_range=None, seed=0):
+    """
+    Restrict events to an inclusive (first, last) id window and/or a
+    random sample of ids. Sampled ids keep all of their events.
+    """
+    if id_range is not None:
+        df = df[df['id'].between(*id_range)]
+    if sample is not None:
+        ids = df['id'].unique()
+        if sample < len(ids):
+            keep = np.random.default_rng(seed).choice(ids, sample, replace=False)
+            df = df[df['id'].isin(keep)]
+    return df
+
+def choose_mode(df, density_threshold=DENSITY_THRESHOLD):
+    """Pick the rendering mode for the size of df."""
+    if df['id'].nunique() <= DETAIL_MAX_IDS:
+        return 'detail'
+    return 'scatter' if len(df) <= density_threshold else 'density'
+
+def draw_detail(ax, df):
+    """One marker series and legend entry per id, with every event labelled."""
+    for id_val, id_events in df.groupby('id', sort=False):
+        ax.plot(id_events['date'], [id_val] * len(id_events), 'o',
                 label=f'ID {id_val}', markersize=10)
         
         # Add event labels
-        for _, row in id_events.iterrows():
-            plt.annotate(row['event'], 
-                        (row['date'], id_val),
-                        xytext=(10, 5), 
+        for date, event in zip(id_events['date'], id_events['event']):
+            ax.annotate(event,
+                        (date, id_val),
+                        xytext=(10, 5),
                         textcoords='offset points',
                         fontsize=8,
                         rotation=45)
     
-    plt.yticks(df['id'].unique())
-    plt.title('Events Timeline')
-    plt.xlabel('Date')
-    plt.ylabel('ID')
-    plt.grid(True)
-    plt.legend()
+    ax.set_yticks(df['id'].unique())
+    ax.legend()
+
+def draw_scatter(ax, df):
+    """All events in one scatter call, coloured by event."""
+    codes, events = pd.factorize(df['event'], sort=True)
+    cmap = matplotlib.colormaps['tab10' if len(events) <= 10 else 'tab20'].resampled(max(len(events), 1))
+    ax.scatter(mdates.date2num(df['date'].to_numpy()), df['id'].to_numpy(), c=codes, cmap=cmap,
+               vmin=-0.5, vmax=len(events) - 0.5, s=8, marker='.', linewidths=0,
+               rasterized=len(df) > 10_000)
+    handles = [Line2D([], [], marker='o', linestyle='', color=cmap(code), label=event)
+               for code, event in enumerate(events)]
+    ax.legend(handles=handles, title='Event', loc='upper left', bbox_to_anchor=(1, 1))
+    ax.xaxis_date()
+
+def draw_density(fig, ax, df, max_date_bins=400, id_bins=300):
+    """Event counts binned by date and id, on a log colour scale."""
+    x = mdates.date2num(df['date'].to_numpy())
+    y = df['id'].to_numpy()
+    # Date bins span whole days, so day-stamped events do not alias into stripes
+    first, last = np.floor(x.min()), np.floor(x.max()) + 1
+    step = max(np.ceil((last - first) / max_date_bins), 1)
+    x_edges = np.arange(first, last + step, step)
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=(x_edges, id_bins))
+    mesh = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0),
+                         norm=LogNorm(), cmap='viridis', rasterized=True)
+    fig.colorbar(mesh, ax=ax, label='Events')
+    ax.xaxis_date()
+
+def plot_events_timeline(df, output_file=None, mode='auto', sample=None, id_range=None,
+                         density_threshold=DENSITY_THRESHOLD, seed=0, dpi=150):
+    """
+    Create a timeline plot of events.
+    
+    mode 'detail' draws every id separately with labelled events, 'scatter'
+    draws all events in one call coloured by event, and 'density' bins them
+    into a date x id heatmap; 'auto' picks by size. With output_file
+    (.png, .svg, ...) the plot is rendered headless to that file instead
+    of shown.
+    """
+    df = select_ids(df, sample, id_range, seed)
+    if len(df) == 0:
+        print("No events to plot.")
+        return None
+    if mode == 'auto':
+        mode = choose_mode(df, density_threshold)
+    
+    # A bare Figure renders without pyplot or a display
+    fig = Figure(figsize=(12, 6)) if output_file else plt.figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    if mode == 'detail':
+        draw_detail(ax, df)
+    elif mode == 'scatter':
+        draw_scatter(ax, df)
+    else:
+        draw_density(fig, ax, df)
+    
+    ax.set_title('Events Timeline' if mode == 'detail' else
+                 f"Events Timeline ({df['id'].nunique():,} ids, {len(df):,} events)")
+    ax.set_xlabel('Date')
+    ax.set_ylabel('ID')
+    ax.grid(True)
     
     # Adjust layout to prevent label cutoff
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    if output_file:
+        fig.savefig(output_file, dpi=dpi)
+        print(f"\nTimeline saved to '{output_file}'")
+    else:
+        plt.show()
+    return fig
 
 def main():
-    # Use the current directory
-    file_path = Path('events.csv')
+    parser = argparse.ArgumentParser(description='List events and plot their timeline.')
+    parser.add_argument('--input', default='events.csv', help='Events file or event store')
+    parser.add_argument('--output', help='Render to this image file (.png, .svg, ...) instead of a window')
+    parser.add_argument('--mode', choices=TIMELINE_MODES, default='auto')
+    parser.add_argument('--sample', type=int, help='Plot a random sample of this many ids')
+    parser.add_argument('--id-range', type=int, nargs=2, metavar=('FIRST', 'LAST'), help='Plot only ids in this range')
+    parser.add_argument('--summary-only', action='store_true', help='Skip listing every event')
+    args = parser.parse_args()
+    
+    file_path = Path(args.input)
     
     # Read and display events
-    df = read_events_csv(file_path)
+    if args.summary_only:
+        df = read_events(file_path)
+    else:
+        df = read_events_csv(file_path)
     
     if df is not None:
         # Create timeline visualization
-        plot_events_timeline(df)
+        plot_events_timeline(df, args.output, args.mode, args.sample, args.id_range)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+from profiling import stage
+from seq_read_csv import format_days, id_date_order
+
+SEPARATOR = ' → '
+
+def iter_levels(offsets):
+    """Yield (level, rows): the events at each position within their id, shortest prefixes first."""
+    lengths = np.diff(offsets)
+    positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    by_level = np.argsort(positions, kind='stable')
+    bounds = np.searchsorted(positions[by_level], np.arange(lengths.max() + 1 if len(lengths) else 1))
+    for level in range(len(bounds) - 1):
+        yield level, by_level[bounds[level]:bounds[level + 1]]
+
+def gather_ranges(offsets, rows):
+    """
+    Return (positions, new_offsets) to gather the ranges of the given rows of a CSR layout.
+
+    positions lists the element positions of rows[0], then rows[1] and so
+    on, and new_offsets are the row bounds within positions.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    lengths = offsets[rows + 1] - offsets[rows]
+    new_offsets = np.r_[0, np.cumsum(lengths)].astype(np.int64)
+    positions = np.repeat(offsets[rows] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return positions, new_offsets
+
+class EventVocabulary:
+    """
+    Maps event names to dense integer codes and back.
+
+    Codes use the smallest unsigned dtype that fits the vocabulary: uint8
+    up to 256 events, then uint16, then uint32. Events are numbered in
+    sorted order.
+    """
+
+    def __init__(self, events):
+        self.events = np.asarray(events, dtype=object)
+        self.dtype = np.min_scalar_type(max(len(self.events) - 1, 0))
+
+    def __len__(self):
+        return len(self.events)
+
+    @classmethod
+    def from_values(cls, values):
+        """Build the vocabulary of an array of event names and return (vocabulary, codes)."""
+        codes, events = pd.factorize(np.asarray(values), sort=True)
+        vocabulary = cls(events)
+        return vocabulary, codes.astype(vocabulary.dtype)
+
+    def encode(self, values):
+        """Return the codes of an array of event names, raising ValueError for unknown events."""
+        codes = pd.Categorical(np.asarray(values), categories=self.events).codes
+        if (codes < 0).any():
+            raise ValueError("Events outside the vocabulary")
+        return codes.astype(self.dtype)
+
+    def decode(self, codes):
+        """Return the event names of an array of codes."""
+        return self.events[np.asarray(codes)]
+
+class SequenceTable:
+    """
+    Per-id event sequences as flat integer arrays instead of strings.
+
+    The events of row i (id ids[i]) are codes[offsets[i]:offsets[i + 1]],
+    coded by vocabulary, as in a CSR matrix. start_dates and end_dates
+    are datetime64[D] days, and columns holds any per-id grouping columns.
+    A row costs its events at one or two bytes each plus about 32 bytes.
+    Its ' → '-joined string can take a hundred bytes or more. Strings
+    are only built on output, and then once per distinct sequence.
+    """
+
+    def __init__(self, ids, codes, offsets, vocabulary, start_dates, end_dates, columns=None):
+        self.ids = np.asarray(ids)
+        self.codes = np.asarray(codes)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.vocabulary = vocabulary
+        self.start_dates = np.asarray(start_dates, dtype='datetime64[D]')
+        self.end_dates = np.asarray(end_dates, dtype='datetime64[D]')
+        self.columns = dict(columns or {})
+        self._sequence_codes = None
+        self._start_order = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def lengths(self):
+        """Number of events of every row."""
+        return np.diff(self.offsets)
+
+    @classmethod
+    def from_events(cls, df, group_by=()):
+        """
+        Build the table from an id,event,date frame in one sorted scan.
+
+        Rows are ordered by id, and events by date, with same-day events
+        in file order. Each column in group_by is taken from the first
+        event of the id.
+        """
+        with stage('sort', rows=len(df)):
+            order = id_date_order(df['id'].to_numpy(), df['date'].to_numpy())
+        ids = df['id'].to_numpy()[order]
+        dates = df['date'].to_numpy()[order]
+        vocabulary, codes = EventVocabulary.from_values(df['event'].to_numpy()[order])
+
+        # Row positions where a new id begins
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.arange(0)
+        offsets = np.append(starts, len(ids))
+        columns = {col: df[col].to_numpy()[order][starts] for col in group_by}
+        return cls(ids[starts], codes, offsets, vocabulary, dates[starts], dates[offsets[1:] - 1], columns)
+
+    @classmethod
+    def from_results(cls, results_df, group_by=()):
+        """Build the table from a frame in the layout of results_id_seq.csv."""
+        sequences = results_df['sequence'].astype(str)
+        vocabulary, codes = EventVocabulary.from_values(sequences.str.split(SEPARATOR).explode().to_numpy())
+        lengths = sequences.str.count(SEPARATOR).to_numpy() + 1
+        # Only id and sequence are required; missing dates stay NaT
+        days = {col: results_df[col].to_numpy(dtype='datetime64[D]') if col in results_df.columns
+                else np.full(len(results_df), np.datetime64('NaT'), dtype='datetime64[D]')
+                for col in ('start_date', 'end_date')}
+        return cls(results_df['id'].to_numpy(), codes, np.r_[0, np.cumsum(lengths)], vocabulary,
+                   days['start_date'], days['end_date'], {col: results_df[col].to_numpy() for col in group_by})
+
+    @classmethod
+    def load(cls, path):
+        """Load a table saved with save."""
+        with np.load(path) as data:
+            columns = {name[len('column_'):]: data[name] for name in data.files if name.startswith('column_')}
+            return cls(data['ids'], data['codes'], data['offsets'], EventVocabulary(data['vocabulary']),
+                       data['start_dates'], data['end_dates'], columns)
+
+    def save(self, path):
+        """Save the table arrays to an .npz file, a compact alternative to results_id_seq.csv."""
+        # Strings are stored as fixed-width text so that loading needs no pickle
+        columns = {f"column_{col}": values.astype(str) if values.dtype == object else values
+                   for col, values in self.columns.items()}
+        ids = self.ids.astype(str) if self.ids.dtype == object else self.ids
+        np.savez(path, ids=ids, codes=self.codes, offsets=self.offsets,
+                 vocabulary=self.vocabulary.events.astype(str), start_dates=self.start_dates,
+                 end_dates=self.end_dates, **columns)
+
+    def take(self, rows):
+        """Return a new table holding the given rows, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        positions, offsets = gather_ranges(self.offsets, rows)
+        return SequenceTable(self.ids[rows], self.codes[positions], offsets, self.vocabulary,
+                             self.start_dates[rows], self.end_dates[rows],
+                             {col: values[rows] for col, values in self.columns.items()})
+
+    def starting(self, start=None, end=None):
+        """
+        Return the rows, in table order, whose start date falls in [start, end).
+
+        Either bound may be None for an open window. Start dates are days,
+        compared as their midnight. The rows are ordered by start date
+        once, so every window after the first is two binary searches.
+        """
+        if self._start_order is None:
+            order = np.argsort(self.start_dates, kind='stable')
+            self._start_order = order, self.start_dates[order].astype('datetime64[ns]')
+        order, sorted_dates = self._start_order
+        lo = 0 if start is None else np.searchsorted(sorted_dates, np.datetime64(start, 'ns'), 'left')
+        hi = len(order) if end is None else np.searchsorted(sorted_dates, np.datetime64(end, 'ns'), 'left')
+        return np.sort(order[lo:hi])
+
+    def sequence_codes(self):
+        """
+        Number the distinct sequences of the table without building strings.
+
+        Returns (row_codes, first_rows). row_codes gives the code of every
+        row's sequence, numbered in order of first appearance, and
+        first_rows[k] is the first row with sequence k. Sequences are
+        numbered as nodes of a prefix trie, one event position at a time,
+        so equal sequences end on the same node.
+        """
+        if self._sequence_codes is None:
+            nodes = np.zeros(len(self.codes), dtype=np.int64)
+            num_nodes = 1
+            for level, rows in iter_levels(self.offsets):
+                parents = nodes[rows - 1] if level else np.zeros(len(rows), dtype=np.int64)
+                inverse, uniques = pd.factorize(parents * len(self.vocabulary) + self.codes[rows])
+                nodes[rows] = num_nodes + inverse
+                num_nodes += len(uniques)
+            row_codes, _ = pd.factorize(nodes[self.offsets[1:] - 1])
+            # Codes count up from 0 in row order, so a row is first when its code is a new maximum
+            is_first = row_codes[1:] > np.maximum.accumulate(row_codes)[:-1]
+            self._sequence_codes = row_codes, np.flatnonzero(np.r_[len(row_codes) > 0, is_first])
+        return self._sequence_codes
+
+    def decode(self, rows):
+        """Return the ' → '-joined sequences of the given rows."""
+        events = self.vocabulary.events.tolist()
+        codes = self.codes.tolist() if len(rows) > len(self) // 2 else None
+        sequences = []
+        for row in np.asarray(rows).tolist():
+            start, end = self.offsets[row], self.offsets[row + 1]
+            row_codes = codes[start:end] if codes is not None else self.codes[start:end].tolist()
+            sequences.append(SEPARATOR.join([events[code] for code in row_codes]))
+        return np.array(sequences, dtype=object)
+
+    def sequences(self):
+        """Return the ' → '-joined sequence of every row, decoding each distinct sequence once."""
+        row_codes, first_rows = self.sequence_codes()
+        return self.decode(first_rows)[row_codes]
+
+    def to_results(self):
+        """Decode the table into the layout of results_id_seq.csv."""
+        results = pd.DataFrame({
+            'id': self.ids,
+            'sequence': self.sequences(),
+            'num_events': self.lengths,
+            'start_date': format_days(self.start_dates),
+            'end_date': format_days(self.end_dates),
+        })
+        for col, values in self.columns.items():
+            results[col] = values
+        return results
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+from analyze_sequences import SequenceAnalyzer
+from event_store import EventStoreWriter
+from time_index import to_datetime64
+
+def write_store(path, num_ids=200, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 6, num_ids)
+    writer = EventStoreWriter(path)
+    writer.append(pd.DataFrame({
+        'id': np.repeat(np.arange(num_ids), lengths),
+        'event': rng.choice(['A', 'B', 'C'], lengths.sum()),
+        'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 60 * 24, lengths.sum()), 'h'),
+        'office': np.repeat(rng.choice(['north', 'south'], num_ids), lengths),
+    }))
+    writer.close()
+
+@pytest.mark.parametrize('group_by', [[], ['office']])
+@pytest.mark.parametrize('window', [None, ('2024-01-10', '2024-01-20 12:00')])
+def test_store_shards_match_a_loaded_store(tmp_path, group_by, window):
+    write_store(tmp_path / 'store')
+    window = None if window is None else tuple(to_datetime64(bound) for bound in window)
+    loaded = SequenceAnalyzer(tmp_path / 'store', group_by, window)
+    loaded.read_sequences()
+    loaded.analyze_sequences()
+    # Not read first, so every worker builds the sequences of its own ids from the store
+    sharded = SequenceAnalyzer(tmp_path / 'store', group_by, window)
+    sharded.analyze_sequences(workers=2)
+    pd.testing.assert_frame_equal(sharded.unique_sequences.reset_index(drop=True),
+                                  loaded.unique_sequences.reset_index(drop=True))
+
+def test_store_shards_need_the_grouping_columns(tmp_path):
+    write_store(tmp_path / 'store')
+    with pytest.raises(SystemExit):
+        SequenceAnalyzer(tmp_path / 'store', ['region']).analyze_sequences(workers=2)
@@ -0,0 +1,34 @@
+import io
+from datetime import datetime
+import pandas as pd
+from anomaly_detector import AnomalyDetector, iter_csv_events
+
+def test_hops_are_looked_up_by_their_events():
+    # 'a-b' -> 'c' and 'a' -> 'b-c' share the label 'a-b-c'
+    baseline = pd.DataFrame({
+        'id': [1, 1, 2, 2, 3, 3, 4, 4],
+        'event': ['a-b', 'c', 'a-b', 'c', 'a', 'b-c', 'a', 'b-c'],
+        'date': pd.to_datetime(['2024-01-01 00:00', '2024-01-02 00:00', '2024-01-01 00:00', '2024-01-02 02:00',
+                                '2024-01-01 00:00', '2024-01-05 00:00', '2024-01-01 00:00', '2024-01-05 02:00']),
+    })
+    detector = AnomalyDetector.from_events(baseline, threshold=1.0)
+    assert detector.expected_hours == {('a', 'b-c'): 97.0, ('a-b', 'c'): 25.0}
+    assert detector.wait_hours == {'a': detector.upper_hours['a', 'b-c'], 'a-b': detector.upper_hours['a-b', 'c']}
+
+    # 96.5 hours is usual for 'a' -> 'b-c' and far too slow for 'a-b' -> 'c'
+    start, end = datetime(2024, 2, 1), datetime(2024, 2, 5, 0, 30)
+    assert detector.process(10, 'a', start) == [] and detector.process(10, 'b-c', end) == []
+    detector.process(11, 'a-b', start)
+    assert [(alert['alert'], alert['path_segment']) for alert in detector.process(11, 'c', end)] == [
+        ('slow_hop', 'a-b-c')]
+
+def test_stream_ids_need_not_be_numbers():
+    baseline = pd.DataFrame({
+        'id': [1, 1, 2, 2],
+        'event': ['a', 'b', 'a', 'b'],
+        'date': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-01', '2024-01-03']),
+    })
+    detector = AnomalyDetector.from_events(baseline)
+    stream = io.StringIO("id,event,date\nc1,a,2024-02-01\n7,a,2024-02-01\nc1,c,2024-02-02\n7,b,2024-02-02\n")
+    alerts = list(detector.run(iter_csv_events(stream)))
+    assert [(alert['alert'], alert['id'], alert['path_segment']) for alert in alerts] == [('unseen_hop', 'c1', 'a-c')]
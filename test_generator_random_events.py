@@ -0,0 +1,20 @@
+import pandas as pd
+from generator_random_events import RANDOM_RUN_IDS, PatternedPathGenerator
+
+def test_block_size_does_not_change_the_events():
+    num_ids = 2 * RANDOM_RUN_IDS + 100
+    expected = PatternedPathGenerator(num_ids, num_patterns=5, seed=7).generate_all_paths_vectorized()
+    # Blocks that split the random runs, and single-id blocks at a run boundary
+    for block_size in [1000, 333, RANDOM_RUN_IDS + 1]:
+        events = PatternedPathGenerator(num_ids, num_patterns=5, seed=7).generate_all_paths_vectorized(block_size)
+        pd.testing.assert_frame_equal(events, expected)
+    generator = PatternedPathGenerator(num_ids, num_patterns=5, seed=7)
+    first_id = RANDOM_RUN_IDS
+    single = pd.concat([generator.generate_block(first_id, 1), generator.generate_block(first_id + 1, 1)],
+                       ignore_index=True)
+    pd.testing.assert_frame_equal(single, expected[expected['id'].isin([first_id, first_id + 1])].reset_index(drop=True))
+
+def test_seed_changes_the_events():
+    first = PatternedPathGenerator(500, seed=1).generate_all_paths_vectorized()
+    assert not first.equals(PatternedPathGenerator(500, seed=2).generate_all_paths_vectorized())
+    assert first.equals(PatternedPathGenerator(500, seed=1).generate_all_paths_vectorized())
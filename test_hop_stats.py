@@ -0,0 +1,94 @@
+import pickle
+import warnings
+import numpy as np
+import pandas as pd
+from hop_stats import HopStats, QuantileSketch
+
+QS = np.linspace(0.01, 0.99, 99)
+
+def rank_errors(sorted_values, estimates, qs):
+    """Return how far the rank of each estimate is from its target quantile."""
+    return np.abs(np.searchsorted(sorted_values, estimates, 'right') / len(sorted_values) - qs)
+
+def test_sketch_is_exact_below_k():
+    values = np.random.default_rng(0).normal(size=150)
+    sketch = QuantileSketch(k=200).update(values)
+    assert np.array_equal(sketch.quantiles(QS), np.quantile(values, QS, method='inverted_cdf'))
+
+def test_sketch_rank_error_and_size():
+    for seed in range(5):
+        values = np.random.default_rng(seed).lognormal(2, 1, 100_000)
+        sketch = QuantileSketch(k=200, seed=seed)
+        for part in np.array_split(values, 37):
+            sketch.update(part)
+        assert sketch.count == len(values)
+        assert rank_errors(np.sort(values), sketch.quantiles(QS), QS).max() < 0.015
+        assert sum(len(items) for items in sketch.levels) <= 3 * sketch.k
+
+def test_merged_sketches_keep_the_error_bound():
+    values = np.random.default_rng(1).exponential(10, 100_000)
+    parts = [QuantileSketch(k=200, seed=i).update(part) for i, part in enumerate(np.array_split(values, 10))]
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    assert merged.count == len(values)
+    assert rank_errors(np.sort(values), merged.quantiles(QS), QS).max() < 0.015
+
+def test_merged_moments_match_a_single_pass():
+    rng = np.random.default_rng(2)
+    timings = pd.DataFrame({
+        'source': rng.choice(['A', 'B', 'C'], 10_000),
+        'target': rng.choice(['A', 'B', 'C'], 10_000),
+        'time_hours': rng.exponential(24, 10_000),
+        'id': np.arange(10_000),
+    })
+    stats = HopStats()
+    for bounds in np.array_split(np.arange(len(timings)), 7):
+        stats.merge(HopStats().update(timings.iloc[bounds]))
+    summary = stats.summary().set_index(['source', 'target'])
+
+    grouped = timings.groupby(['source', 'target'])['time_hours']
+    assert (summary['frequency'] == grouped.count()).all()
+    assert np.allclose(summary['avg_hours'], grouped.mean().round(2))
+    assert np.allclose(summary['std_hours'], grouped.std().round(2))
+    assert np.allclose(summary['min_hours'], grouped.min().round(2))
+    assert np.allclose(summary['max_hours'], grouped.max().round(2))
+
+def test_missing_group_values_keep_their_percentiles():
+    rng = np.random.default_rng(3)
+    timings = pd.DataFrame({
+        'office': pd.Series(['N'] * 300, dtype=object).where(rng.random(300) < 0.5),
+        'source': rng.choice(['A', 'B'], 300),
+        'target': 'C',
+        'time_hours': rng.exponential(24, 300),
+        'id': np.arange(300),
+    })
+    # Partials pass through pickle, as they do between worker processes
+    partials = [pickle.loads(pickle.dumps(HopStats(group_by=['office']).update(timings.iloc[bounds])))
+                for bounds in np.array_split(np.arange(len(timings)), 3)]
+    stats = HopStats(group_by=['office'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        for partial in partials:
+            stats.merge(partial)
+        summary = stats.summary((50, 90))
+
+    # Under k values per group, the sketches are exact
+    keys = ['office', 'source', 'target']
+    got = summary.fillna({'office': '-'}).set_index(keys)
+    for key, hours in timings.fillna({'office': '-'}).groupby(keys)['time_hours']:
+        expected = np.quantile(hours, [0.5, 0.9], method='inverted_cdf').round(2)
+        assert np.allclose(got.loc[key, ['p50_hours', 'p90_hours']].to_numpy(dtype=float), expected)
+
+def test_hyphenated_events_keep_separate_segments():
+    # 'a-b' -> 'c' and 'a' -> 'b-c' share the label 'a-b-c'
+    timings = pd.DataFrame({
+        'source': ['a-b', 'a'],
+        'target': ['c', 'b-c'],
+        'time_hours': [24.0, 96.0],
+        'id': [1, 2],
+    })
+    summary = HopStats().update(timings).summary((50,))
+    assert summary['path_segment'].tolist() == ['a-b-c', 'a-b-c']
+    assert summary[['source', 'target', 'frequency', 'avg_hours', 'p50_hours']].values.tolist() == [
+        ['a', 'b-c', 1, 96.0, 96.0], ['a-b', 'c', 1, 24.0, 24.0]]
@@ -0,0 +1,19 @@
+import asyncio
+from ingest_server import IngestionService, parse_batch
+
+def get(service, path):
+    return asyncio.run(service.route('GET', path, {}, b''))
+
+def test_ids_are_found_whether_or_not_they_are_numbers():
+    service = IngestionService()
+    service.analyzer.update(parse_batch(b"id,event,date\n7,A,2024-01-01\n7,B,2024-01-02\n"))
+    text_ids = IngestionService()
+    text_ids.analyzer.update(parse_batch(b"id,event,date\nc1,A,2024-01-01\nc 2,B,2024-01-02\n"))
+
+    status, result = get(service, '/ids/7')
+    assert status == 200 and result['id'] == 7 and result['sequence'] == 'A → B'
+    status, result = get(text_ids, '/ids/c1')
+    assert status == 200 and result['id'] == 'c1' and result['sequence'] == 'A'
+    assert get(text_ids, '/ids/c%202')[1]['sequence'] == 'B'
+    assert get(service, '/ids/c1')[0] == 404
+    assert get(text_ids, '/ids/7')[0] == 404
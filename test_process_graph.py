@@ -0,0 +1,58 @@
+import pandas as pd
+from analyze_sequences_paths import PathTimingAnalyzer, read_path_stats
+from process_graph import ProcessGraph, load_path_stats
+
+def hyphenated_events():
+    dates = pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-04'])
+    return pd.DataFrame({
+        'id': [1, 1, 1, 2, 2, 2],
+        'event': ['pre-check', 'check-in', 'done', 'pre-check', 'check-in', 'done'],
+        'date': dates.append(dates),
+    })
+
+def test_event_names_with_hyphens():
+    graph = ProcessGraph.from_events(hyphenated_events()).graph
+    assert sorted(graph.edges) == [('check-in', 'done'), ('pre-check', 'check-in')]
+    assert graph.edges['pre-check', 'check-in']['path_segment'] == 'pre-check-check-in'
+    assert graph.edges['pre-check', 'check-in']['avg_hours'] == 24
+    assert graph.nodes['done']['frequency'] == 2
+
+def test_saved_statistics_keep_their_events(tmp_path):
+    events_file = tmp_path / 'events.csv'
+    hyphenated_events().to_csv(events_file, index=False)
+    analyzer = PathTimingAnalyzer(events_file)
+    analyzer.read_data()
+    analyzer.calculate_path_timings()
+    stats_file = tmp_path / 'paths.csv'
+    analyzer.save_results(analyzer.analyze_path_segments(), stats_file, show_sample=False)
+    # The event columns follow the columns older readers index by position
+    assert list(pd.read_csv(stats_file, nrows=0).columns) == [
+        'Path_Segment', 'Frequency', 'Average_Hours', 'Minimum_Hours', 'Maximum_Hours', 'Std_Dev_Hours', 'Unique_IDs',
+        'Source_Event', 'Target_Event']
+
+    stats = load_path_stats(stats_file)
+    assert stats[['source', 'target']].values.tolist() == [['check-in', 'done'], ['pre-check', 'check-in']]
+    assert sorted(ProcessGraph.from_stats(stats).graph.edges) == [('check-in', 'done'), ('pre-check', 'check-in')]
+
+    # Files saved without the event columns still split the segment name
+    pd.read_csv(stats_file).drop(columns=['Source_Event', 'Target_Event']).to_csv(tmp_path / 'old.csv', index=False)
+    assert ('check', 'in-done') in ProcessGraph.from_stats(read_path_stats(tmp_path / 'old.csv')).graph.edges
+
+def test_hops_with_the_same_label_stay_apart():
+    # 'a-b' -> 'c' takes 24 hours and 'a' -> 'b-c' takes 96; both read 'a-b-c'
+    events = pd.DataFrame({
+        'id': [1, 1, 2, 2],
+        'event': ['a-b', 'c', 'a', 'b-c'],
+        'date': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-01', '2024-01-05']),
+    })
+    graph = ProcessGraph.from_events(events).graph
+    assert sorted(graph.edges) == [('a', 'b-c'), ('a-b', 'c')]
+    assert graph.edges['a-b', 'c']['avg_hours'] == 24
+    assert graph.edges['a', 'b-c']['avg_hours'] == 96
+
+    analyzer = PathTimingAnalyzer()
+    analyzer.df = events
+    analyzer.calculate_path_timings()
+    stats = analyzer.analyze_path_segments()
+    assert stats[['path_segment', 'source', 'target', 'avg_hours']].values.tolist() == [
+        ['a-b-c', 'a', 'b-c', 96.0], ['a-b-c', 'a-b', 'c', 24.0]]
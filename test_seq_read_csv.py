@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from analyze_sequences import SequenceAnalyzer
+from seq_read_csv import create_sequence_results, iter_sequence_results, write_sequence_results
+
+def sorted_events(num_ids=50, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 6, num_ids)
+    events = pd.DataFrame({
+        'id': np.repeat(np.arange(1, num_ids + 1), lengths),
+        'event': rng.choice(['A', 'B', 'C'], lengths.sum()),
+        'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 60, lengths.sum()), 'D'),
+    })
+    return events.sort_values(['id', 'date'], kind='stable').reset_index(drop=True)
+
+def test_streamed_results_match_the_whole_file(tmp_path):
+    events = sorted_events()
+    events_file = tmp_path / 'events.csv'
+    events.to_csv(events_file, index=False)
+    expected = create_sequence_results(events)
+
+    # Chunks of a few rows, so ids keep straddling them
+    output_file = tmp_path / 'results_id_seq.csv'
+    batches = list(write_sequence_results(events_file, output_file, chunksize=3))
+    assert len(batches) > 1
+    expected.to_csv(tmp_path / 'expected.csv', index=False)
+    assert output_file.read_text() == (tmp_path / 'expected.csv').read_text()
+    assert pd.concat(batches).index.tolist() == list(range(len(expected)))
+
+def test_streamed_sequences_rank_like_loaded_ones(tmp_path):
+    events = sorted_events(seed=1)
+    events_file = tmp_path / 'events.csv'
+    events.to_csv(events_file, index=False)
+
+    loaded = SequenceAnalyzer()
+    loaded.df = create_sequence_results(events)
+    loaded.analyze_sequences()
+    streamed = SequenceAnalyzer()
+    streamed.analyze_sequence_chunks(iter_sequence_results(events_file, chunksize=7), ids_format='list')
+    pd.testing.assert_frame_equal(streamed.unique_sequences.reset_index(drop=True),
+                                  loaded.unique_sequences.reset_index(drop=True))
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from sequence_clustering import SequenceClusterer, banded_levenshtein, encode_sequences, leader_clusters
+
+def naive_levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+def random_sequences(rng, count, max_length=8):
+    return [' → '.join(rng.choice(list('ABCD'), rng.integers(1, max_length + 1))) for _ in range(count)]
+
+def test_banded_levenshtein_matches_a_naive_one():
+    rng = np.random.default_rng(0)
+    # Random pairs are mostly far apart, so also pair every sequence with a small edit of itself
+    sequences = random_sequences(rng, 300)
+    edited = [s.replace('A', 'B', 1) + (' → C' if i % 3 else '') for i, s in enumerate(sequences)]
+    left, right = sequences + sequences, random_sequences(rng, 300) + edited
+    codes, lengths, _ = encode_sequences(left + right)
+    half = len(left)
+    for max_distance in [0, 1, 2, 3]:
+        distances = banded_levenshtein(codes[:half], lengths[:half], codes[half:], lengths[half:], max_distance)
+        expected = [min(naive_levenshtein(a.split(' → '), b.split(' → ')), max_distance + 1)
+                    for a, b in zip(left, right)]
+        assert distances.tolist() == expected
+
+def test_leader_clusters_do_not_chain():
+    # 2 is linked to 1 only, which follows 0, and 4 is closer to leader 3 than to leader 0
+    left = np.array([1, 2, 4, 4])
+    right = np.array([0, 1, 0, 3])
+    distances = np.array([1, 1, 2, 1])
+    assert leader_clusters(5, left, right, distances).tolist() == [0, 0, 2, 3, 3]
+
+def test_fit_groups_known_variants():
+    base, other = 'A → B → C → D → E', 'F → G → F → G → F'
+    sequences = pd.Series([base] * 50 + ['A → B → X → D → E'] * 5 + ['A → B → C → D → E → E'] * 3
+                          + [other] * 40 + ['F → G → F → F → F'] * 4 + ['A → B → C'] * 2)
+    members = SequenceClusterer().fit(sequences).set_index('sequence')
+    assert members.loc[base, 'cluster'] == 0
+    assert (members.loc[['A → B → X → D → E', 'A → B → C → D → E → E'], 'cluster'] == 0).all()
+    assert members.loc[other, 'cluster'] == members.loc['F → G → F → F → F', 'cluster'] == 1
+    # Two edits from the base pattern is too far with the default of one
+    assert members.loc['A → B → C', 'cluster'] == 2
+
+    durations = np.r_[np.full(50, 100.0), np.full(5, 400.0), np.full(len(sequences) - 55, 100.0)]
+    members = SequenceClusterer().fit(sequences, durations).set_index('sequence')
+    assert members.loc['A → B → X → D → E', 'cluster'] != members.loc[base, 'cluster']
+
+def test_signatures_estimate_jaccard_and_collide_for_variants():
+    rng = np.random.default_rng(1)
+    sequences = np.array(list(dict.fromkeys(random_sequences(rng, 400, max_length=10))))
+    clusterer = SequenceClusterer(num_perm=256, bands=64)
+    codes, lengths, vocabulary = encode_sequences(sequences)
+    signatures = clusterer.signatures(codes, lengths, len(vocabulary))
+
+    def bigrams(sequence):
+        events = ['^'] + sequence.split(' → ') + ['$']
+        return set(zip(events[:-1], events[1:]))
+    errors = []
+    for i, j in rng.integers(len(sequences), size=(300, 2)):
+        a, b = bigrams(sequences[i]), bigrams(sequences[j])
+        errors.append((signatures[i] == signatures[j]).mean() - len(a & b) / len(a | b))
+    assert abs(np.mean(errors)) < 0.02
+    assert np.abs(errors).max() < 0.2
+
+    # One substitution in a long sequence leaves most bigrams, so LSH proposes the pair
+    long = 'A → B → C → D → A → B → C → D → A → B'
+    variant = 'A → B → C → D → A → C → C → D → A → B'
+    codes, lengths, vocabulary = encode_sequences([long, 'D → D → D', variant])
+    left, right = clusterer.candidate_pairs(clusterer.signatures(codes, lengths, len(vocabulary)))
+    assert (left < right).all()
+    assert (0, 2) in set(zip(left.tolist(), right.tolist()))
@@ -0,0 +1,54 @@
+from collections import Counter
+import numpy as np
+import pandas as pd
+from sequence_index import SequenceIndex
+from sequence_table import SEPARATOR
+
+def random_sequences(num_ids=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return [list(rng.choice(list('ABCDE'), rng.integers(1, 9))) for _ in range(num_ids)]
+
+def build_index(sequences):
+    results = pd.DataFrame({
+        'id': np.arange(len(sequences)) * 10,
+        'sequence': [SEPARATOR.join(sequence) for sequence in sequences],
+    })
+    return SequenceIndex.from_results(results)
+
+def occurrences(sequence, path):
+    return sum(sequence[i:i + len(path)] == path for i in range(len(sequence) - len(path) + 1))
+
+def test_prefix_and_subpath_counts_match_a_scan():
+    sequences = random_sequences()
+    index = build_index(sequences)
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        path = list(rng.choice(list('ABCDE'), rng.integers(1, 5)))
+        assert index.prefix_count(path) == sum(sequence[:len(path)] == path for sequence in sequences)
+        assert index.subpath_count(SEPARATOR.join(path)) == sum(occurrences(sequence, path) for sequence in sequences)
+        expected_ids = [i * 10 for i, sequence in enumerate(sequences) if occurrences(sequence, path)]
+        assert index.subpath_ids(path).tolist() == expected_ids
+
+def test_unknown_and_empty_paths():
+    sequences = random_sequences(50)
+    index = build_index(sequences)
+    assert index.prefix_count('A → Z') == 0
+    assert index.subpath_count('Z') == 0
+    assert index.prefix_count([]) == len(sequences)
+
+def test_top_ngrams_match_a_scan():
+    sequences = random_sequences()
+    index = build_index(sequences)
+    for n in range(1, 5):
+        counts = Counter(tuple(sequence[i:i + n]) for sequence in sequences for i in range(len(sequence) - n + 1))
+        # Most frequent first, ties in alphabetical order
+        expected = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        top = index.top_ngrams(n, k=len(expected))
+        assert list(zip(top['ngram'], top['count'])) == [(SEPARATOR.join(ngram), count) for ngram, count in expected]
+    assert len(index.top_ngrams(9)) == 0
+
+def test_repeated_top_ngrams_reuse_the_ranking():
+    index = build_index(random_sequences(200, seed=2))
+    full = index.top_ngrams(3, k=1000)
+    for k in [1, 5, 1000]:
+        pd.testing.assert_frame_equal(index.top_ngrams(3, k), full.head(k))
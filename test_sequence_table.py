@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from analyze_sequences import merge_sequence_summaries, rank_sequences, summarize_sequences, summarize_table
+from parallel import split_table_by_id
+from sequence_table import SEPARATOR, SequenceTable
+
+def random_events(num_ids=400, seed=0, ids=None):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 7, num_ids)
+    ids = np.arange(num_ids) * 7 if ids is None else np.asarray(ids)
+    events = pd.DataFrame({
+        'id': np.repeat(ids, lengths),
+        'event': rng.choice(['A', 'B', 'C', 'D'], lengths.sum()),
+        'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 90, lengths.sum()), 'D'),
+        'office': np.repeat(rng.choice(['N', 'S'], num_ids), lengths),
+    })
+    return events.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def string_sequences(events):
+    """Per-id sequences built the plain way: sort, group and join the event names."""
+    ordered = events.reset_index().sort_values(['id', 'date', 'index'])
+    return ordered.groupby('id')['event'].agg(SEPARATOR.join)
+
+def test_sequences_match_string_grouping():
+    events = random_events()
+    table = SequenceTable.from_events(events)
+    expected = string_sequences(events)
+    assert table.ids.tolist() == expected.index.tolist()
+    assert table.sequences().tolist() == expected.tolist()
+
+    row_codes, first_rows = table.sequence_codes()
+    expected_codes, uniques = pd.factorize(expected.to_numpy())
+    assert row_codes.tolist() == expected_codes.tolist()
+    assert table.decode(first_rows).tolist() == uniques.tolist()
+
+def test_summarize_table_matches_summarize_sequences():
+    events = random_events()
+    for group_by in ((), ('office',)):
+        table = SequenceTable.from_events(events, group_by)
+        results = table.to_results().set_index('id', drop=False)
+        expected = rank_sequences(summarize_sequences(results, True, group_by), 'list', group_by)
+        got = rank_sequences(summarize_table(table, True, group_by), 'list', group_by)
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+def test_sharded_summary_matches_single_pass():
+    table = SequenceTable.from_events(random_events(), ['office'])
+    single = rank_sequences(summarize_table(table, True, ['office']), 'list', ['office'])
+    shards = [summarize_table(shard, True, ['office']) for shard in split_table_by_id(table, 3)]
+    sharded = rank_sequences(merge_sequence_summaries(shards, ['office']), 'list', ['office'])
+    pd.testing.assert_frame_equal(sharded.reset_index(drop=True), single.reset_index(drop=True))
+
+def test_save_and_load_round_trip_string_ids(tmp_path):
+    events = random_events(50, ids=[f"c{i}" for i in range(50)])
+    table = SequenceTable.from_events(events, ['office'])
+    table.save(tmp_path / 'sequences.npz')
+    loaded = SequenceTable.load(tmp_path / 'sequences.npz')
+    pd.testing.assert_frame_equal(loaded.to_results(), table.to_results(), check_dtype=False)
@@ -0,0 +1,94 @@
+import shutil
+import numpy as np
+import pandas as pd
+from event_store import INDEX_DIR, EventStoreWriter
+from time_index import TimeIndex, WindowedEvents, to_datetime64
+
+WINDOWS = [(to_datetime64(start), to_datetime64(end)) for start, end in [
+    (None, None), ('2024-01-01', '2024-02-01'), ('2024-02-10', '2024-02-11'),
+    ('2024-03-15', None), (None, '2024-01-05'), ('2024-05-01', '2024-06-01')]]
+
+def random_events(num_ids=300, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 8, num_ids)
+    events = pd.DataFrame({
+        'id': np.repeat(np.arange(num_ids) * 3, lengths),
+        'event': rng.choice(['A', 'B', 'C'], lengths.sum()),
+        # Whole days, so ids often hold several events at the same date
+        'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 100, lengths.sum()), 'D'),
+    })
+    return events.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def window_mask(dates, start, end):
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    mask = np.ones(len(dates), dtype=bool)
+    if start is not None:
+        mask &= dates >= start
+    if end is not None:
+        mask &= dates < end
+    return mask
+
+def expected_starting(events, start, end):
+    first_dates = events.groupby('id')['date'].transform('min')
+    return np.flatnonzero(window_mask(first_dates, start, end))
+
+def expected_hop_rows(events, start, end):
+    # Each event in the window, and the next event of its id in date then file order
+    ordered = events.reset_index().sort_values(['id', 'date', 'index'], kind='stable')
+    rows = ordered['index'].to_numpy()
+    in_window = window_mask(ordered['date'], start, end)
+    same_id_next = np.r_[ordered['id'].to_numpy()[1:] == ordered['id'].to_numpy()[:-1], False]
+    following = np.flatnonzero(in_window & same_id_next) + 1
+    return np.unique(np.concatenate([rows[in_window], rows[following]]))
+
+def write_store(events, path):
+    writer = EventStoreWriter(path)
+    writer.append(events)
+    return writer.close()
+
+def test_starting_and_hop_rows_match_a_masked_frame():
+    events = random_events()
+    index = TimeIndex.from_events(events)
+    for start, end in WINDOWS:
+        assert index.starting(start, end).tolist() == expected_starting(events, start, end).tolist()
+        assert index.hop_rows(start, end).tolist() == expected_hop_rows(events, start, end).tolist()
+
+def test_store_windows_match_frame_windows(tmp_path):
+    events = random_events(seed=1)
+    write_store(events, tmp_path / 'store')
+    from_frame = WindowedEvents(events)
+    # The second store reads the cached index the first one built
+    for from_store in [WindowedEvents(tmp_path / 'store'), WindowedEvents(tmp_path / 'store')]:
+        for start, end in WINDOWS:
+            expected = from_frame.hops(start, end)
+            got = from_store.hops(start, end)
+            assert got.index.tolist() == expected.index.tolist()
+            assert got['event'].astype(str).tolist() == expected['event'].tolist()
+            assert from_store.starting(start, end).index.tolist() == from_frame.starting(start, end).index.tolist()
+
+def test_rewritten_store_is_indexed_again(tmp_path):
+    store = tmp_path / 'store'
+    january_window = to_datetime64('2024-01-01'), to_datetime64('2024-02-01')
+    march_window = to_datetime64('2024-03-01'), to_datetime64('2024-04-01')
+    january = pd.DataFrame({
+        'id': [1, 1, 2, 2],
+        'event': ['A', 'B', 'A', 'C'],
+        'date': pd.to_datetime(['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']),
+    })
+    write_store(january, store)
+    assert WindowedEvents(store).starting(*january_window).index.tolist() == [0, 1, 2, 3]
+    stale_index = tmp_path / 'stale_index'
+    shutil.copytree(store / INDEX_DIR, stale_index)
+
+    # Same ids and row count, new dates
+    march = january.assign(date=january['date'] + pd.Timedelta(days=60))
+    write_store(march, store)
+    assert not (store / INDEX_DIR).exists()
+    assert WindowedEvents(store).starting(*march_window).index.tolist() == [0, 1, 2, 3]
+
+    # An index left over from the old columns is not trusted either
+    shutil.rmtree(store / INDEX_DIR)
+    shutil.copytree(stale_index, store / INDEX_DIR)
+    windowed = WindowedEvents(store)
+    assert windowed.starting(*march_window).index.tolist() == [0, 1, 2, 3]
+    assert len(windowed.starting(*january_window)) == 0
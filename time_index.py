@@ -0,0 +1,231 @@
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from event_store import INDEX_DIR, EventStore, is_event_store
+from event_stream import REQUIRED_COLUMNS, check_columns, read_events
+from profiling import stage
+from seq_read_csv import id_date_order
+from sequence_table import gather_ranges
+
+INDEX_ARRAYS = ('rows', 'offsets', 'start_dates', 'event_positions', 'event_dates')
+INDEX_SOURCE_FILE = 'source.json'
+INDEXED_COLUMNS = ('id', 'date')
+WINDOW_COLUMNS = ['window_start', 'window_end']
+
+def to_datetime64(value):
+    """Parse a date or datetime as datetime64[ns]; None stays None, for an open bound."""
+    return None if value is None else pd.Timestamp(value).to_datetime64().astype('datetime64[ns]')
+
+def in_window(dates, start=None, end=None):
+    """Return a mask of the dates in [start, end); either bound may be None."""
+    dates = np.asarray(dates)
+    mask = np.ones(len(dates), dtype=bool)
+    if start is not None:
+        mask &= dates >= start
+    if end is not None:
+        mask &= dates < end
+    return mask
+
+def rolling_windows(start, end, size, step=None):
+    """
+    Return (window_start, window_end) pairs of windows of length size, one every step, from start until end.
+
+    step defaults to size, for back-to-back windows. Every window has
+    the full length, so the last one may reach past end, and the window
+    at start is always included.
+    """
+    start, end = to_datetime64(start), to_datetime64(end)
+    size = pd.Timedelta(size).to_timedelta64().astype('timedelta64[ns]')
+    step = size if step is None else pd.Timedelta(step).to_timedelta64().astype('timedelta64[ns]')
+    if size <= np.timedelta64(0) or step <= np.timedelta64(0):
+        raise ValueError("Window size and step must be positive")
+    starts = np.arange(start, max(end, start + np.timedelta64(1, 'ns')), step)
+    return [(window_start, window_start + size) for window_start in starts]
+
+def store_fingerprint(path):
+    """Return the size and modification time of each store column file an index is built from."""
+    fingerprint = {}
+    for column in INDEXED_COLUMNS:
+        column_file = Path(path) / f"{column}.bin"
+        # An empty store has no column files
+        info = column_file.stat() if column_file.is_file() else None
+        fingerprint[column] = None if info is None else [info.st_size, info.st_mtime_ns]
+    return fingerprint
+
+def window_keys(frame):
+    """Return the window columns present in a windowed result frame."""
+    return [col for col in WINDOW_COLUMNS if col in frame.columns]
+
+class TimeIndex:
+    """
+    Event rows ordered by date, for reading date windows of a source.
+
+    rows lists the row positions of the source with the events of each
+    id together in date order, and the ids ordered by their first event:
+    the events of the i-th id are rows[offsets[i]:offsets[i + 1]], and
+    start_dates[i] is its first date. event_positions orders the
+    positions in rows by date, with event_dates the sorted dates. Ids
+    that started in a window, and events that fall in it, are each a
+    contiguous run found by two binary searches, so a query reads only
+    the index entries and source rows it returns.
+    """
+
+    def __init__(self, rows, offsets, start_dates, event_positions, event_dates, num_rows):
+        # Arrays are kept as given, so memory-mapped ones stay mapped
+        self.rows = rows
+        self.offsets = offsets
+        self.start_dates = start_dates
+        self.event_positions = event_positions
+        self.event_dates = event_dates
+        self.num_rows = int(num_rows)
+
+    def __len__(self):
+        return len(self.start_dates)
+
+    @classmethod
+    def from_arrays(cls, ids, dates):
+        """Index parallel arrays of ids and dates, one entry per source row."""
+        ids = np.asarray(ids)
+        dates = np.asarray(dates).astype('datetime64[ns]')
+        with stage('sort', rows=len(ids)):
+            order = id_date_order(ids, dates)
+        sorted_ids = ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(ids) else np.arange(0)
+        offsets = np.append(starts, len(ids))
+        start_dates = dates[order][starts]
+
+        # Reorder the ids by start date, carrying their runs of rows along
+        by_start = np.argsort(start_dates, kind='stable')
+        positions, offsets = gather_ranges(offsets, by_start)
+        # Positions take four bytes each below 2**31 rows
+        position_dtype = np.int32 if len(ids) < 2**31 else np.int64
+        rows = order[positions].astype(position_dtype)
+        row_dates = dates[rows]
+        event_positions = np.argsort(row_dates, kind='stable').astype(position_dtype)
+        return cls(rows, offsets, start_dates[by_start], event_positions, row_dates[event_positions], len(ids))
+
+    @classmethod
+    def from_events(cls, df):
+        """Index the rows of an id,event,date frame by position."""
+        return cls.from_arrays(df['id'].to_numpy(), df['date'].to_numpy())
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map an index saved with save, so queries read only the pages they touch."""
+        path = Path(path)
+        arrays = [np.load(path / f"{name}.npy", mmap_mode='r') for name in INDEX_ARRAYS]
+        return cls(*arrays, np.load(path / 'num_rows.npy'))
+
+    def save(self, path):
+        """Save the index arrays as .npy files in a directory."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        np.save(path / 'num_rows.npy', self.num_rows)
+
+    @classmethod
+    def for_store(cls, path):
+        """
+        Return the index of an event store, built on first use.
+
+        The index is cached in the store's time_index directory, so later
+        runs map it instead of scanning the store. The cache records the
+        size and modification time of the id and date files it was built
+        from, and is rebuilt as soon as either changes.
+        """
+        store = EventStore(path)
+        index_path = Path(path) / INDEX_DIR
+        source_file = index_path / INDEX_SOURCE_FILE
+        fingerprint = store_fingerprint(path)
+        try:
+            with open(source_file) as f:
+                if json.load(f) == fingerprint:
+                    return cls.load(index_path)
+        except (OSError, ValueError):
+            pass
+        with stage('time_index.build', rows=len(store)):
+            index = cls.from_arrays(store.array('id'), store.column('date'))
+        try:
+            # Written last, so a partly saved index is never trusted
+            source_file.unlink(missing_ok=True)
+            index.save(index_path)
+            with open(source_file, 'w') as f:
+                json.dump(fingerprint, f)
+        except OSError:
+            # A read-only store is indexed again on the next run
+            pass
+        return index
+
+    def date_range(self):
+        """Return the first and last event date, or (None, None) for an empty index."""
+        if not len(self.event_dates):
+            return None, None
+        return self.event_dates[0], self.event_dates[-1]
+
+    @staticmethod
+    def _bounds(dates, start, end):
+        """Return the run [lo, hi) of sorted dates in [start, end)."""
+        lo = 0 if start is None else np.searchsorted(dates, start, 'left')
+        hi = len(dates) if end is None else np.searchsorted(dates, end, 'left')
+        return lo, max(lo, hi)
+
+    def starting(self, start=None, end=None):
+        """Return the source rows, in ascending order, of the ids whose first event falls in [start, end)."""
+        lo, hi = self._bounds(self.start_dates, start, end)
+        return np.sort(self.rows[self.offsets[lo]:self.offsets[hi]])
+
+    def hop_rows(self, start=None, end=None):
+        """
+        Return the source rows, in ascending order, of the events in [start, end) and the event after each.
+
+        These are exactly the events of the hops that start in the window,
+        however long their ids run before or after it.
+        """
+        lo, hi = self._bounds(self.event_dates, start, end)
+        positions = np.asarray(self.event_positions[lo:hi])
+        # The next position holds the next event unless it starts another id
+        following = positions + 1
+        following = following[following < self.offsets[np.searchsorted(self.offsets, positions, 'right')]]
+        return np.unique(self.rows[np.concatenate([positions, following])])
+
+class WindowedEvents:
+    """
+    An events file, event store or frame with a TimeIndex, read one date window at a time.
+
+    Event stores read only the rows of each window from their mapped
+    columns, through the index cached in the store. Files are read and
+    indexed once, and every window is a slice of the loaded frame. The
+    returned frames keep file order and row labels, as read_events
+    filtered to the window would.
+    """
+
+    def __init__(self, source, required_columns=REQUIRED_COLUMNS):
+        self.store = None
+        self.df = None
+        if isinstance(source, pd.DataFrame):
+            self.df = source
+            self.index = TimeIndex.from_events(source)
+        elif is_event_store(source):
+            self.store = EventStore(source)
+            check_columns(self.store.to_frame(stop=0), required_columns)
+            self.index = TimeIndex.for_store(source)
+        else:
+            self.df = read_events(source, required_columns)
+            self.index = TimeIndex.from_events(self.df)
+
+    def _frame(self, rows):
+        """Return the events at the given row positions."""
+        with stage('events.window', rows=len(rows)):
+            if self.store is not None:
+                return self.store.take(rows)
+            return self.df.iloc[rows]
+
+    def starting(self, start=None, end=None):
+        """Return the events of the ids whose first event falls in [start, end)."""
+        return self._frame(self.index.starting(start, end))
+
+    def hops(self, start=None, end=None):
+        """Return the events of the hops that start in [start, end), each with the event that ends it."""
+        return self._frame(self.index.hop_rows(start, end))
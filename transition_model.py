@@ -0,0 +1,201 @@
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from tabulate import tabulate
+from event_stream import read_events
+from seq_read_csv import id_date_order
+
+END = 'END'
+
+class TransitionModel:
+    """
+    First-order Markov model of the hops between events.
+
+    Events are mapped to dense integer codes, plus one absorbing END state
+    that every id moves to after its last event. counts[i, j] is the
+    number of i → j hops, and mean_hours / m2_hours hold the running mean
+    and sum of squared deviations of their durations, so all matrices are
+    S x S with S = number of events + 1. Everything is built with bincount
+    over i * S + j in one pass, whatever the number of events.
+    """
+
+    def __init__(self, states, counts, mean_hours, m2_hours):
+        self.states = np.asarray(states)
+        self.codes = {state: code for code, state in enumerate(self.states.tolist())}
+        self.counts = counts
+        self.mean_hours = mean_hours
+        self.m2_hours = m2_hours
+
+    @classmethod
+    def from_events(cls, df):
+        """Build the model from an id,event,date frame."""
+        ids = df['id'].to_numpy()
+        dates = df['date'].to_numpy()
+        order = id_date_order(ids, dates)
+        ids = ids[order]
+        dates = dates[order].astype('datetime64[ns]').view('int64')
+        codes, vocabulary = pd.factorize(df['event'].to_numpy()[order], sort=True)
+
+        size = len(vocabulary) + 1
+        # Each event hops to the next event of its id, or to END after the last one
+        is_last = np.r_[ids[1:] != ids[:-1], True] if len(ids) else np.zeros(0, dtype=bool)
+        next_codes = np.r_[codes[1:], 0]
+        dst = np.where(is_last, size - 1, next_codes)
+        hours = np.where(is_last, 0, np.r_[np.diff(dates), 0]) / 3.6e12
+
+        cells = codes.astype(np.int64) * size + dst
+        counts = np.bincount(cells, minlength=size * size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.bincount(cells, weights=hours, minlength=size * size) / counts
+        m2 = np.bincount(cells, weights=(hours - means[cells]) ** 2, minlength=size * size)
+
+        states = np.append(np.asarray(vocabulary, dtype=str), END)
+        return cls(states, counts.reshape(size, size), means.reshape(size, size), m2.reshape(size, size))
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save."""
+        with np.load(path) as data:
+            return cls(data['states'], data['counts'], data['mean_hours'], data['m2_hours'])
+
+    def save(self, path):
+        """Save the model matrices to an .npz file."""
+        np.savez(path, states=self.states, counts=self.counts,
+                 mean_hours=self.mean_hours, m2_hours=self.m2_hours)
+
+    @property
+    def events(self):
+        """The event states, without END."""
+        return self.states[:-1]
+
+    @property
+    def probabilities(self):
+        """Row-normalised transition matrix; END stays in END."""
+        totals = self.counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            probabilities = np.where(totals > 0, self.counts / totals, 0.0)
+        probabilities[-1] = 0.0
+        probabilities[-1, -1] = 1.0
+        return probabilities
+
+    @property
+    def std_hours(self):
+        """Sample standard deviation of the hop durations, NaN below two hops."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 1, np.sqrt(self.m2_hours / (self.counts - 1)), np.nan)
+
+    def _code(self, event):
+        """Return the code of an event, raising ValueError if it was never seen."""
+        if event not in self.codes or event == END:
+            raise ValueError(f"Unknown event: {event}")
+        return self.codes[event]
+
+    def next_event_probabilities(self, event):
+        """Probability of each next state (END included) after event."""
+        return pd.Series(self.probabilities[self._code(event)], index=self.states, name=event)
+
+    def segment_stats(self):
+        """
+        Return one row per observed hop in the layout of
+        PathTimingAnalyzer.analyze_path_segments (without min, max and
+        unique ids), plus the transition probability.
+        """
+        src, dst = np.nonzero(self.counts[:-1, :-1])
+        stats = pd.DataFrame({
+            'path_segment': np.char.add(np.char.add(self.states[src], '-'), self.states[dst]),
+            'source': self.states[src],
+            'target': self.states[dst],
+            'frequency': self.counts[src, dst],
+            'avg_hours': self.mean_hours[src, dst],
+            'std_hours': self.std_hours[src, dst],
+            'probability': self.probabilities[src, dst],
+        }).round(2)
+        return stats.sort_values('path_segment', ascending=True).reset_index(drop=True)
+
+    def _absorb(self, targets):
+        """Solve for the chance of ending in each of targets or END from every state."""
+        absorbing = [self._code(target) for target in targets] + [len(self.states) - 1]
+        transient = np.setdiff1d(np.arange(len(self.states)), absorbing)
+        probabilities = self.probabilities
+        q = probabilities[np.ix_(transient, transient)]
+        r = probabilities[np.ix_(transient, absorbing)]
+
+        absorbed = np.zeros((len(self.states), len(absorbing)))
+        absorbed[absorbing, np.arange(len(absorbing))] = 1.0
+        absorbed[transient] = np.linalg.solve(np.eye(len(transient)) - q, r)
+        return absorbed, transient
+
+    def absorption_probabilities(self, targets):
+        """
+        Probability, from each event, of reaching each of targets before
+        the id ends (the END column), treating targets as absorbing.
+        """
+        absorbed, _ = self._absorb(targets)
+        return pd.DataFrame(absorbed[:-1], index=self.events, columns=list(targets) + [END])
+
+    def expected_time(self, target):
+        """
+        Expected hours from each event until target is first reached.
+
+        Times are conditional on reaching target at all; probability is
+        the chance of reaching it before the id ends. Solves one linear
+        system over the non-target events.
+        """
+        absorbed, transient = self._absorb([target])
+        reach = absorbed[:, 0]
+        probabilities = self.probabilities
+        mean_hours = np.nan_to_num(self.mean_hours)
+
+        # E[time * reached] satisfies w = P (t * reach) + Q w on transient states
+        weighted = (probabilities * mean_hours * reach[None, :]).sum(axis=1)
+        q = probabilities[np.ix_(transient, transient)]
+        w = np.zeros(len(self.states))
+        w[transient] = np.linalg.solve(np.eye(len(transient)) - q, weighted[transient])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            hours = np.where(reach > 0, w / reach, np.nan)
+
+        return pd.DataFrame({'probability': reach[:-1], 'expected_hours': hours[:-1]}, index=self.events)
+
+    def expected_time_to_end(self):
+        """Expected hours from each event until its id has no further events."""
+        probabilities = self.probabilities[:-1, :-1]
+        weighted = (self.probabilities * np.nan_to_num(self.mean_hours)).sum(axis=1)[:-1]
+        hours = np.linalg.solve(np.eye(len(probabilities)) - probabilities, weighted)
+        return pd.Series(hours, index=self.events, name='expected_hours')
+
+def display_model(model, targets=()):
+    """Print the transition probabilities and the expected time to each target."""
+    print("\nTransition Probabilities (row: from, column: to)")
+    print("=" * 50)
+    matrix = pd.DataFrame(model.probabilities[:-1], index=model.events, columns=model.states).round(3)
+    print(tabulate(matrix, headers='keys', tablefmt='grid'))
+
+    for target in targets:
+        print(f"\nExpected time to reach {target}:")
+        times = model.expected_time(target).round(2).reset_index()
+        print(tabulate(times, headers=['From', 'Probability', 'Expected_Hours'], tablefmt='grid', showindex=False))
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a Markov transition model over the event hops.')
+    parser.add_argument('--input', default='patterned_events.csv', help='Events file or event store')
+    parser.add_argument('--target', action='append', default=[], help='Event to report expected times to')
+    parser.add_argument('--output', help='Save the model matrices to this .npz file')
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"Error: {args.input} not found.")
+        sys.exit(1)
+    model = TransitionModel.from_events(read_events(args.input))
+    try:
+        display_model(model, args.target)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.output:
+        model.save(args.output)
+        print(f"\nModel saved to '{args.output}'")
+
+if __name__ == "__main__":
+    main()